@@ -2,10 +2,15 @@ from flask import Blueprint
 from .routes import login
 from .routes import register
 from .routes import me
+from .routes import logout
+from .commands import purge_tokens
 
-auth = Blueprint('auth', __name__)
+auth = Blueprint('auth', __name__, cli_group='auth')
 
 auth.add_url_rule('/auth/login', 'auth_login', login, methods=['POST'])
 auth.add_url_rule('/auth/register', 'auth_register', register, methods=['POST'])
 auth.add_url_rule('/auth/me', 'auth_me', me, methods=['GET'])
+auth.add_url_rule('/auth/logout', 'auth_logout', logout, methods=['POST'])
+
+auth.cli.command('purge-tokens')(purge_tokens)
 
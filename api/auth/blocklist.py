@@ -0,0 +1,92 @@
+import time
+from datetime import datetime, timedelta
+from threading import Lock, Thread
+from flask import current_app
+from sqlalchemy import select, delete
+from api.app import db
+from api.models import RevokedTokens
+
+# Rows committed by other workers may become visible out of created_at order,
+# so every sync re-reads this much history before the newest row seen.
+SYNC_OVERLAP = timedelta(minutes=1)
+
+
+def token_lifetime():
+    return max(current_app.config['JWT_ACCESS_TOKEN_EXPIRES'], current_app.config['JWT_REFRESH_TOKEN_EXPIRES'])
+
+
+def purge_revoked_tokens():
+    """Delete revoked tokens that have expired anyway; returns the number of rows removed."""
+    result = db.session.execute(
+        delete(RevokedTokens)
+        .where(RevokedTokens.created_at < datetime.utcnow() - token_lifetime())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+class TokenBlocklist:
+    """In-memory set of revoked token jtis.
+
+    Loaded on first use and then synced incrementally from RevokedTokens every
+    REVOKED_TOKENS_SYNC_INTERVAL seconds. A background thread purges rows (and
+    entries) older than the token lifetime.
+    """
+
+    def __init__(self):
+        self._revoked = {}
+        self._watermark = None
+        self._synced_at = None
+        self._purger = None
+        self._lock = Lock()
+
+    def __contains__(self, jti):
+        self._sync()
+        return jti in self._revoked
+
+    def add(self, jti, created_at):
+        with self._lock:
+            self._revoked[jti] = created_at
+
+    def _sync(self):
+        now = time.monotonic()
+        if self._synced_at is not None and \
+                now - self._synced_at < current_app.config['REVOKED_TOKENS_SYNC_INTERVAL']:
+            return
+
+        query = select(RevokedTokens.jti, RevokedTokens.created_at)
+        if self._watermark is not None:
+            query = query.where(RevokedTokens.created_at >= self._watermark - SYNC_OVERLAP)
+        rows = db.session.execute(query).all()
+
+        expired_before = datetime.utcnow() - token_lifetime()
+        with self._lock:
+            for jti, created_at in rows:
+                self._revoked[jti] = created_at
+                if self._watermark is None or created_at > self._watermark:
+                    self._watermark = created_at
+            for jti in [jti for jti, created_at in self._revoked.items() if created_at < expired_before]:
+                del self._revoked[jti]
+            self._synced_at = now
+
+        if self._purger is None:
+            self._start_purger(current_app._get_current_object())
+
+    def _start_purger(self, app):
+        def purge():
+            while True:
+                time.sleep(app.config['REVOKED_TOKENS_PURGE_INTERVAL'])
+                with app.app_context():
+                    try:
+                        purged = purge_revoked_tokens()
+                    except Exception:
+                        app.logger.exception('Purging revoked tokens failed')
+                    else:
+                        app.logger.info(f'Purged {purged} expired revoked tokens')
+
+        self._purger = Thread(target=purge, name='revoked-tokens-purge', daemon=True)
+        self._purger.start()
+
+
+blocklist = TokenBlocklist()
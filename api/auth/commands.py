@@ -0,0 +1,7 @@
+import click
+from api.auth.blocklist import purge_revoked_tokens
+
+
+def purge_tokens():
+    """Delete revoked tokens older than the token lifetime."""
+    click.echo(f'Purged {purge_revoked_tokens()} expired revoked tokens')
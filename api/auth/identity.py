@@ -0,0 +1,25 @@
+from api.cache import LocalCache
+from api.utils import get_role_rights
+
+# user id -> UserIdentity
+identity_cache = LocalCache('identity', maxsize=10000, ttl=60)
+
+
+class UserIdentity:
+    """Lightweight snapshot of an authenticated user, used as `current_user`."""
+    __slots__ = ('id', 'email', 'role_fk', 'token_version')
+
+    def __init__(self, user):
+        self.id = user.id
+        self.email = user.email
+        self.role_fk = user.role_fk
+        self.token_version = user.token_version
+
+    @property
+    def rights(self):
+        return get_role_rights(self.role_fk)
+
+
+def invalidate_identity(user_id):
+    """Drop cached identities once a change to the role or credentials of `user_id` commits."""
+    identity_cache.invalidate()
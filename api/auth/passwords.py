@@ -0,0 +1,89 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import BoundedSemaphore, Lock
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+_lock = Lock()
+_pool = None
+_slots = None
+
+
+class HashingBusy(Exception):
+    """Raised when PASSWORD_HASH_QUEUE_SIZE hash jobs are already queued or running."""
+
+
+def hash_method():
+    """The configured werkzeug hash method with the pbkdf2 iteration count made explicit."""
+    method = current_app.config['PASSWORD_HASH_METHOD']
+    if method.startswith('pbkdf2:') and method.count(':') == 1:
+        method = f'{method}:{DEFAULT_PBKDF2_ITERATIONS}'
+    return method
+
+
+def _get_pool():
+    global _pool, _slots
+    if _pool is None:
+        with _lock:
+            if _slots is None:
+                _slots = BoundedSemaphore(current_app.config['PASSWORD_HASH_QUEUE_SIZE'])
+            if _pool is None:
+                # Spawned workers don't inherit the server's threads and locks
+                _pool = ProcessPoolExecutor(max_workers=current_app.config['PASSWORD_HASH_PROCESSES'],
+                                            mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def _discard_pool(broken):
+    """Drop a pool whose worker died, so the next job starts a fresh one."""
+    global _pool
+    with _lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False)
+
+
+def _run(fn, *args):
+    """Run `fn` on the hashing pool and wait for it.
+
+    Raises HashingBusy at once when the queue is full; a job that outlives
+    PASSWORD_HASH_TIMEOUT keeps its slot until it actually finishes. When a
+    worker dies the pool is replaced and the job retried once; a second
+    failure raises HashingBusy as well.
+    """
+    for _ in range(2):
+        pool = _get_pool()
+        if not _slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = pool.submit(fn, *args)
+        except BaseException as e:
+            _slots.release()
+            if not isinstance(e, BrokenProcessPool):
+                raise
+            _discard_pool(pool)
+            continue
+        future.add_done_callback(lambda _: _slots.release())
+        try:
+            return future.result(timeout=current_app.config['PASSWORD_HASH_TIMEOUT'])
+        except BrokenProcessPool:
+            current_app.logger.warning('Password hashing pool broke, restarting it')
+            _discard_pool(pool)
+    raise HashingBusy()
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, hash_method(), current_app.config['PASSWORD_SALT_LENGTH'])
+
+
+def verify_password(pwhash, password):
+    return _run(check_password_hash, pwhash, password)
+
+
+def needs_rehash(pwhash):
+    """True when `pwhash` was made with other parameters than the configured ones."""
+    if pwhash.count('$') < 2:
+        return True
+    method, salt, _ = pwhash.split('$', 2)
+    return method != hash_method() or len(salt) != current_app.config['PASSWORD_SALT_LENGTH']
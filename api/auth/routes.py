@@ -2,28 +2,51 @@ from werkzeug.exceptions import BadRequest
 from flask import  jsonify, request
 from werkzeug.exceptions import Unauthorized
 from sqlalchemy.sql.expression import and_
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt, current_user, set_access_cookies
 from api.utils import get_first_or_false, get_first
 from api.models import User, RevokedTokens, UserRole
 from api.app import db
 from datetime import datetime, timezone
 from api.app import jwt
+from api.auth.identity import identity_cache, UserIdentity
+from api.auth.blocklist import blocklist
+from api.auth.passwords import hash_password, verify_password, needs_rehash, HashingBusy
+from concurrent.futures import TimeoutError
 
 jwt.unauthorized_loader(lambda auth: (jsonify({'error': 'Not authorized'}), 401))
-jwt.revoked_token_loader(lambda auth: (jsonify({'error': 'Token has been revoked'}), 403))
+jwt.revoked_token_loader(lambda jwt_header, jwt_data: (jsonify({'error': 'Token has been revoked'}), 403))
 jwt.invalid_token_loader(lambda auth: (jsonify({'error': 'Invalid token'}), 403))
 
 @jwt.user_identity_loader
 def user_identitty_loader(user):
     return user.id
 
+@jwt.token_in_blocklist_loader
+def token_in_blocklist_loader(_jwt_header, jwt_data):
+    return jwt_data['jti'] in blocklist
+
+@jwt.additional_claims_loader
+def additional_claims_loader(user):
+    return {'ver': user.token_version}
+
 @jwt.user_lookup_loader
 def user_lookup_loader(_jwt_header, jwt_data):
     identity = jwt_data['sub']
-    return db.session.scalar(User.select().where(User.id == identity))
+    version = jwt_data.get('ver', 0)
+    user = identity_cache.get(identity)
+    if user is None or user.token_version != version:
+        if not (db_user := db.session.scalar(User.select().where(User.id == identity))):
+            return None
+        user = UserIdentity(db_user)
+        identity_cache.set(identity, user)
+    # Tokens issued before a password change carry an outdated version
+    return user if user.token_version == version else None
+
+
 
 
+def hashing_busy():
+    return jsonify(code=503, error='Too many requests, try again later'), 503, {'Retry-After': '1'}
 
 
 def login():
@@ -35,14 +58,26 @@ def login():
         return BadRequest()
 
     user: User = get_first_or_false(User.select().where(User.email == email))
-    if not user or not user.check_password(password):
+    try:
+        if not user or not verify_password(user.password, password):
             return jsonify(error='Wrong login or password'), 401
+    except (HashingBusy, TimeoutError):
+        return hashing_busy()
+
+    if needs_rehash(user.password):
+        try:
+            user.password = hash_password(password)
+            db.session.commit()
+        except (HashingBusy, TimeoutError):
+            # the old hash keeps working; the next login tries again
+            db.session.rollback()
 
     if not user.email_confirmed:
         return jsonify(internal_code=1002, error='Email is not confirmed')
 
     return jsonify(access_token=create_access_token(identity=user), refresh_token=create_refresh_token(identity=user))
 
+@jwt_required(verify_type=False)
 def logout():
     token = get_jwt()
     jti = token['jti']
@@ -51,6 +86,7 @@ def logout():
     revoked_token = RevokedTokens(jti=jti, type=ttype)
     db.session.add(revoked_token)
     db.session.commit()
+    blocklist.add(jti, revoked_token.created_at)
     return jsonify(msg=f"{ttype.capitalize()} token successfully revoked")
 
 def register():
@@ -65,8 +101,13 @@ def register():
     if get_first_or_false(User.select().where(User.email == email)):
         return jsonify(internal_code=1003, error='Email is used'), 400
 
+    try:
+        pwhash = hash_password(password)
+    except (HashingBusy, TimeoutError):
+        return hashing_busy()
+
     default_role = get_first(UserRole.select().where(UserRole.is_default == True))
-    user = User(email=email, password=generate_password_hash(password), birthday=birthday, role=default_role)
+    user = User(email=email, password=pwhash, birthday=birthday, role=default_role)
     db.session.add(user)
     db.session.commit()
     db.session.refresh(user)
@@ -74,7 +115,8 @@ def register():
 
 @jwt_required()
 def me():
-    return jsonify(id=current_user.id, role=current_user.role.roleName, permissions=current_user.role.get_rights())
+    rights = current_user.rights
+    return jsonify(id=current_user.id, role=rights.role_name, permissions=sorted(rights.keys))
 
 
 
@@ -0,0 +1,10 @@
+from flask import Blueprint
+from .routes import get, add, set_amount, remove, merge
+
+basket = Blueprint('basket', __name__, url_prefix='/basket')
+
+basket.add_url_rule('/get', 'basket_get', get, methods=['GET'])
+basket.add_url_rule('/add', 'basket_add', add, methods=['POST'])
+basket.add_url_rule('/set', 'basket_set', set_amount, methods=['POST'])
+basket.add_url_rule('/remove', 'basket_remove', remove, methods=['POST'])
+basket.add_url_rule('/merge', 'basket_merge', merge, methods=['POST'])
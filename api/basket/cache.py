@@ -0,0 +1,265 @@
+import atexit
+import json
+import time
+from threading import Lock, Thread
+from flask import current_app
+from sqlalchemy import select, delete, or_, and_
+from api.app import db
+from api.models import Basket, User
+from api.utils import upsert
+
+# Baskets written back per transaction by the background flusher
+FLUSH_BATCH_SIZE = 100
+
+
+class MemoryBasketBackend:
+    """Pending baskets kept in this process (`memory://`).
+
+    Only for deployments running a single worker: other workers would neither
+    see these edits nor avoid overwriting them.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._flushing = set()
+        self._lock = Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            return (entry['version'], dict(entry['items'])) if entry else None
+
+    def update(self, user_id, load, change):
+        while True:
+            # loaded outside the lock; retried if the entry was flushed meanwhile
+            items = None if user_id in self._entries else load()
+            with self._lock:
+                entry = self._entries.get(user_id)
+                if entry is None:
+                    if items is None:
+                        continue
+                    entry = self._entries[user_id] = {'version': 0, 'since': time.time(), 'items': items}
+                change(entry['items'])
+                entry['version'] += 1
+                return dict(entry['items'])
+
+    def discard(self, user_id, version):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry['version'] == version:
+                del self._entries[user_id]
+
+    def acquire(self, user_id):
+        with self._lock:
+            if user_id in self._flushing:
+                return False
+            self._flushing.add(user_id)
+            return True
+
+    def release(self, user_id):
+        with self._lock:
+            self._flushing.discard(user_id)
+
+    def pending(self, older_than):
+        with self._lock:
+            return [user_id for user_id, entry in self._entries.items() if entry['since'] <= older_than]
+
+
+class RedisBasketBackend:
+    """Pending baskets kept in Redis (or anything speaking its protocol), shared by all workers."""
+
+    PENDING = 'basket:pending'
+    LOCK_TIMEOUT = 30
+
+    def __init__(self, client):
+        self.client = client
+
+    @staticmethod
+    def _key(user_id):
+        return f'basket:{user_id}'
+
+    @staticmethod
+    def _decode(raw):
+        entry = json.loads(raw)
+        entry['items'] = {int(product_id): amount for product_id, amount in entry['items'].items()}
+        return entry
+
+    def get(self, user_id):
+        raw = self.client.get(self._key(user_id))
+        if raw is None:
+            return None
+        entry = self._decode(raw)
+        return entry['version'], entry['items']
+
+    def update(self, user_id, load, change):
+        key = self._key(user_id)
+
+        def apply(pipe):
+            raw = pipe.get(key)
+            entry = self._decode(raw) if raw is not None else {'version': 0, 'since': time.time(), 'items': load()}
+            change(entry['items'])
+            entry['version'] += 1
+            pipe.multi()
+            pipe.set(key, json.dumps(entry))
+            pipe.zadd(self.PENDING, {user_id: entry['since']}, nx=True)
+            return entry['items']
+
+        return self.client.transaction(apply, key, value_from_callable=True)
+
+    def discard(self, user_id, version):
+        key = self._key(user_id)
+
+        def apply(pipe):
+            raw = pipe.get(key)
+            if raw is None or self._decode(raw)['version'] != version:
+                return
+            pipe.multi()
+            pipe.delete(key)
+            pipe.zrem(self.PENDING, user_id)
+
+        self.client.transaction(apply, key)
+
+    def acquire(self, user_id):
+        return bool(self.client.set(f'basket:lock:{user_id}', 1, nx=True, ex=self.LOCK_TIMEOUT))
+
+    def release(self, user_id):
+        self.client.delete(f'basket:lock:{user_id}')
+
+    def pending(self, older_than):
+        return [int(user_id) for user_id in self.client.zrangebyscore(self.PENDING, '-inf', older_than)]
+
+
+class BasketCache:
+    """Basket edits, optionally cached write-behind.
+
+    Without BASKET_CACHE_URL every edit is written to the database in its own
+    transaction, which is safe with any number of workers. With a redis://
+    URL (or `memory://` for a single worker) the first edit loads the user's
+    basket from the database and later edits only touch the backend. The
+    whole basket is then written back in one upsert either when it is read
+    (or checked out) or by a background thread once it has been pending for
+    BASKET_FLUSH_DELAY seconds. Writing full snapshots makes a repeated flush
+    harmless; a per-user lock keeps two flushes from racing. With the memory
+    backend, edits not yet flushed are lost if the worker dies.
+    """
+
+    def __init__(self):
+        self._backend = None
+        self._configured = False
+        self._flusher = None
+        self._lock = Lock()
+
+    @property
+    def backend(self):
+        """The write-behind backend, or None when edits go straight to the database."""
+        if not self._configured:
+            with self._lock:
+                if not self._configured:
+                    url = current_app.config['BASKET_CACHE_URL']
+                    if url == 'memory://':
+                        self._backend = MemoryBasketBackend()
+                    elif url:
+                        import redis
+                        self._backend = RedisBasketBackend(redis.Redis.from_url(url))
+                    self._configured = True
+        return self._backend
+
+    @staticmethod
+    def load(user_id):
+        return dict(db.session.execute(
+            select(Basket.product_fk, Basket.amount).where(Basket.user_fk == user_id)
+        ).all())
+
+    def items(self, user_id):
+        entry = self.backend.get(user_id) if self.backend else None
+        return entry[1] if entry else self.load(user_id)
+
+    def edit(self, user_id, change):
+        """Apply `change` (a callable mutating {product_id: amount}) and return the new basket."""
+        if self.backend is None:
+            # the user's row lock serializes concurrent edits where the database supports it
+            db.session.execute(select(User.id).where(User.id == user_id).with_for_update())
+            items = self.load(user_id)
+            change(items)
+            self._write({user_id: items})
+            db.session.commit()
+            return items
+        items = self.backend.update(user_id, lambda: self.load(user_id), change)
+        if self._flusher is None:
+            self._start_flusher(current_app._get_current_object())
+        return items
+
+    @staticmethod
+    def _write(baskets):
+        """Make the stored baskets of {user_id: {product_id: amount}} match exactly."""
+        db.session.execute(
+            delete(Basket).where(or_(*(
+                and_(Basket.user_fk == user_id, Basket.product_fk.not_in(items))
+                for user_id, items in baskets.items()
+            ))).execution_options(synchronize_session=False)
+        )
+        upsert(Basket, [
+            dict(user_fk=user_id, product_fk=product_id, amount=amount)
+            for user_id, items in baskets.items()
+            for product_id, amount in items.items()
+        ], index_elements=['user_fk', 'product_fk'], update_columns=['amount'])
+
+    def flush(self, *user_ids):
+        """Write pending baskets of `user_ids` to the database and commit."""
+        backend = self.backend
+        if backend is None:
+            return 0
+        claimed = [user_id for user_id in user_ids if backend.acquire(user_id)]
+        try:
+            entries = {}
+            for user_id in claimed:
+                entry = backend.get(user_id)
+                if entry is not None:
+                    entries[user_id] = entry
+            if not entries:
+                return 0
+
+            self._write({user_id: items for user_id, (version, items) in entries.items()})
+            db.session.commit()
+
+            for user_id, (version, items) in entries.items():
+                backend.discard(user_id, version)
+            return len(entries)
+        finally:
+            for user_id in claimed:
+                backend.release(user_id)
+
+    def flush_pending(self, max_age=None):
+        if self.backend is None:
+            return 0
+        if max_age is None:
+            max_age = current_app.config['BASKET_FLUSH_DELAY']
+        user_ids = self.backend.pending(time.time() - max_age)
+        flushed = 0
+        for start in range(0, len(user_ids), FLUSH_BATCH_SIZE):
+            flushed += self.flush(*user_ids[start:start + FLUSH_BATCH_SIZE])
+        return flushed
+
+    def _start_flusher(self, app):
+        def run(max_age=None):
+            with app.app_context():
+                try:
+                    self.flush_pending(max_age)
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception('Flushing baskets failed')
+
+        def loop():
+            while True:
+                time.sleep(app.config['BASKET_FLUSH_INTERVAL'])
+                run()
+
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = Thread(target=loop, name='basket-flush', daemon=True)
+            self._flusher.start()
+        atexit.register(run, 0)
+
+
+basket_cache = BasketCache()
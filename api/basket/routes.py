@@ -0,0 +1,86 @@
+from flask import jsonify
+from apifairy import response, body
+from flask_jwt_extended import jwt_required, current_user
+from sqlalchemy import select, func
+from api import db
+from api.models import Basket, Product, ProductAvailability, ObjectStorage, storage_url
+from api.schemas.basket import BasketSchema, BasketEditSchema, BasketMergeSchema
+from .cache import basket_cache
+
+basketschema = BasketSchema()
+
+
+def read_basket(user_id):
+    """Basket rows with price and current stock, fetched in a single query."""
+    in_stock = select(func.coalesce(func.sum(ProductAvailability.amount), 0)) \
+        .where(ProductAvailability.product_id == Basket.product_fk) \
+        .scalar_subquery()
+    rows = db.session.execute(
+        select(Basket.product_fk, Basket.amount, Product.title, Product.price, ObjectStorage.link,
+               in_stock.label('in_stock'))
+        .join(Product, Product.id == Basket.product_fk)
+        .outerjoin(ObjectStorage, ObjectStorage.id == Product.image_fk)
+        .where(Basket.user_fk == user_id)
+        .order_by(Basket.id)
+    ).all()
+    items = [
+        dict(product_id=product_id, amount=amount, title=title, price=price,
+             image_link=storage_url(link) if link else None, in_stock=stock)
+        for product_id, amount, title, price, link, stock in rows
+    ]
+    return dict(items=items, total=sum(item['price'] * item['amount'] for item in items))
+
+
+def unknown_products(product_ids):
+    known = db.session.scalars(select(Product.id).where(Product.id.in_(product_ids))).all()
+    return set(product_ids) - set(known)
+
+
+def edited(change, product_ids=()):
+    missing = unknown_products(product_ids) if product_ids else None
+    if missing:
+        return jsonify(code=404, error='Product not found', product_ids=sorted(missing)), 404
+    items = basket_cache.edit(current_user.id, change)
+    return jsonify(code=200, items=[dict(product_id=product_id, amount=amount) for product_id, amount in items.items()])
+
+
+@jwt_required()
+@response(basketschema)
+def get():
+    basket_cache.flush(current_user.id)
+    return read_basket(current_user.id)
+
+
+@jwt_required()
+@body(BasketEditSchema())
+def add(args):
+    def change(items):
+        items[args['product_id']] = items.get(args['product_id'], 0) + args['amount']
+    return edited(change, [args['product_id']])
+
+
+@jwt_required()
+@body(BasketEditSchema())
+def set_amount(args):
+    def change(items):
+        if args['amount']:
+            items[args['product_id']] = args['amount']
+        else:
+            items.pop(args['product_id'], None)
+    return edited(change, [args['product_id']] if args['amount'] else ())
+
+
+@jwt_required()
+@body(BasketEditSchema(only=('product_id',)))
+def remove(args):
+    return edited(lambda items: items.pop(args['product_id'], None))
+
+
+@jwt_required()
+@body(BasketMergeSchema())
+def merge(args):
+    """Add the items of a basket collected before login to the user's basket."""
+    def change(items):
+        for item in args['items']:
+            items[item['product_id']] = items.get(item['product_id'], 0) + item['amount']
+    return edited(change, {item['product_id'] for item in args['items']})
@@ -0,0 +1,464 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+from itertools import chain
+from threading import Lock, local
+from flask import current_app, request, make_response, Response
+from sqlalchemy import select, update, event, inspect
+from sqlalchemy.orm import Session
+from prometheus_client import Counter
+from api.app import db, metrics
+from api.models import CacheVersion
+
+
+def get_version(name, session=None):
+    session = session or db.session
+    return session.scalar(select(CacheVersion.version).where(CacheVersion.name == name)) or 0
+
+
+def _write_versions(session, names, version=None):
+    """Add one to the versions of `names`, creating missing ones at 1, or set them all to `version`.
+
+    A single INSERT ... ON CONFLICT DO UPDATE, so concurrent first bumps of a
+    new name both count instead of one failing on the primary key. Dialects
+    without ON CONFLICT update first and insert the names that were missing.
+    """
+    names = sorted(set(names))
+    now = datetime.utcnow()
+    new_version = CacheVersion.version + 1 if version is None else version
+    dialect = session.get_bind(CacheVersion).dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        session.execute(
+            update(CacheVersion)
+            .where(CacheVersion.name.in_(names))
+            .values(version=new_version, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        existing = session.scalars(select(CacheVersion.name).where(CacheVersion.name.in_(names))).all()
+        session.add_all(CacheVersion(name=name, version=version or 1, updated_at=now) for name in names
+                        if name not in existing)
+        session.flush()
+        return
+    statement = dialect_insert(CacheVersion).values([
+        {'name': name, 'version': version or 1, 'updated_at': now} for name in names
+    ])
+    session.execute(statement.on_conflict_do_update(
+        index_elements=[CacheVersion.name],
+        set_={'version': new_version, 'updated_at': statement.excluded.updated_at},
+    ))
+
+
+def bump_version(name, session=None):
+    """Increment the shared version of `name` as part of the current transaction.
+
+    Returns the new version as seen by the current transaction.
+    """
+    session = session or db.session
+    _write_versions(session, [name])
+    return get_version(name, session)
+
+
+def bump_versions(names, session=None):
+    """bump_version for many names at once, in one statement."""
+    session = session or db.session
+    names = set(names)
+    if names:
+        _write_versions(session, names)
+
+
+def set_versions(names, version, session=None):
+    """Set the shared version of every name in `names` to `version`, in the current transaction."""
+    session = session or db.session
+    names = set(names)
+    if names:
+        _write_versions(session, names, version)
+
+
+def get_versions(names):
+    names = sorted(set(names))
+    versions = dict(db.session.execute(
+        select(CacheVersion.name, CacheVersion.version).where(CacheVersion.name.in_(names))
+    ).all()) if names else {}
+    return {name: versions.get(name, 0) for name in names}
+
+
+# Tables whose writes bump a `table:<name>` version on commit; see conditional()
+CHANGE_PREFIX = 'table:'
+tracked_tables = set()
+# table name -> column whose values key the table's counters, see conditional(per=...)
+keyed_tables = {}
+# table name -> columns whose updates bump nothing, see ignore_changes()
+ignored_columns = {}
+
+
+def track_changes(*models):
+    tracked_tables.update(model.__tablename__ for model in models)
+
+
+def key_changes(column):
+    """Count unit-of-work changes of `column`'s table per value of `column`.
+
+    Writes to a busy table then bump `table:<name>:<value>` instead of all
+    queueing on the row of `table:<name>`; bulk statements, whose rows are
+    unknown, still bump the table-wide counter. A keyed table can only be
+    read per key.
+    """
+    table, key = column.class_.__tablename__, column.key
+    if keyed_tables.get(table, key) != key or (table in tracked_tables and table not in keyed_tables):
+        raise ValueError(f'{table} changes are already counted table-wide or on another key')
+    keyed_tables[table] = key
+    tracked_tables.add(table)
+
+
+def ignore_changes(*columns):
+    """Let updates that only touch `columns` bump no counter.
+
+    Meant for fast-moving columns, such as rating aggregates; endpoints that
+    show them must cover them with a conditional() fingerprint.
+    """
+    for column in columns:
+        ignored_columns.setdefault(column.class_.__tablename__, set()).add(column.key)
+
+
+def _changed_counters(session):
+    return session.info.setdefault('changed_counters', set())
+
+
+def _counters_of(obj, state=None):
+    table = obj.__tablename__
+    key = keyed_tables.get(table)
+    if key is None:
+        return {CHANGE_PREFIX + table}
+    values = {getattr(obj, key)}
+    if state is not None:
+        values.update(state.attrs[key].history.deleted)
+    if None in values:
+        return {CHANGE_PREFIX + table}
+    return {f'{CHANGE_PREFIX}{table}:{value}' for value in values}
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_flushed(session, flush_context, instances):
+    changed = _changed_counters(session)
+    for obj in chain(session.new, session.deleted):
+        if obj.__tablename__ in tracked_tables:
+            changed.update(_counters_of(obj))
+    for obj in session.dirty:
+        if obj.__tablename__ not in tracked_tables:
+            continue
+        state = inspect(obj)
+        modified = {attr.key for attr in state.attrs if attr.history.has_changes()}
+        if modified and not modified <= ignored_columns.get(obj.__tablename__, set()):
+            changed.update(_counters_of(obj, state))
+
+
+def _updated_columns(statement):
+    values = getattr(statement, '_values', None) or dict(getattr(statement, '_ordered_values', None) or ())
+    return {getattr(column, 'key', column) for column in values}
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_executed(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is None or table.name not in tracked_tables:
+            return
+        if orm_execute_state.is_update:
+            updated = _updated_columns(orm_execute_state.statement)
+            if updated and updated <= ignored_columns.get(table.name, set()):
+                return
+        _changed_counters(orm_execute_state.session).add(CHANGE_PREFIX + table.name)
+
+
+@event.listens_for(Session, 'before_commit')
+def _bump_changed(session):
+    # flush first: the commit's own flush would come too late to be counted
+    session.flush()
+    if session.info.get('changed_counters'):
+        bump_versions(session.info.pop('changed_counters'), session)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_changed(session, previous_transaction):
+    session.info.pop('changed_counters', None)
+
+
+def conditional(*models, max_age=60, fingerprint=None, per=None):
+    """Serve GETs with validators derived from the change counters of `models`.
+
+    Put it above apifairy's @response. The ETag (and Last-Modified, when no
+    `fingerprint` is given) come from one query on the `table:` versions, so
+    an If-None-Match / If-Modified-Since hit answers 304 before the view
+    runs. `fingerprint(**view_args)` may return extra state the counters do
+    not cover, e.g. fast-moving stock. `per` maps a column to the view
+    argument holding its value, e.g. {Reviews.product_id: 'product_id'}, to
+    read that table's per-key counter; see key_changes().
+    """
+    per = per or {}
+    track_changes(*models)
+    for column in per:
+        key_changes(column)
+    for model in models:
+        if model.__tablename__ in keyed_tables:
+            raise ValueError(f'{model.__tablename__} changes are keyed, read them with per=')
+    tables = sorted({model.__tablename__ for model in models} | {column.class_.__tablename__ for column in per})
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            names = [CHANGE_PREFIX + table for table in tables] + [
+                f'{CHANGE_PREFIX}{column.class_.__tablename__}:{kwargs[arg]}' for column, arg in per.items()]
+            versions = db.session.execute(
+                select(CacheVersion.name, CacheVersion.version, CacheVersion.updated_at)
+                .where(CacheVersion.name.in_(names))
+            ).all()
+            state = [request.full_path, sorted((name, version) for name, version, _ in versions)]
+            last_modified = None
+            if fingerprint is not None:
+                state.append(fingerprint(**kwargs))
+            elif versions:
+                last_modified = max(updated_at for _, _, updated_at in versions) \
+                    .replace(microsecond=0, tzinfo=timezone.utc)
+            etag = hashlib.sha1(json.dumps(state, default=str).encode()).hexdigest()
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                not_modified = last_modified is not None and request.if_modified_since is not None \
+                    and last_modified <= request.if_modified_since
+            response = Response(status=304) if not_modified else make_response(f(*args, **kwargs))
+            if response.status_code in (200, 304):
+                response.set_etag(etag)
+                if last_modified is not None:
+                    response.last_modified = last_modified
+                response.cache_control.public = True
+                response.cache_control.max_age = max_age
+            return response
+        return wrapper
+    return decorator
+
+
+class LRUBackend:
+    """Thread-safe LRU mapping of at most `maxsize` entries, with optional TTLs."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class LocalCache:
+    """Bounded in-process LRU cache shared by the requests of one worker.
+
+    Invalidations reach every worker, this one included, through the shared
+    version of `namespace`, which is polled at most every
+    CACHE_VERSION_CHECK_INTERVAL seconds; a changed version drops every local
+    entry. Entries remember the version they were built under, so a value
+    computed before an invalidation committed is never served after it.
+    """
+
+    def __init__(self, namespace, maxsize=1024, ttl=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._data = LRUBackend(maxsize)
+        self._lock = Lock()
+        self._version = None
+        self._checked_at = None
+        # version seen by the current thread's last get()
+        self._seen = local()
+
+    def _sync(self):
+        now = time.monotonic()
+        interval = current_app.config['CACHE_VERSION_CHECK_INTERVAL']
+        if self._checked_at is None or now - self._checked_at >= interval:
+            version = get_version(self.namespace)
+            with self._lock:
+                if version != self._version:
+                    self._data.clear()
+                    self._version = version
+                self._checked_at = now
+        self._seen.version = self._version
+        return self._version
+
+    def get(self, key, default=None):
+        version = self._sync()
+        entry = self._data.get(key)
+        if entry is None or entry[0] != version:
+            return default
+        return entry[1]
+
+    def set(self, key, value):
+        """Store `value`, computed after this thread's last get()."""
+        version = getattr(self._seen, 'version', None)
+        if version is not None and version == self._version:
+            self._data.set(key, (version, value), self.ttl)
+
+    def invalidate(self):
+        """Drop every entry in every worker once the current transaction commits.
+
+        The shared version is bumped in the current transaction, so the caller
+        must commit it together with the write that caused the change.
+        """
+        bump_version(self.namespace)
+        _pending_invalidations(db.session).add(self)
+
+    def _expire(self):
+        # the next get() re-reads the shared version and finds it moved
+        self._checked_at = None
+
+
+def _pending_invalidations(session):
+    return session.info.setdefault('local_invalidations', set())
+
+
+@event.listens_for(Session, 'after_commit')
+def _expire_local_caches(session):
+    for cache in session.info.pop('local_invalidations', ()):
+        cache._expire()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_local_invalidations(session, previous_transaction):
+    session.info.pop('local_invalidations', None)
+
+
+class RedisBackend:
+    def __init__(self, client, prefix):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, json.dumps(value), ex=int(ttl) if ttl else None)
+
+
+response_cache_requests = Counter(
+    'response_cache_requests_total', 'Cached endpoint lookups by result',
+    ['endpoint', 'result'], registry=metrics.registry,
+)
+
+
+class ResponseCache:
+    """Cache of serialized responses, invalidated by tags.
+
+    Entries are keyed on the endpoint plus its sorted query and view args and
+    remember the version of every tag (`category:3`, `product:7`, `shop`, ...)
+    as read before they were built. A lookup re-reads those versions in one
+    query and serves the entry only if none moved; write handlers call
+    invalidate() with the tags they touched, bumping the versions in their
+    own transaction. A tag is first seen in a built response, so an entry
+    with new tags is only served from its next build on.
+    Entries live in a per-worker LRU, or in Redis when RESPONSE_CACHE_URL is
+    set, and expire after RESPONSE_CACHE_TTL seconds in any case.
+    """
+
+    TAG_PREFIX = 'tag:'
+
+    def __init__(self):
+        self._backend = None
+        self._lock = Lock()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    url = current_app.config['RESPONSE_CACHE_URL']
+                    if url:
+                        import redis
+                        self._backend = RedisBackend(redis.Redis.from_url(url), 'response:')
+                    else:
+                        self._backend = LRUBackend(current_app.config['RESPONSE_CACHE_SIZE'])
+        return self._backend
+
+    def tag_names(self, tags):
+        return {self.TAG_PREFIX + tag for tag in tags}
+
+    def invalidate(self, *tags):
+        """Invalidate every entry carrying one of `tags`; the caller commits.
+
+        The versions are bumped with the change counters just before the
+        commit, so their rows are locked last and in name order.
+        """
+        _changed_counters(db.session).update(self.TAG_PREFIX + tag for tag in tags)
+
+    @staticmethod
+    def key():
+        args = sorted(request.args.items(multi=True))
+        view_args = sorted((request.view_args or {}).items())
+        return json.dumps([request.endpoint, args, view_args], default=str)
+
+    def cached(self, tags, ttl=None):
+        """Cache a GET view; put it directly above apifairy's @response.
+
+        `tags(data)` returns the tags of a freshly built response, given its
+        decoded JSON body.
+        """
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                key = self.key()
+                entry = self.backend.get(key)
+                versions = get_versions(entry['tags']) if entry is not None else {}
+                if entry is not None and entry['tags'] == versions:
+                    response_cache_requests.labels(request.endpoint, 'hit').inc()
+                    return Response(entry['body'], entry['status'], mimetype=entry['mimetype'])
+
+                response_cache_requests.labels(request.endpoint, 'miss').inc()
+                response = make_response(f(*args, **kwargs))
+                if response.status_code == 200:
+                    # Only versions read before the view ran may vouch for its
+                    # data; tags new to this entry are recorded unversioned and
+                    # versioned by the next build.
+                    names = self.tag_names(tags(response.get_json()))
+                    self.backend.set(key, {
+                        'tags': {name: versions.get(name) for name in names},
+                        'body': response.get_data(as_text=True),
+                        'status': response.status_code,
+                        'mimetype': response.mimetype,
+                    }, ttl or current_app.config['RESPONSE_CACHE_TTL'])
+                return response
+            return wrapper
+        return decorator
+
+
+response_cache = ResponseCache()
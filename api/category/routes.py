@@ -1,12 +1,51 @@
 from flask import request, jsonify
 from flask_jwt_extended import jwt_required
 from api.utils import permission_required, catch_exception
-from api.models import Category, SubCategory
+from api.cache import LocalCache, conditional, response_cache
+from api.models import Category, SubCategory, Product
 from api import db
 from api.schemas.category import CategorySchema, SubCategorySchema
+from api.schemas.compiled import compiled
 from apifairy import response
+from sqlalchemy import select, func
 
-category_schema = CategorySchema(many=True)
+category_schema = compiled(CategorySchema(many=True))
+
+# The navigation tree; invalidated by category, subcategory and product writes
+category_tree = LocalCache('category_tree', maxsize=1)
+
+
+def build_category_tree():
+    """Categories with their subcategories and product counts, from a single query."""
+    category_counts = select(Product.category_fk, func.count(Product.id).label('count')) \
+        .group_by(Product.category_fk).subquery()
+    subcategory_counts = select(Product.subcategory_fk, func.count(Product.id).label('count')) \
+        .group_by(Product.subcategory_fk).subquery()
+    rows = db.session.execute(
+        select(Category.id, Category.title, Category.not_for_children, category_counts.c.count,
+               SubCategory.id, SubCategory.title, subcategory_counts.c.count)
+        .outerjoin(category_counts, category_counts.c.category_fk == Category.id)
+        .outerjoin(SubCategory, SubCategory.category_fk == Category.id)
+        .outerjoin(subcategory_counts, subcategory_counts.c.subcategory_fk == SubCategory.id)
+        .order_by(Category.id, SubCategory.id)
+    )
+
+    tree = {}
+    for category_id, title, not_for_children, count, subcategory_id, subcategory_title, subcategory_count in rows:
+        category = tree.get(category_id)
+        if category is None:
+            category = tree[category_id] = {
+                'id': category_id,
+                'title': title,
+                'not_for_children': not_for_children,
+                'product_count': count or 0,
+                'subcategories': [],
+            }
+        if subcategory_id is not None:
+            category['subcategories'].append(
+                {'id': subcategory_id, 'title': subcategory_title, 'product_count': subcategory_count or 0}
+            )
+    return list(tree.values())
 
 
 @jwt_required()
@@ -21,6 +60,9 @@ def create():
     new_category = Category(title=title, not_for_children=not_for_children)
 
     db.session.add(new_category)
+    db.session.flush()
+    response_cache.invalidate(f'category:{new_category.id}')
+    category_tree.invalidate()
     db.session.commit()
 
     return jsonify(code=200, id=new_category.id), 200
@@ -36,11 +78,17 @@ def create_subcategory():
 
     new_subcategory = SubCategory(title=title, category_fk=category_id)
     db.session.add(new_subcategory)
+    response_cache.invalidate(f'category:{category_id}')
+    category_tree.invalidate()
     db.session.commit()
     return jsonify(code=200, id=new_subcategory.id)
 
 
+@conditional(Category, SubCategory, Product, max_age=300)
 @response(category_schema)
 def get_all():
-    all_categories = db.session.scalars(Category.select())
-    return all_categories
+    tree = category_tree.get('tree')
+    if tree is None:
+        tree = build_category_tree()
+        category_tree.set('tree', tree)
+    return tree
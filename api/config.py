@@ -1,5 +1,6 @@
 import datetime
 import os
+import tempfile
 from dotenv import load_dotenv
 
 
@@ -21,18 +22,58 @@ class Config:
     ALCHEMICAL_DATABASE_URL = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'db.sqlite')
     ALCHEMICAL_ENGINE_OPTIONS = {'echo': as_bool(os.environ.get('SQL_ECHO'))}
-    UPLOAD_FOLDER = './api/uploads'
+    # caching options
+    CACHE_VERSION_CHECK_INTERVAL = float(os.environ.get('CACHE_VERSION_CHECK_INTERVAL', 5))
+    # stock reservations
+    RESERVATION_TTL = datetime.timedelta(minutes=int(os.environ.get('RESERVATION_TTL_MINUTES', 15)))
+    # basket edits go straight to the database unless BASKET_CACHE_URL is set:
+    # a redis:// URL caches them write-behind for all workers, memory:// for a
+    # single worker only; pending baskets are written back after BASKET_FLUSH_DELAY seconds
+    BASKET_CACHE_URL = os.environ.get('BASKET_CACHE_URL')
+    BASKET_FLUSH_DELAY = float(os.environ.get('BASKET_FLUSH_DELAY', 2))
+    BASKET_FLUSH_INTERVAL = float(os.environ.get('BASKET_FLUSH_INTERVAL', 1))
+    # tag-invalidated response cache; a redis:// URL shares it between workers
+    RESPONSE_CACHE_URL = os.environ.get('RESPONSE_CACHE_URL')
+    RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 2048))
+    RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', 300))
     # security options
     SECRET_KEY = os.environ.get('SECRET_KEY', 'SecretKeyTestingPurposes_12bbcydsv')
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'JWTTestingPurposes_4n5guyviub')
     JWT_COOKIE_SECURE = as_bool(os.environ.get('JWT_COOKIE_SECURE'))
     JWT_ACCESS_TOKEN_EXPIRES = datetime.timedelta(days=7)
+    REVOKED_TOKENS_SYNC_INTERVAL = float(os.environ.get('REVOKED_TOKENS_SYNC_INTERVAL', 5))
+    REVOKED_TOKENS_PURGE_INTERVAL = float(os.environ.get('REVOKED_TOKENS_PURGE_INTERVAL', 3600))
+    # password hashing runs on a process pool; logins rehash outdated hashes
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:260000')
+    PASSWORD_SALT_LENGTH = int(os.environ.get('PASSWORD_SALT_LENGTH', 16))
+    PASSWORD_HASH_PROCESSES = int(os.environ.get('PASSWORD_HASH_PROCESSES', 2))
+    PASSWORD_HASH_QUEUE_SIZE = int(os.environ.get('PASSWORD_HASH_QUEUE_SIZE', 16))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
     USE_CORS = as_bool(os.environ.get('USE_CORS') or 'false')
     CORS_SUPPORTS_CREDENTIALS = True
 
     AWS_ACCESS_KEY_ID = os.environ.get('AWS_ACCESS_KEY_ID')
     AWS_SECRET_ACCESS_KEY = os.environ.get('AWS_SECRET_ACCESS_KEY')
     AWS_REGION = 'ru-central1'
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL', 'https://storage.yandexcloud.net')
+    S3_BUCKET = os.environ.get('S3_BUCKET', 'vapehookahstatic')
+    S3_MAX_POOL_CONNECTIONS = int(os.environ.get('S3_MAX_POOL_CONNECTIONS', 10))
+    S3_UPLOAD_WORKERS = int(os.environ.get('S3_UPLOAD_WORKERS', 4))
+    S3_UPLOAD_QUEUE_SIZE = int(os.environ.get('S3_UPLOAD_QUEUE_SIZE', 16))
+    S3_UPLOAD_TIMEOUT = float(os.environ.get('S3_UPLOAD_TIMEOUT', 60))
+    S3_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+    S3_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+    S3_MULTIPART_CONCURRENCY = 4
+    S3_MANIFEST_PATH = os.environ.get('S3_MANIFEST_PATH') or \
+        os.path.join(tempfile.gettempdir(), 'vh_s3_manifest.ndjson')
+    S3_MANIFEST_TTL = float(os.environ.get('S3_MANIFEST_TTL', 300))
+
+    # resized copies generated for every uploaded image
+    IMAGE_DERIVATIVE_WIDTHS = [int(width) for width in os.environ.get('IMAGE_DERIVATIVE_WIDTHS', '320,640,1280').split(',') if width]
+    IMAGE_DERIVATIVE_FORMATS = ['webp', 'jpeg']
+    IMAGE_DERIVATIVE_QUALITY = 80
+    IMAGE_DERIVATIVE_PROCESSES = int(os.environ.get('IMAGE_DERIVATIVE_PROCESSES', 2))
+    IMAGE_DERIVATIVE_TIMEOUT = float(os.environ.get('IMAGE_DERIVATIVE_TIMEOUT', 60))
 
     APIFAIRY_TITLE = 'VapeHookah API'
     APIFAIRY_VERSION = '1.0'
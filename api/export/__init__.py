@@ -0,0 +1,13 @@
+from flask import Blueprint
+from .routes import export_users, export_orders, export_order_items
+from .commands import export_command
+
+export = Blueprint('export', __name__, url_prefix='/export', cli_group='export')
+
+export.add_url_rule('/users', 'export_users', export_users, methods=['GET'])
+export.add_url_rule('/orders', 'export_orders', export_orders, methods=['GET'])
+export.add_url_rule('/order_items', 'export_order_items', export_order_items, methods=['GET'])
+
+export.cli.command('users')(export_command('users'))
+export.cli.command('orders')(export_command('orders'))
+export.cli.command('order-items')(export_command('order_items'))
@@ -0,0 +1,24 @@
+import sys
+import click
+from .exporter import export as export_dataset, FORMATS
+
+
+def export_command(name):
+    @click.option('--format', 'file_format', type=click.Choice(FORMATS), default='ndjson')
+    @click.option('--gzip', is_flag=True, help='Compress the output.')
+    @click.option('--since', type=click.DateTime(), help='Rows created (users: registered) at or after this time.')
+    @click.option('--until', type=click.DateTime(), help='Rows created before this time.')
+    @click.option('-o', '--output', type=click.Path(dir_okay=False, writable=True), help='Defaults to stdout.')
+    def command(file_format, gzip, since, until, output):
+        stream = open(output, 'wb') if output else sys.stdout.buffer
+        try:
+            for chunk in export_dataset(name, file_format, gzip, since, until):
+                stream.write(chunk)
+        finally:
+            if output:
+                stream.close()
+            else:
+                stream.flush()
+
+    command.__doc__ = f'Stream {name.replace("_", " ")} as NDJSON or CSV.'
+    return command
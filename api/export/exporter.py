@@ -0,0 +1,111 @@
+import csv
+import enum
+import io
+import json
+import zlib
+from datetime import datetime
+from sqlalchemy import select
+from api import db
+from api.models import User, Order, OrderItem
+
+# Rows fetched per round trip; the encoded output is sent in chunks of roughly CHUNK_SIZE bytes
+YIELD_PER = 1000
+CHUNK_SIZE = 64 * 1024
+
+# Exported columns per dataset; password hashes and tokens are never exported
+EXPORTS = {
+    'users': (User, [
+        User.id, User.email, User.email_confirmed, User.role_fk, User.firstName, User.lastName,
+        User.birthday, User.city, User.street, User.building, User.flat, User.zipcode,
+        User.notificationsAgree, User.registrationDate,
+    ]),
+    'orders': (Order, [
+        Order.id, Order.user_fk, Order.shop_fk, Order.status, Order.delivery_type, Order.payment_type,
+        Order.sum, Order.created_at, Order.updated_at,
+    ]),
+    'order_items': (OrderItem, [
+        OrderItem.id, OrderItem.order_fk, OrderItem.product_fk, OrderItem.price, OrderItem.amount,
+    ]),
+}
+
+# Column bounded by since/until; order items go by the creation of their order
+CREATED = {
+    'users': User.registrationDate,
+    'orders': Order.created_at,
+    'order_items': Order.created_at,
+}
+
+FORMATS = ('ndjson', 'csv')
+
+
+def plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.name
+    return value
+
+
+def export_rows(name, since=None, until=None):
+    """Yield lists of plain row tuples of dataset `name` in id order, using a server-side cursor.
+
+    `since`/`until` bound the dataset's CREATED column.
+    """
+    model, columns = EXPORTS[name]
+    created = CREATED[name]
+    query = select(*columns).order_by(model.id)
+    if model is OrderItem and (since or until):
+        query = query.join(Order, Order.id == OrderItem.order_fk)
+    if since:
+        query = query.where(created >= since)
+    if until:
+        query = query.where(created < until)
+
+    result = db.session.execute(query.execution_options(yield_per=YIELD_PER, stream_results=True))
+    for rows in result.partitions():
+        yield [tuple(plain(value) for value in row) for row in rows]
+
+
+def encode_ndjson(header, partitions):
+    for rows in partitions:
+        yield ''.join(json.dumps(dict(zip(header, row)), ensure_ascii=False) + '\n' for row in rows)
+
+
+def encode_csv(header, partitions):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for rows in partitions:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export(name, file_format='ndjson', gzip=False, since=None, until=None):
+    """Stream dataset `name` as encoded bytes chunks, gzipped if requested.
+
+    Memory use is bounded by one fetch of YIELD_PER rows regardless of the
+    table size, and the first chunk is ready after the first fetch.
+    """
+    header = [column.key for column in EXPORTS[name][1]]
+    encode = encode_csv if file_format == 'csv' else encode_ndjson
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if gzip else None
+
+    pending = []
+    size = 0
+    for text in encode(header, export_rows(name, since, until)):
+        data = text.encode()
+        if compressor is not None:
+            data = compressor.compress(data)
+        pending.append(data)
+        size += len(data)
+        if size >= CHUNK_SIZE:
+            yield b''.join(pending)
+            pending, size = [], 0
+    if compressor is not None:
+        pending.append(compressor.flush())
+    if pending:
+        yield b''.join(pending)
@@ -0,0 +1,39 @@
+from flask import Response, stream_with_context
+from flask_jwt_extended import jwt_required
+from apifairy import arguments
+from api.utils import permission_required
+from api.schemas.export import ExportSchema
+from .exporter import export as export_dataset
+
+MIMETYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def export_response(name, args):
+    filename = f'{name}.{args["format"]}' + ('.gz' if args['gzip'] else '')
+    chunks = export_dataset(name, args['format'], args['gzip'], args.get('since'), args.get('until'))
+    return Response(
+        stream_with_context(chunks),
+        mimetype='application/gzip' if args['gzip'] else MIMETYPES[args['format']],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+
+@jwt_required()
+@permission_required('admin.export.users')
+@arguments(ExportSchema())
+def export_users(args):
+    return export_response('users', args)
+
+
+@jwt_required()
+@permission_required('admin.export.orders')
+@arguments(ExportSchema())
+def export_orders(args):
+    return export_response('orders', args)
+
+
+@jwt_required()
+@permission_required('admin.export.orders')
+@arguments(ExportSchema())
+def export_order_items(args):
+    return export_response('order_items', args)
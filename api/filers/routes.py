@@ -1,50 +1,63 @@
+from itertools import groupby
 from flask import jsonify, current_app
 
 from api import db
 from flask_jwt_extended import jwt_required
 from api.utils import permission_required
 from apifairy import response, body, arguments
-from api.models import Product, ProductSpecification, Category
+from api.models import Product, ProductSpecification
 from api.schemas.product import SpecificationSchema
 from api.schemas.category import SearchByCategorySchema
 from api.schemas.filters import FiltersSchema
-from sqlalchemy import and_
+from api.cache import LocalCache, conditional
+from sqlalchemy import select, func
 
 filters_schema = FiltersSchema(many=True)
 get_by_category_schema = SearchByCategorySchema()
 
+# category id -> facet list
+facets_cache = LocalCache('filters')
 
-@arguments(get_by_category_schema)
-@response(filters_schema)
-def get_filters(args):
-    unique_keys = db.session.scalars(
-        ProductSpecification.select()
+
+def build_facets(category_id):
+    rows = db.session.execute(
+        select(
+            ProductSpecification.key,
+            func.max(ProductSpecification.type),
+            ProductSpecification.value,
+            func.count(func.distinct(ProductSpecification.product_id))
+        )
         .join(Product)
-        .join(Category)
-        .distinct(ProductSpecification.key)
-        .where(Product.category_fk == args['id'])
+        .where(Product.category_fk == category_id)
+        .group_by(ProductSpecification.key, ProductSpecification.value)
+        .order_by(ProductSpecification.key, ProductSpecification.value)
     )
 
     filters_list = []
-
-    for unique_key in unique_keys:
-        unique_values = db.session.scalars(
-            ProductSpecification.select()
-            .join(Product)
-            .join(Category)
-            .distinct(ProductSpecification.value)
-            .where(
-                and_(
-                    Product.category_fk == args['id'],
-                    ProductSpecification.key == unique_key.key)
-            )
-        )
+    for key, key_rows in groupby(rows, lambda row: row[0]):
+        key_rows = list(key_rows)
         filters_list.append(
             {
-                'key': unique_key.key,
-                'type': unique_key.type,
-                'value': [{'value': result.value} for result in unique_values]
+                'key': key,
+                'type': key_rows[0][1],
+                'value': [{'value': value, 'count': count} for _, _, value, count in key_rows]
             }
         )
+    return filters_list
+
+
+def invalidate_facets(product_ids):
+    """Drop cached facets once the specifications of `product_ids` are committed."""
+    if product_ids:
+        facets_cache.invalidate()
+
 
+@conditional(Product, ProductSpecification, max_age=300)
+@arguments(get_by_category_schema)
+@response(filters_schema)
+def get_filters(args):
+    filters_list = facets_cache.get(args['id'])
+    if filters_list is None:
+        filters_list = build_facets(args['id'])
+        facets_cache.set(args['id'], filters_list)
     return filters_list
@@ -1,9 +1,11 @@
 from api.schemas.imagecarousel import ImageCarouselSchema, ImageCarouseUpdateSchema
 from apifairy import body, response
 from api.utils import permission_required
+from api.cache import conditional, response_cache
 from flask_jwt_extended import jwt_required
-from api.models import ImageCarousel
+from api.models import ImageCarousel, ObjectStorage, ObjectStorageDerivative
 from api.app import db
+from sqlalchemy.orm import joinedload
 
 icmany = ImageCarouselSchema(many=True)
 
@@ -15,6 +17,7 @@ icmany = ImageCarouselSchema(many=True)
 def create(args):
     image = ImageCarousel(**args)
     db.session.add(image)
+    response_cache.invalidate('carousel')
     db.session.commit()
     return image
 
@@ -30,13 +33,18 @@ def update(args):
     image.active = args['active']
     image.image_id = args['image_id']
     db.session.add(image)
+    response_cache.invalidate('carousel')
     db.session.commit()
     return image
 
 
+@conditional(ImageCarousel, ObjectStorage, ObjectStorageDerivative)
+@response_cache.cached(lambda data: ['carousel'])
 @response(icmany)
 def get_active():
     images = db.session.scalars(
-        ImageCarousel.select().where(ImageCarousel.active == True)
+        ImageCarousel.select()
+        .options(joinedload(ImageCarousel.image).selectinload(ObjectStorage.derivatives))
+        .where(ImageCarousel.active == True)
     )
     return images
\ No newline at end of file
@@ -1,13 +1,20 @@
 import enum
 from datetime import datetime, timedelta
-from sqlalchemy import Column, ForeignKey
+from sqlalchemy import Column, ForeignKey, Index, UniqueConstraint
 from sqlalchemy import Integer, String, Float, DateTime, Boolean, JSON, Enum, func
+from sqlalchemy import select, insert, exists, literal, true
 from sqlalchemy.orm import relationship
-from werkzeug.security import generate_password_hash, check_password_hash
 from api.app import db
 from flask_jwt_extended import get_current_user
 import urllib
 
+RATING_STARS = range(0, 6)
+STORAGE_URL = 'https://storage.yandexcloud.net/vapehookahstatic/'
+
+
+def storage_url(link):
+    return STORAGE_URL + urllib.parse.quote(link)
+
 
 class Updatable:
     def update(self, data):
@@ -35,19 +42,59 @@ class PaymentType(enum.Enum):
     postpayment = 1
 
 
+class CacheVersion(db.Model):
+    __tablename__ = 'CacheVersion'
+
+    name = Column(String(64), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
 class ObjectStorage(db.Model):
     __tablename__ = 'ObjectStorage'
 
     id = Column(Integer, primary_key=True)
     link = Column(String(1024), index=True)
+    # SHA-256 of the content; uploads with a known digest reuse the row
+    digest = Column(String(64), index=True, unique=True)
+    size = Column(Integer)
 
     product = relationship('Product', back_populates='image')
     imagecarousel = relationship('ImageCarousel', back_populates='image')
+    derivatives = relationship('ObjectStorageDerivative', back_populates='original')
+
+    @property
+    def srcset(self):
+        """Derivative urls by format and width, e.g. {'webp': {'320': url}}."""
+        result = {}
+        for derivative in sorted(self.derivatives, key=lambda derivative: derivative.width):
+            result.setdefault(derivative.format, {})[str(derivative.width)] = storage_url(derivative.link)
+        return result
+
+
+class ObjectStorageDerivative(db.Model):
+    __tablename__ = 'ObjectStorageDerivative'
+    __table_args__ = (
+        UniqueConstraint('object_fk', 'width', 'format'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    object_fk = Column(Integer, ForeignKey('ObjectStorage.id', ondelete='CASCADE'), nullable=False, index=True)
+    width = Column(Integer, nullable=False)
+    format = Column(String(8), nullable=False)
+    link = Column(String(1024), nullable=False)
+    size = Column(Integer)
+
+    original = relationship('ObjectStorage', back_populates='derivatives')
 
 
 
 class User(Updatable, db.Model):
     __tablename__ = 'Users'
+    __table_args__ = (
+        # role member counts and keyset pages of a role's users
+        Index('ix_Users_role_fk_id', 'role_fk', 'id'),
+    )
 
     # Основная информация
     id = Column(Integer, primary_key=True, index=True)
@@ -55,6 +102,8 @@ class User(Updatable, db.Model):
     email_confirmed = Column(Boolean, default=False)
     password = Column(String(128))
     role_fk = Column(Integer, ForeignKey('UserRole.id'))
+    # Sent as the `ver` token claim; bumping it invalidates issued tokens
+    token_version = Column(Integer, nullable=False, default=0, server_default='0')
 
     # Личная информация
     firstName = Column(String(64), index=True)
@@ -80,13 +129,19 @@ class User(Updatable, db.Model):
     email_confirmations = relationship('EmailConfirmation', back_populates='user')
     revokedtokens = relationship('RevokedTokens', back_populates='user')
 
+    # Both hash on the password pool and may raise HashingBusy or TimeoutError
     def check_password(self, password) -> bool:
-        return check_password_hash(self.password, password)
+        from api.auth.passwords import verify_password
+        return verify_password(self.password, password)
 
     def update_password(self, new_password, old_password) -> bool:
-        if check_password_hash(self.password, old_password):
-            self.password = generate_password_hash(new_password)
+        from api.auth.passwords import verify_password, hash_password
+        if verify_password(self.password, old_password):
+            from api.auth.identity import invalidate_identity
+            self.password = hash_password(new_password)
+            self.token_version += 1
             db.session.add(self)
+            invalidate_identity(self.id)
             db.session.commit()
             return True
         else:
@@ -188,10 +243,20 @@ class SubCategory(db.Model):
 
 class Product(db.Model):
     __tablename__ = 'Product'
+    __table_args__ = (
+        # Keyset pagination orderings: (created_at, id) and (price, id)
+        Index('ix_Product_created_at_id', 'created_at', 'id'),
+        Index('ix_Product_category_created_at_id', 'category_fk', 'created_at', 'id'),
+        Index('ix_Product_category_price_id', 'category_fk', 'price', 'id'),
+        Index('ix_Product_subcategory_created_at_id', 'subcategory_fk', 'created_at', 'id'),
+        Index('ix_Product_subcategory_price_id', 'subcategory_fk', 'price', 'id'),
+    )
 
     id = Column(Integer, primary_key=True)
+    # Supplier stock keeping unit, the key of catalog imports
+    sku = Column(String(64), index=True, unique=True)
     title = Column(String(128), index=True, nullable=False)
-    description = Column(String(1024), index=True)
+    description = Column(String(1024))
     image_fk = Column(Integer, ForeignKey('ObjectStorage.id'))
     price = Column(Float(2), nullable=False, index=True)
     is_child = Column(Boolean, nullable=False)
@@ -202,6 +267,16 @@ class Product(db.Model):
 
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # Rating aggregates, maintained by reviews.create and `flask reviews recompute`
+    rating_sum = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_count = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_0 = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_1 = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_2 = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_3 = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_4 = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_5 = Column(Integer, nullable=False, default=0, server_default='0')
+
     # referenced_product = relationship('Product', back_populates='referenced_product')
     referenced_product = relationship('Product')
     categories = relationship('Category', back_populates='products')
@@ -217,21 +292,28 @@ class Product(db.Model):
 
     @property
     def image_link(self):
-        return 'https://storage.yandexcloud.net/vapehookahstatic/' + urllib.parse.quote(self.image.link)
+        return storage_url(self.image.link)
 
     @property
-    def avg_stars(self):
-        total = 0
-        for review in self.reviews:
-            total+=review.stars
+    def image_srcset(self):
+        return self.image.srcset if self.image else {}
 
+    @property
+    def avg_stars(self):
         try:
-            return total/len(self.reviews)
+            return self.rating_sum/self.rating_count
         except ZeroDivisionError:
             return 0
 
+    @property
+    def star_distribution(self):
+        return {stars: getattr(self, f'rating_{stars}') for stars in RATING_STARS}
+
 class ProductAvailability(db.Model):
     __tablename__ = 'ProductAvailability'
+    __table_args__ = (
+        UniqueConstraint('product_id', 'shop_id'),
+    )
 
     id = Column(Integer, primary_key=True)
     product_id = Column(Integer, ForeignKey('Product.id'))
@@ -242,16 +324,33 @@ class ProductAvailability(db.Model):
     shop = relationship('Shop', back_populates='available')
     reserved = relationship('ProductReserve', back_populates='pa')
 
+    @classmethod
+    def fan_out(cls, *conditions):
+        """Insert an empty availability row for every missing (product, shop) pair.
+
+        A single INSERT ... SELECT over Product x Shop, narrowed by `conditions`
+        (e.g. `Shop.id == shop.id`). Pairs that already exist are skipped, so
+        repeated calls are idempotent.
+        """
+        pairs = select(Product.id, Shop.id, literal(0)) \
+            .join(Shop, true()) \
+            .where(~exists().where(cls.product_id == Product.id, cls.shop_id == Shop.id), *conditions)
+        return db.session.execute(
+            insert(cls).from_select(['product_id', 'shop_id', 'amount'], pairs)
+        )
+
 
 class ProductReserve(db.Model):
     __tablename__ = 'ProductReserve'
 
     id = Column(Integer, primary_key=True)
-    user_fk = Column(Integer, ForeignKey('Users.id'))
+    user_fk = Column(Integer, ForeignKey('Users.id'), index=True)
     product_fk = Column(Integer, ForeignKey('Product.id', ondelete='CASCADE'))
     pa_fk = Column(Integer, ForeignKey('ProductAvailability.id', ondelete='CASCADE')) # ProductAvailability_FK
-    order_fk = Column(Integer, ForeignKey('Order.id'))
+    order_fk = Column(Integer, ForeignKey('Order.id'), index=True)
     amount = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
 
     user = relationship('User', back_populates='reserved')
     product = relationship('Product', back_populates='reserved')
@@ -272,9 +371,12 @@ class Favourite(db.Model):
 
 class Basket(db.Model):
     __tablename__ = 'Basket'
+    __table_args__ = (
+        UniqueConstraint('user_fk', 'product_fk'),
+    )
 
     id = Column(Integer, primary_key=True)
-    user_fk = Column(Integer, ForeignKey('Users.id'), nullable=False, index=True)
+    user_fk = Column(Integer, ForeignKey('Users.id'), nullable=False)
     product_fk = Column(Integer, ForeignKey('Product.id'), nullable=False)
     amount = Column(Integer, nullable=False, default=1)
 
@@ -284,6 +386,9 @@ class Basket(db.Model):
 
 class Order(db.Model):
     __tablename__ = 'Order'
+    __table_args__ = (
+        UniqueConstraint('user_fk', 'idempotency_key'),
+    )
 
     id = Column(Integer, primary_key=True)
     user_fk = Column(Integer, ForeignKey('Users.id'), nullable=False, index=True)
@@ -294,8 +399,10 @@ class Order(db.Model):
     # TODO: Used promocodes
     # TODO: Used promo
     shop_fk = Column(Integer, ForeignKey('Shop.id'), index=True)
+    # client supplied key; a retried checkout returns the order created first
+    idempotency_key = Column(String(64))
 
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     updated_at = Column(DateTime, default=datetime.utcnow)
 
     shop = relationship('Shop', back_populates='orders')
@@ -308,7 +415,7 @@ class OrderItem(db.Model):
 
     id = Column(Integer, primary_key=True)
     product_fk = Column(Integer, ForeignKey('Product.id'), nullable=False)
-    order_fk = Column(Integer, ForeignKey('Order.id'), nullable=False)
+    order_fk = Column(Integer, ForeignKey('Order.id'), nullable=False, index=True)
     price = Column(Float(2), nullable=False)
     amount = Column(Integer, nullable=False)
 
@@ -366,7 +473,7 @@ class RevokedTokens(db.Model):
     jti = Column(String(36), nullable=False, index=True)
     type = Column(String(16), nullable=False)
     user_fk = Column(Integer, ForeignKey('Users.id'), nullable=False, default=lambda: get_current_user().id)
-    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False, index=True)
 
     user = relationship('User', back_populates='revokedtokens')
 
@@ -382,11 +489,19 @@ class ImageCarousel(db.Model):
 
     @property
     def image_link(self):
-        return 'https://storage.yandexcloud.net/vapehookahstatic/' + urllib.parse.quote(self.image.link)
+        return storage_url(self.image.link)
+
+    @property
+    def image_srcset(self):
+        return self.image.srcset if self.image else {}
 
 
 class ProductSpecification(db.Model):
     __tablename__ = 'ProductSpecification'
+    __table_args__ = (
+        # Faceted search fallback when the in-process index can't be used
+        Index('ix_ProductSpecification_key_value_product', 'key', 'value', 'product_id'),
+    )
 
     id = Column(Integer, primary_key=True)
     product_id = Column(Integer, ForeignKey('Product.id'), nullable=False)
@@ -0,0 +1,48 @@
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask import current_app
+from sqlalchemy import select
+from api.app import db
+from api.models import ObjectStorage
+from api.objectstorage.storage import get_s3_client
+from api.objectstorage.derivatives import render, upload_derivatives, add_derivatives, invalidate_images
+
+
+@click.option('--batch-size', default=16, help='Images processed concurrently.')
+def derivatives(batch_size):
+    """Generate missing image derivatives for existing ObjectStorage rows."""
+    app = current_app._get_current_object()
+    bucket = app.config['S3_BUCKET']
+    s3 = get_s3_client()
+
+    def generate(link):
+        with app.app_context():
+            data = s3.get_object(Bucket=bucket, Key=link)['Body'].read()
+            return upload_derivatives(link, render(data))
+
+    created = failed = 0
+    last_id = 0
+    with ThreadPoolExecutor(max_workers=batch_size) as executor:
+        while originals := db.session.scalars(
+            select(ObjectStorage)
+            .where(ObjectStorage.id > last_id,
+                   ~ObjectStorage.derivatives.any(),
+                   ObjectStorage.link.isnot(None))
+            .order_by(ObjectStorage.id)
+            .limit(batch_size)
+        ).all():
+            last_id = originals[-1].id
+            futures = [(original, executor.submit(generate, original.link)) for original in originals]
+            done = []
+            for original, future in futures:
+                try:
+                    add_derivatives(original, future.result())
+                    done.append(original.id)
+                except Exception as e:
+                    failed += 1
+                    click.echo(f'{original.link}: {e}', err=True)
+            if done:
+                invalidate_images(done)
+            db.session.commit()
+            created += len(done)
+    click.echo(f'Generated derivatives for {created} images, {failed} failed')
@@ -0,0 +1,116 @@
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from threading import Lock
+from flask import current_app
+from sqlalchemy import select
+from api.app import db
+from api.models import ObjectStorage, ObjectStorageDerivative, Product
+from api.cache import response_cache
+from api.objectstorage.storage import put_object
+
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+_lock = Lock()
+_pool = None
+_jobs = None
+
+
+def render_derivatives(source, widths, formats, quality):
+    """Resize an encoded image to each width and encode it in each format.
+
+    `source` is the encoded image or the path of a file holding it. Widths
+    above the original's are clamped to it, so images are never upscaled.
+
+    Runs in a worker process; returns a list of (width, format, bytes).
+    """
+    from PIL import Image, ImageOps
+
+    rendered = []
+    with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as image:
+        image = ImageOps.exif_transpose(image)
+        for width in sorted({min(width, image.width) for width in widths}):
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+            for image_format in formats:
+                output = io.BytesIO()
+                converted = resized.convert('RGB') if image_format == 'jpeg' else resized
+                converted.save(output, format=image_format.upper(), quality=quality)
+                rendered.append((width, image_format, output.getvalue()))
+    return rendered
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                # Spawned workers don't inherit the server's threads and locks
+                _pool = ProcessPoolExecutor(max_workers=current_app.config['IMAGE_DERIVATIVE_PROCESSES'],
+                                            mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def render(source):
+    """Render `source` on the process pool, waiting at most IMAGE_DERIVATIVE_TIMEOUT seconds."""
+    config = current_app.config
+    future = get_pool().submit(render_derivatives, source, config['IMAGE_DERIVATIVE_WIDTHS'],
+                               config['IMAGE_DERIVATIVE_FORMATS'], config['IMAGE_DERIVATIVE_QUALITY'])
+    return future.result(timeout=config['IMAGE_DERIVATIVE_TIMEOUT'])
+
+
+def upload_derivatives(link, rendered):
+    """Upload the rendered derivatives of the original stored under `link`.
+
+    Runs on the calling thread, which is a background job or a command.
+    Returns a list of (width, format, link, size).
+    """
+    stem = link.rsplit('.', 1)[0]
+    uploaded = []
+    for width, image_format, payload in rendered:
+        derivative_link = f'{stem}_{width}w.{EXTENSIONS[image_format]}'
+        put_object(payload, derivative_link, f'image/{image_format}')
+        uploaded.append((width, image_format, derivative_link, len(payload)))
+    return uploaded
+
+
+def add_derivatives(original, uploaded):
+    for width, image_format, link, size in uploaded:
+        db.session.add(ObjectStorageDerivative(original=original, width=width, format=image_format,
+                                               link=link, size=size))
+
+
+def invalidate_images(original_ids):
+    """Expire cached responses embedding the srcsets of `original_ids`; the caller commits."""
+    product_ids = db.session.scalars(select(Product.id).where(Product.image_fk.in_(original_ids))).all()
+    response_cache.invalidate('carousel', *(f'product:{product_id}' for product_id in product_ids))
+
+
+def _create_derivatives(app, original_id, path):
+    with app.app_context():
+        try:
+            original = db.session.get(ObjectStorage, original_id)
+            add_derivatives(original, upload_derivatives(original.link, render(path)))
+            invalidate_images([original_id])
+            db.session.commit()
+        except Exception:
+            # The original is usable on its own; `flask s3 derivatives` can retry later
+            db.session.rollback()
+            app.logger.exception(f'Generating derivatives of image {original_id} failed')
+        finally:
+            os.unlink(path)
+
+
+def schedule_derivatives(original_id, path):
+    """Generate the derivatives of a stored upload in the background.
+
+    `path` is the spooled original, deleted once the job is done.
+    """
+    global _jobs
+    if _jobs is None:
+        with _lock:
+            if _jobs is None:
+                _jobs = ThreadPoolExecutor(max_workers=current_app.config['IMAGE_DERIVATIVE_PROCESSES'],
+                                           thread_name_prefix='image-derivatives')
+    return _jobs.submit(_create_derivatives, current_app._get_current_object(), original_id, path)
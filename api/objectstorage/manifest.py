@@ -0,0 +1,116 @@
+import json
+import os
+import time
+from threading import Lock, Thread
+from flask import current_app
+from sqlalchemy import select, union
+from api.app import db
+from api.models import ObjectStorage, ObjectStorageDerivative
+from api.objectstorage.storage import get_s3_client
+
+
+def list_bucket():
+    """Yield every object of the bucket in key order, one listing page at a time."""
+    paginator = get_s3_client().get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=current_app.config['S3_BUCKET']):
+        for item in page.get('Contents', ()):
+            yield {
+                'Key': item['Key'],
+                'Size': item['Size'],
+                'LastModified': item['LastModified'].isoformat(),
+                'ETag': item['ETag'],
+            }
+
+
+class BucketManifest:
+    """Bucket listing cached as an NDJSON file shared by the workers of a host.
+
+    Reads serve the file as it is; once it is older than S3_MANIFEST_TTL a
+    single background thread per process rewrites it from a fresh listing.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._refreshing = False
+
+    @property
+    def path(self):
+        return current_app.config['S3_MANIFEST_PATH']
+
+    def refresh(self):
+        path = self.path
+        temporary_path = f'{path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'w') as manifest:
+            for item in list_bucket():
+                manifest.write(json.dumps(item) + '\n')
+        os.replace(temporary_path, path)
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        app = current_app._get_current_object()
+
+        def refresh():
+            try:
+                with app.app_context():
+                    self.refresh()
+            except Exception:
+                app.logger.exception('Refreshing the bucket manifest failed')
+            finally:
+                self._refreshing = False
+
+        Thread(target=refresh, name='s3-manifest-refresh', daemon=True).start()
+
+    def lines(self):
+        """Yield the NDJSON lines of the manifest, refreshing it as needed."""
+        try:
+            age = time.time() - os.path.getmtime(self.path)
+        except FileNotFoundError:
+            self.refresh()
+            age = 0
+        if age > current_app.config['S3_MANIFEST_TTL']:
+            self._refresh_in_background()
+        with open(self.path) as manifest:
+            yield from manifest
+
+    def keys(self):
+        for line in self.lines():
+            yield json.loads(line)['Key']
+
+
+manifest = BucketManifest()
+
+
+def stored_links():
+    """Yield every link referenced from the database, in the bucket's (binary) key order."""
+    links = union(
+        select(ObjectStorage.link.label('link')).where(ObjectStorage.link.isnot(None)),
+        select(ObjectStorageDerivative.link.label('link'))
+    ).subquery()
+    order = links.c.link
+    if db.session.get_bind().dialect.name == 'postgresql':
+        order = order.collate('C')
+    yield from db.session.scalars(
+        select(links.c.link).order_by(order).execution_options(yield_per=1000)
+    )
+
+
+def reconcile(keys, links):
+    """Merge two sorted streams of bucket keys and stored links.
+
+    Yields objects missing from the database ('orphan') and links whose
+    object is missing from the bucket ('missing').
+    """
+    keys, links = iter(keys), iter(links)
+    key, link = next(keys, None), next(links, None)
+    while key is not None or link is not None:
+        if link is None or (key is not None and key < link):
+            yield {'key': key, 'status': 'orphan'}
+            key = next(keys, None)
+        elif key is None or link < key:
+            yield {'key': link, 'status': 'missing'}
+            link = next(links, None)
+        else:
+            key, link = next(keys, None), next(links, None)
@@ -1,17 +1,24 @@
+import json
 import os
-import boto3
-from flask import current_app, jsonify, request
-from api.utils import permission_required
+from flask import current_app, jsonify, request, Response, stream_with_context
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from werkzeug.formparser import FormDataParser
+from api.utils import permission_required, get_first
 from flask_jwt_extended import jwt_required
 from api.models import ObjectStorage
 from api import db
-from apifairy import response
-from api.schemas.objectstorage import ObjectStorageSchema
+from apifairy import response, arguments
+from api.schemas.objectstorage import ObjectStorageSchema, ObjectStorageListSchema
+from api.objectstorage.storage import SpooledUpload, spool_upload, upload_file, submit, StorageBusy
+from api.objectstorage.manifest import manifest, stored_links, reconcile
+from api.objectstorage.derivatives import schedule_derivatives
 
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 
 objectstorageschema=ObjectStorageSchema(many=True)
+objectstoragelistschema = ObjectStorageListSchema()
 
 def allowed_file(filename):
     return '.' in filename and \
@@ -22,23 +29,15 @@ def get_extension(filename):
     return filename.rsplit('.', 1)[1].lower()
 
 
-def create_s3_session():
-    session = boto3.session.Session()
-    s3 = session.client(
-        service_name='s3',
-        endpoint_url='https://storage.yandexcloud.net',
-        aws_access_key_id=current_app.config['AWS_ACCESS_KEY_ID'],
-        aws_secret_access_key=current_app.config['AWS_SECRET_ACCESS_KEY'],
-        region_name=current_app.config['AWS_REGION']
-    )
-    return s3
-
-
 @jwt_required()
 @permission_required('admin.s3.read_all')
-def get_all_items():
-    s3 = create_s3_session()
-    return jsonify(s3.list_objects(Bucket='vapehookahstatic')['Contents'])
+@arguments(objectstoragelistschema)
+def get_all_items(args):
+    if args['reconcile']:
+        lines = (json.dumps(item) + '\n' for item in reconcile(manifest.keys(), stored_links()))
+    else:
+        lines = manifest.lines()
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson')
 
 
 @jwt_required()
@@ -49,27 +48,69 @@ def get_db_items():
     return items
 
 
+def _store(app, object_id, path, content_type):
+    """Upload job of a committed ObjectStorage row, owning the spooled file at `path`."""
+    with app.app_context():
+        try:
+            obj = db.session.get(ObjectStorage, object_id)
+            upload_file(path, obj.link, content_type)
+        except Exception:
+            app.logger.exception(f'Storing upload {object_id} failed')
+            # forget the row, so uploading the same content again retries
+            db.session.rollback()
+            db.session.execute(delete(ObjectStorage).where(ObjectStorage.id == object_id))
+            db.session.commit()
+            os.unlink(path)
+            return
+        if app.config['IMAGE_DERIVATIVE_WIDTHS']:
+            schedule_derivatives(object_id, path)
+        else:
+            os.unlink(path)
+
+
 @jwt_required()
 @permission_required('admin.s3.upload')
 def upload():
-    if 'image' not in request.files:
-        return jsonify(code=400, error='File not found in payload'), 400
-
-    file = request.files['image']
-    if file and allowed_file(file.filename):
-        file_extension = get_extension(file.filename)
-        filename = (str(hash(file.filename)) + '.' + file_extension).replace('-', '')
-        saved_filename = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-
-        file.save(saved_filename)
-
-        s3 = create_s3_session()
-        s3.upload_file(saved_filename, 'vapehookahstatic', filename)
-
-        obj = ObjectStorage(link=filename)
+    """Accept an image and store it in the background.
+
+    The multipart body is spooled and hashed by the form parser in one pass.
+    Known content answers 200 with the existing id; new content is
+    committed, handed to the upload pool and answered 202 at once.
+    """
+    parser = FormDataParser(stream_factory=spool_upload, max_content_length=current_app.config['MAX_CONTENT_LENGTH'])
+    _, _, files = parser.parse(request.stream, request.mimetype, request.content_length, request.mimetype_params)
+    paths = [file.stream.path for file in files.values() if isinstance(file.stream, SpooledUpload)]
+    try:
+        if 'image' not in files:
+            return jsonify(code=400, error='File not found in payload'), 400
+        file = files['image']
+        if not allowed_file(file.filename):
+            return jsonify(code=400, error='File extension is not allowed')
+
+        spooled = file.stream
+        spooled.close()
+        if existing := get_first(ObjectStorage.select().where(ObjectStorage.digest == spooled.digest)):
+            return jsonify(code=200, id=existing.id)
+
+        obj = ObjectStorage(link=spooled.digest + '.' + get_extension(file.filename), digest=spooled.digest,
+                            size=spooled.size)
         db.session.add(obj)
-        db.session.commit()
-        os.remove(saved_filename)
-        return jsonify(code=200, id=obj.id)
-    return jsonify(code=400, error='File extension is not allowed')
-
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # The same content was uploaded concurrently; the object key is identical
+            db.session.rollback()
+            obj = get_first(ObjectStorage.select().where(ObjectStorage.digest == spooled.digest))
+            return jsonify(code=200, id=obj.id)
+
+        try:
+            submit(_store, current_app._get_current_object(), obj.id, spooled.path, file.mimetype)
+        except StorageBusy:
+            db.session.delete(obj)
+            db.session.commit()
+            return jsonify(code=503, error='Object storage is busy, try again later'), 503
+        paths.remove(spooled.path)
+        return jsonify(code=202, id=obj.id), 202
+    finally:
+        for path in paths:
+            os.unlink(path)
@@ -0,0 +1,125 @@
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config as BotoConfig
+from flask import current_app
+
+_lock = Lock()
+_client = None
+_executor = None
+_slots = None
+
+
+class StorageBusy(Exception):
+    """Raised when the upload pool already has S3_UPLOAD_QUEUE_SIZE uploads in flight."""
+
+
+def get_s3_client():
+    """Process-wide S3 client; boto3 clients are thread safe and pool their connections."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                config = current_app.config
+                _client = boto3.session.Session().client(
+                    service_name='s3',
+                    endpoint_url=config['S3_ENDPOINT_URL'],
+                    aws_access_key_id=config['AWS_ACCESS_KEY_ID'],
+                    aws_secret_access_key=config['AWS_SECRET_ACCESS_KEY'],
+                    region_name=config['AWS_REGION'],
+                    # a store that stops answering fails the background upload instead of holding its thread
+                    config=BotoConfig(max_pool_connections=config['S3_MAX_POOL_CONNECTIONS'],
+                                      connect_timeout=config['S3_UPLOAD_TIMEOUT'],
+                                      read_timeout=config['S3_UPLOAD_TIMEOUT'])
+                )
+    return _client
+
+
+def _get_executor():
+    global _executor, _slots
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                config = current_app.config
+                _slots = BoundedSemaphore(config['S3_UPLOAD_QUEUE_SIZE'])
+                _executor = ThreadPoolExecutor(max_workers=config['S3_UPLOAD_WORKERS'],
+                                               thread_name_prefix='s3-upload')
+    return _executor
+
+
+class SpooledUpload:
+    """Temporary file a multipart upload is written to, hashed as it is written.
+
+    Pass spool_upload as werkzeug's stream_factory so the body is written to
+    disk exactly once, by the parser, and never read back to hash it. The
+    file is kept when closed; whoever ends up owning it deletes `path`.
+    """
+
+    def __init__(self, suffix=None):
+        self._file = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+        self._digest = hashlib.sha256()
+        self.path = self._file.name
+        self.size = 0
+
+    def write(self, data):
+        self._digest.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    @property
+    def digest(self):
+        return self._digest.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+def spool_upload(total_content_length, content_type, filename, content_length=None):
+    suffix = '.' + filename.rsplit('.', 1)[-1].lower() if filename and '.' in filename else None
+    return SpooledUpload(suffix)
+
+
+def _transfer_config():
+    config = current_app.config
+    return TransferConfig(
+        multipart_threshold=config['S3_MULTIPART_THRESHOLD'],
+        multipart_chunksize=config['S3_MULTIPART_CHUNKSIZE'],
+        max_concurrency=config['S3_MULTIPART_CONCURRENCY']
+    )
+
+
+def upload_file(path, key, content_type=None):
+    """Upload the file at `path` under `key` on the calling thread.
+
+    Files above S3_MULTIPART_THRESHOLD are sent as multipart uploads.
+    """
+    extra_args = {'ContentType': content_type} if content_type else None
+    get_s3_client().upload_file(path, current_app.config['S3_BUCKET'], key,
+                                ExtraArgs=extra_args, Config=_transfer_config())
+
+
+def put_object(payload, key, content_type=None):
+    """Store the bytes `payload` under `key` on the calling thread."""
+    extra_args = {'ContentType': content_type} if content_type else {}
+    get_s3_client().put_object(Bucket=current_app.config['S3_BUCKET'], Key=key, Body=payload, **extra_args)
+
+
+def submit(fn, *args):
+    """Run `fn(*args)` on the bounded upload pool without waiting for it.
+
+    Raises StorageBusy at once when S3_UPLOAD_QUEUE_SIZE jobs are already
+    queued or running.
+    """
+    executor = _get_executor()
+    if not _slots.acquire(blocking=False):
+        raise StorageBusy()
+    try:
+        future = executor.submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future
@@ -0,0 +1,6 @@
+from flask import Blueprint
+from .routes import checkout
+
+order = Blueprint('order', __name__, url_prefix='/order')
+
+order.add_url_rule('/checkout', 'order_checkout', checkout, methods=['POST'])
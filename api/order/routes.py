@@ -0,0 +1,38 @@
+from flask import jsonify
+from apifairy import body
+from flask_jwt_extended import jwt_required, current_user
+from sqlalchemy.exc import IntegrityError
+from api import db
+from api.basket.cache import basket_cache
+from api.reservations.service import ReservationError, OutOfStock
+from api.schemas.order import OrderSchema, CheckoutSchema
+from .service import checkout as create_order, find_order, EmptyBasket
+
+orderschema = OrderSchema()
+
+
+@jwt_required()
+@body(CheckoutSchema())
+def checkout(args):
+    existing = find_order(current_user.id, args['idempotency_key'])
+    if existing is not None:
+        return jsonify(orderschema.dump(existing))
+
+    basket_cache.flush(current_user.id)
+    try:
+        order = create_order(current_user.id, **args)
+        db.session.commit()
+    except (EmptyBasket, ReservationError, IntegrityError) as e:
+        db.session.rollback()
+        # a concurrent retry with the same key may have won the race, taking
+        # the basket and its stock with it
+        existing = find_order(current_user.id, args['idempotency_key'])
+        if existing is not None:
+            return jsonify(orderschema.dump(existing))
+        if isinstance(e, EmptyBasket):
+            return jsonify(code=400, error='Basket is empty'), 400
+        if isinstance(e, ReservationError):
+            product_id = e.product_id if isinstance(e, OutOfStock) else None
+            return jsonify(code=409, error=e.args[0], product_id=product_id), 409
+        raise
+    return jsonify(orderschema.dump(order)), 201
@@ -0,0 +1,89 @@
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import select, insert, delete
+from api import db
+from api.models import Order, OrderItem, OrderStatus, DeliveryType, PaymentType, Basket, Product, \
+    ProductReserve, ProductAvailability
+from api.reservations.service import reserve, release, commit_to_order
+
+
+class EmptyBasket(Exception):
+    pass
+
+
+def find_order(user_id, idempotency_key):
+    return db.session.scalar(
+        Order.select().where(Order.user_fk == user_id, Order.idempotency_key == idempotency_key)
+    )
+
+
+def live_reservations(user_id, shop_id, product_ids):
+    rows = db.session.execute(
+        select(ProductReserve.id, ProductReserve.product_fk, ProductReserve.amount)
+        .join(ProductAvailability, ProductAvailability.id == ProductReserve.pa_fk)
+        .where(
+            ProductReserve.user_fk == user_id,
+            ProductReserve.order_fk.is_(None),
+            ProductReserve.expires_at > datetime.utcnow(),
+            ProductAvailability.shop_id == shop_id,
+            ProductReserve.product_fk.in_(product_ids),
+        )
+    ).all()
+    reserved = defaultdict(list)
+    for reserve_id, product_id, amount in rows:
+        reserved[product_id].append((reserve_id, amount))
+    return reserved
+
+
+def checkout(user_id, shop_id, delivery_type, payment_type, idempotency_key):
+    """Turn the user's (already flushed) basket into an order; the caller commits.
+
+    Reservations the user already holds in the shop are converted as they are;
+    a product reserved short is topped up, one reserved in excess is released
+    and reserved again for the exact amount. Raises EmptyBasket, OutOfStock or
+    ReservationExpired, after which the caller must roll back.
+    """
+    basket = db.session.execute(
+        select(Basket.product_fk, Basket.amount, Product.price)
+        .join(Product, Product.id == Basket.product_fk)
+        .where(Basket.user_fk == user_id)
+    ).all()
+    if not basket:
+        raise EmptyBasket()
+
+    reserved = live_reservations(user_id, shop_id, [product_id for product_id, amount, price in basket])
+    keep, surplus, shortfall = [], [], {}
+    for product_id, amount, price in basket:
+        held = reserved.get(product_id, [])
+        held_amount = sum(reserved_amount for reserve_id, reserved_amount in held)
+        if held_amount > amount:
+            surplus += [reserve_id for reserve_id, reserved_amount in held]
+            shortfall[product_id] = amount
+        else:
+            keep += [reserve_id for reserve_id, reserved_amount in held]
+            if held_amount < amount:
+                shortfall[product_id] = amount - held_amount
+    if surplus:
+        release(surplus, user_id=user_id)
+    if shortfall:
+        keep += [reservation.id for reservation in reserve(user_id, shop_id, shortfall)]
+
+    order = Order(
+        user_fk=user_id,
+        shop_fk=shop_id,
+        status=OrderStatus.awaiting_payment,
+        delivery_type=DeliveryType[delivery_type],
+        payment_type=PaymentType[payment_type],
+        sum=sum(price * amount for product_id, amount, price in basket),
+        idempotency_key=idempotency_key,
+    )
+    db.session.add(order)
+    db.session.flush()
+
+    commit_to_order(keep, order.id, user_id=user_id)
+    db.session.execute(insert(OrderItem), [
+        dict(order_fk=order.id, product_fk=product_id, price=price, amount=amount)
+        for product_id, amount, price in basket
+    ])
+    db.session.execute(delete(Basket).where(Basket.user_fk == user_id).execution_options(synchronize_session=False))
+    return order
@@ -1,15 +1,24 @@
 from flask import Blueprint
 from .routes import get_by_category, get_by_subcategory, create, get_last_created, get_one, add_specifications
-from .routes import get_specifications, edit_specification
+from .routes import get_specifications, edit_specification, filter_products, search, import_products
+from .commands import reindex, import_file
+from .fts import ensure_search_table
 
-product = Blueprint('product', __name__)
+product = Blueprint('product', __name__, cli_group='catalog')
+product.before_app_first_request(ensure_search_table)
 
 product.add_url_rule('/product/get_latest', 'product_get_latest', get_last_created, methods=['GET'])
 product.add_url_rule('/product/get_by_category', 'product_get_by_category', get_by_category, methods=['GET'])
 product.add_url_rule('/product/get_by_subcategory', 'product_get_by_subcategory', get_by_subcategory, methods=['GET'])
 product.add_url_rule('/product', 'product_create', create, methods=['POST'])
+product.add_url_rule('/product/import', 'product_import', import_products, methods=['PUT'])
 product.add_url_rule('/product/<int:product_id>', 'product_get_one', get_one, methods=['GET'])
+product.add_url_rule('/product/filter', 'product_filter', filter_products, methods=['POST'])
+product.add_url_rule('/product/search', 'product_search', search, methods=['GET'])
 
 product.add_url_rule('/product/specification', 'product_specifications_get', get_specifications, methods=['GET'])
 product.add_url_rule('/product/specification', 'product_specifications_add', add_specifications, methods=['POST'])
-product.add_url_rule('/product/specification', 'product_specifications_patch', edit_specification, methods=['PATCH'])
\ No newline at end of file
+product.add_url_rule('/product/specification', 'product_specifications_patch', edit_specification, methods=['PATCH'])
+
+product.cli.command('reindex')(reindex)
+product.cli.command('import')(import_file)
@@ -0,0 +1,28 @@
+import click
+from api.product.fts import reindex_all, ensure_search_table
+from api.product.importer import import_catalog, READERS
+
+
+def reindex():
+    """Rebuild the full-text search documents of every product."""
+    click.echo(f'Indexed {reindex_all()} products')
+
+
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(list(READERS)),
+              help='File format, guessed from the extension by default.')
+@click.option('--batch-size', default=1000, help='Rows written per transaction.')
+def import_file(path, file_format, batch_size):
+    """Import products from a CSV or JSON lines file."""
+    file_format = file_format or path.rsplit('.', 1)[-1].lower()
+    if file_format not in READERS:
+        raise click.BadParameter(f'Unknown format {file_format!r}', param_hint='--format')
+
+    ensure_search_table()
+    with open(path, 'rb') as stream:
+        report = import_catalog(stream, file_format, batch_size)
+
+    for error in report.errors:
+        click.echo(f'line {error["line"]}: {error["error"]}', err=True)
+    click.echo(f'Imported {report.imported} of {report.rows} rows ({report.failed} failed) '
+               f'in {report.seconds:.1f}s, {report.rows_per_second:.0f} rows/s')
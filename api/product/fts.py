@@ -0,0 +1,129 @@
+from itertools import groupby
+from sqlalchemy import DDL, event, select, text, bindparam
+from api import db
+from api.models import Product, ProductSpecification
+
+# ProductSearch holds one full-text document per product: an FTS5 virtual table
+# keyed by rowid on SQLite, a table with a GIN-indexed tsvector on Postgres.
+# Every statement is idempotent, so it also brings existing databases up to date.
+SEARCH_DDL = {
+    'sqlite': [
+        'CREATE VIRTUAL TABLE IF NOT EXISTS "ProductSearch" USING fts5(title, description, specifications)',
+    ],
+    'postgresql': [
+        'CREATE TABLE IF NOT EXISTS "ProductSearch" ('
+        'product_id INTEGER PRIMARY KEY REFERENCES "Product" (id) ON DELETE CASCADE, '
+        'title TEXT, description TEXT, specifications TEXT, '
+        'document TSVECTOR GENERATED ALWAYS AS ('
+        "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(description, '')), 'B') || "
+        "setweight(to_tsvector('simple', coalesce(specifications, '')), 'C')) STORED)",
+        'CREATE INDEX IF NOT EXISTS "ix_ProductSearch_document" ON "ProductSearch" USING GIN (document)',
+    ],
+}
+
+_search_table_ready = False
+
+
+def create_search_table(connection):
+    """Create ProductSearch and its index where they are missing."""
+    for statement in SEARCH_DDL.get(connection.dialect.name, ()):
+        connection.execute(text(statement))
+
+
+def ensure_search_table():
+    """create_search_table() on a connection of its own, once per process.
+
+    Runs before the first request and at the start of the catalog commands,
+    so databases created before ProductSearch existed get it without a
+    migration. A reindex fills it.
+    """
+    global _search_table_ready
+    if not _search_table_ready:
+        with db.get_engine().begin() as connection:
+            create_search_table(connection)
+        _search_table_ready = True
+
+
+event.listen(Product.__table__, 'after_create',
+             lambda target, connection, **kwargs: create_search_table(connection))
+event.listen(Product.__table__, 'before_drop', DDL(
+    'DROP TABLE IF EXISTS "ProductSearch"'
+).execute_if(dialect=('sqlite', 'postgresql')))
+
+
+def _id_column():
+    return 'rowid' if db.session.get_bind().dialect.name == 'sqlite' else 'product_id'
+
+
+def index_products(product_ids):
+    """Rebuild the search documents of the given products in the current transaction."""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    id_column = _id_column()
+
+    products = db.session.execute(
+        select(Product.id, Product.title, Product.description).where(Product.id.in_(product_ids))
+    ).all()
+    specifications = db.session.execute(
+        select(ProductSpecification.product_id, ProductSpecification.value)
+        .where(ProductSpecification.product_id.in_(product_ids))
+        .order_by(ProductSpecification.product_id)
+    )
+    values = {product_id: ' '.join(row.value for row in rows)
+              for product_id, rows in groupby(specifications, lambda row: row.product_id)}
+
+    db.session.execute(
+        text(f'DELETE FROM "ProductSearch" WHERE {id_column} IN :ids')
+        .bindparams(bindparam('ids', expanding=True)),
+        {'ids': product_ids}
+    )
+    if products:
+        db.session.execute(
+            text(f'INSERT INTO "ProductSearch" ({id_column}, title, description, specifications) '
+                 'VALUES (:id, :title, :description, :specifications)'),
+            [{'id': product.id, 'title': product.title, 'description': product.description,
+              'specifications': values.get(product.id, '')} for product in products]
+        )
+
+
+def fts_query(query):
+    """Quote every term of a user query for FTS5; the last term matches as a prefix."""
+    terms = ['"' + term.replace('"', '""') + '"' for term in query.split()]
+    if terms:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_product_ids(query, limit):
+    """Product ids matching `query`, best match first."""
+    if db.session.get_bind().dialect.name == 'sqlite':
+        if not (match := fts_query(query)):
+            return []
+        statement = text(
+            'SELECT rowid FROM "ProductSearch" WHERE "ProductSearch" MATCH :query '
+            'ORDER BY bm25("ProductSearch", 10.0, 5.0, 1.0) LIMIT :limit'
+        )
+        return db.session.scalars(statement, {'query': match, 'limit': limit}).all()
+
+    statement = text(
+        'SELECT product_id FROM "ProductSearch", plainto_tsquery(\'simple\', :query) query '
+        'WHERE document @@ query ORDER BY ts_rank(document, query) DESC LIMIT :limit'
+    )
+    return db.session.scalars(statement, {'query': query, 'limit': limit}).all()
+
+
+def reindex_all(batch_size=1000):
+    """Rebuild the documents of every product, committing once per batch."""
+    ensure_search_table()
+    count = 0
+    last_id = 0
+    while product_ids := db.session.scalars(
+        select(Product.id).where(Product.id > last_id).order_by(Product.id).limit(batch_size)
+    ).all():
+        index_products(product_ids)
+        db.session.commit()
+        count += len(product_ids)
+        last_id = product_ids[-1]
+    return count
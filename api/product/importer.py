@@ -0,0 +1,278 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+from sqlalchemy import select, delete, update, bindparam, or_
+from marshmallow import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+from api.app import db
+from api.models import Product, ProductSpecification, ProductAvailability, Category, SubCategory, ObjectStorage, \
+    Shop
+from api.schemas.product import ProductCreateSchema, SpecificationSchema
+from api.product.fts import index_products
+from api.product.index import index_specifications
+from api.filers.routes import facets_cache
+from api.category.routes import category_tree
+from api.cache import response_cache
+
+MAX_REPORTED_ERRORS = 1000
+
+# Rows are held to the constraints of the API; images and is_child are optional
+product_schema = ProductCreateSchema(partial=('image_fk', 'is_child'))
+specification_schema = SpecificationSchema(partial=('product_id',))
+# Optional columns left untouched on update when a row does not have them
+OPTIONAL_COLUMNS = {'description': 'description', 'subcategory': 'subcategory_fk', 'image': 'image_fk',
+                    'is_child': 'is_child'}
+
+
+class RowError(Exception):
+    pass
+
+
+def validation_message(messages):
+    return '; '.join(f'{field}: {" ".join(map(str, errors)) if isinstance(errors, list) else errors}'
+                     for field, errors in messages.items())
+
+
+def read_csv(stream):
+    """Yield (line, row) from a CSV file.
+
+    Columns named `spec:<key>` become specifications and `stock:<shop id>`
+    columns set the available amount in that shop.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    for row in reader:
+        specifications, stock = [], {}
+        for column in list(row):
+            if column.startswith('spec:'):
+                if value := row.pop(column):
+                    specifications.append({'key': column[5:], 'value': value, 'type': 'string'})
+            elif column.startswith('stock:'):
+                if value := row.pop(column):
+                    stock[column[6:]] = value
+        row['specifications'] = specifications
+        row['stock'] = stock
+        yield reader.line_num, row
+
+
+def read_jsonl(stream):
+    """Yield (line, row) from a JSON lines file; malformed lines yield the error instead."""
+    for line, text in enumerate(io.TextIOWrapper(stream, encoding='utf-8-sig'), 1):
+        if not text.strip():
+            continue
+        try:
+            yield line, json.loads(text)
+        except ValueError as e:
+            yield line, RowError(f'Invalid JSON: {e}')
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self.started_at = time.monotonic()
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    @property
+    def seconds(self):
+        return time.monotonic() - self.started_at
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0
+
+    def to_dict(self):
+        return {'rows': self.rows, 'imported': self.imported, 'failed': self.failed, 'errors': self.errors,
+                'seconds': round(self.seconds, 3), 'rows_per_second': round(self.rows_per_second, 1)}
+
+
+class CatalogImporter:
+    """Streaming upsert of products keyed by `sku`, one transaction per batch.
+
+    Rows reference their category and subcategory by title and their image by
+    ObjectStorage link or digest. Every row is validated on its own first, so
+    a bad row is reported on its line instead of failing its whole batch.
+    Products are updated or inserted in bulk; an update only overwrites the
+    optional columns the row has. The specifications of rows that list any
+    are replaced, and availability rows are fanned out to every shop. The
+    caches and the specification index are invalidated once, after the last
+    batch.
+    """
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.categories = {title: category_id for category_id, title in
+                           db.session.execute(select(Category.id, Category.title))}
+        self.subcategories = {(category_id, title): subcategory_id for subcategory_id, category_id, title in
+                              db.session.execute(select(SubCategory.id, SubCategory.category_fk, SubCategory.title))}
+        self.shops = set(db.session.scalars(select(Shop.id)))
+        self.product_ids = set()
+        self.category_ids = set()
+
+    def run(self, rows, report=None):
+        report = report or ImportReport()
+        rows = iter(rows)
+        try:
+            while batch := list(islice(rows, self.batch_size)):
+                self._import_batch(batch, report)
+        finally:
+            self._invalidate()
+        return report
+
+    def _import_batch(self, batch, report):
+        report.rows += len(batch)
+        images = self._resolve_images(batch)
+
+        products = {}
+        for line, row in batch:
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                if not isinstance(row, dict):
+                    raise RowError('Row must be an object')
+                sku = row_sku(row)
+                if sku in products:
+                    raise RowError(f'Duplicate sku {sku!r}, first seen on line {products[sku][0]}')
+                products[sku] = (line, self._product_values(row, images), row)
+            except (RowError, KeyError, TypeError, ValueError) as e:
+                report.error(line, str(e) if isinstance(e, RowError) else f'Invalid value: {e!r}')
+        if not products:
+            return
+
+        try:
+            self._write(products)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            for line, _, _ in products.values():
+                report.error(line, f'Batch failed: {getattr(e, "orig", e)}')
+        else:
+            report.imported += len(products)
+
+    def _write(self, products):
+        existing = dict(db.session.execute(select(Product.sku, Product.id).where(Product.sku.in_(products))).all())
+        updates = [dict(values, id=existing[sku]) for sku, (_, values, _) in products.items() if sku in existing]
+        inserts = [values for sku, (_, values, _) in products.items() if sku not in existing]
+        if updates:
+            db.session.bulk_update_mappings(Product, updates)
+        if inserts:
+            db.session.bulk_insert_mappings(Product, [dict({'is_child': False}, **values) for values in inserts])
+            existing.update(db.session.execute(
+                select(Product.sku, Product.id).where(Product.sku.in_([values['sku'] for values in inserts]))
+            ).all())
+        product_ids = [existing[sku] for sku in products]
+
+        self._replace_specifications(existing, products)
+        ProductAvailability.fan_out(Product.id.in_(product_ids))
+        self._set_stock(existing, products)
+        index_products(product_ids)
+        db.session.commit()
+        self.product_ids.update(product_ids)
+        self.category_ids.update(values['category_fk'] for _, values, _ in products.values())
+
+    def _invalidate(self):
+        """Expire the caches and the specification index once for every batch that was committed."""
+        if not self.product_ids:
+            return
+        facets_cache.invalidate()
+        index_specifications(self.product_ids)
+        category_tree.invalidate()
+        response_cache.invalidate(*(f'category:{category_id}' for category_id in self.category_ids),
+                                  *(f'product:{product_id}' for product_id in self.product_ids))
+        db.session.commit()
+
+    def _resolve_images(self, batch):
+        keys = {row['image'] for _, row in batch if isinstance(row, dict) and row.get('image')}
+        images = {}
+        if keys:
+            for image_id, link, digest in db.session.execute(
+                select(ObjectStorage.id, ObjectStorage.link, ObjectStorage.digest)
+                .where(or_(ObjectStorage.link.in_(keys), ObjectStorage.digest.in_(keys)))
+            ):
+                images[link] = images[digest] = image_id
+        return images
+
+    def _product_values(self, row, images):
+        if (category_id := self.categories.get(row.get('category'))) is None:
+            raise RowError(f'Unknown category {row.get("category")!r}')
+        subcategory_id = None
+        if row.get('subcategory'):
+            if (subcategory_id := self.subcategories.get((category_id, row['subcategory']))) is None:
+                raise RowError(f'Unknown subcategory {row["subcategory"]!r}')
+        image_id = None
+        if row.get('image'):
+            if (image_id := images.get(row['image'])) is None:
+                raise RowError(f'Unknown image {row["image"]!r}')
+
+        row['stock'] = {int(shop_id): int(amount) for shop_id, amount in (row.get('stock') or {}).items()}
+        if unknown := sorted(set(row['stock']) - self.shops):
+            raise RowError(f'Unknown shop {", ".join(map(str, unknown))}')
+        if any(amount < 0 for amount in row['stock'].values()):
+            raise RowError('Stock must not be negative')
+        row['specifications'] = [{'key': str(specification['key']), 'value': str(specification['value']),
+                                  'type': str(specification.get('type', 'string'))}
+                                 for specification in row.get('specifications') or []]
+        for specification in row['specifications']:
+            if errors := specification_schema.validate(specification):
+                raise RowError(validation_message(errors))
+
+        data = {'title': row.get('title'), 'description': row.get('description'), 'price': row.get('price'),
+                'is_child': row.get('is_child'), 'category_fk': category_id}
+        try:
+            values = product_schema.load({key: value for key, value in data.items() if value not in (None, '')})
+        except ValidationError as e:
+            raise RowError(validation_message(e.messages))
+
+        values.update(sku=row_sku(row), subcategory_fk=subcategory_id, image_fk=image_id,
+                      description=values.get('description'))
+        absent = {column for key, column in OPTIONAL_COLUMNS.items() if key not in row}
+        return {column: value for column, value in values.items() if column not in absent}
+
+    def _replace_specifications(self, product_ids, products):
+        replaced = {product_ids[sku]: row['specifications'] for sku, (_, _, row) in products.items()
+                    if row['specifications']}
+        if not replaced:
+            return
+        db.session.execute(
+            delete(ProductSpecification)
+            .where(ProductSpecification.product_id.in_(replaced))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.bulk_insert_mappings(ProductSpecification, [
+            dict(specification, product_id=product_id)
+            for product_id, specifications in replaced.items() for specification in specifications
+        ])
+
+    def _set_stock(self, product_ids, products):
+        amounts = [{'product': product_ids[sku], 'shop': shop_id, 'amount': amount}
+                   for sku, (_, _, row) in products.items() for shop_id, amount in row['stock'].items()]
+        if amounts:
+            db.session.execute(
+                update(ProductAvailability.__table__)
+                .where(ProductAvailability.product_id == bindparam('product'),
+                       ProductAvailability.shop_id == bindparam('shop'))
+                .values(amount=bindparam('amount')),
+                amounts
+            )
+
+
+def row_sku(row):
+    if not (sku := str(row.get('sku') or '').strip()):
+        raise RowError('Missing sku')
+    if len(sku) > Product.sku.type.length:
+        raise RowError(f'sku is longer than {Product.sku.type.length} characters')
+    return sku
+
+
+def import_catalog(stream, file_format, batch_size=1000):
+    """Import a CSV or JSON lines catalog from a binary stream and return the report."""
+    return CatalogImporter(batch_size).run(READERS[file_format](stream))
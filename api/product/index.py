@@ -0,0 +1,142 @@
+import time
+from threading import Lock
+from flask import current_app
+from sqlalchemy import select, event
+from sqlalchemy.orm import Session
+from api import db
+from api.cache import get_version, bump_version, set_versions
+from api.models import ProductSpecification, CacheVersion
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class SpecificationIndex:
+    """Inverted index of product specifications: (key, value) -> product ids."""
+
+    def __init__(self):
+        # shared index version the contents correspond to, see get_index()
+        self.version = 0
+        self._postings = {}
+        self._specifications = {}
+        self._products = {}
+        self._lock = Lock()
+
+    @classmethod
+    def build(cls):
+        index = cls()
+        # read the version first: changes made after it are re-applied by the next refresh
+        index.version = get_version(INDEX_VERSION)
+        rows = db.session.execute(
+            select(ProductSpecification.id, ProductSpecification.product_id,
+                   ProductSpecification.key, ProductSpecification.value)
+            .execution_options(yield_per=1000)
+        )
+        for specification_id, product_id, key, value in rows:
+            index._add(specification_id, product_id, key, value)
+        return index
+
+    def _add(self, specification_id, product_id, key, value):
+        self._specifications[specification_id] = (product_id, key, value)
+        self._products.setdefault(product_id, set()).add(specification_id)
+        self._postings.setdefault((key, value), set()).add(product_id)
+
+    def refresh(self, names):
+        """Re-read the specifications of the products behind `product_index:<id>` names."""
+        product_ids = {int(name[len(PRODUCT_PREFIX):]) for name in names}
+        for chunk in _chunks(sorted(product_ids), 500):
+            rows = db.session.execute(
+                select(ProductSpecification.id, ProductSpecification.product_id,
+                       ProductSpecification.key, ProductSpecification.value)
+                .where(ProductSpecification.product_id.in_(chunk))
+            ).all()
+            with self._lock:
+                for product_id in chunk:
+                    for specification_id in self._products.pop(product_id, ()):
+                        _, key, value = self._specifications.pop(specification_id)
+                        posting = self._postings.get((key, value))
+                        if posting is not None:
+                            posting.discard(product_id)
+                            if not posting:
+                                del self._postings[(key, value)]
+                for specification_id, product_id, key, value in rows:
+                    self._add(specification_id, product_id, key, value)
+
+    def match(self, selections):
+        """Product ids matching every (key, values) selection; any value of a key matches."""
+        with self._lock:
+            result = None
+            for key, values in sorted(selections, key=lambda selection: self._size(*selection)):
+                matched = set().union(*(self._postings.get((key, value), ()) for value in values))
+                result = matched if result is None else result & matched
+                if not result:
+                    break
+            return result if result is not None else set()
+
+    def _size(self, key, values):
+        return sum(len(self._postings.get((key, value), ())) for value in values)
+
+
+# Shared version of the index plus one `product_index:<product id>` row per
+# product, holding the index version under which its specifications last changed
+INDEX_VERSION = 'product_index'
+PRODUCT_PREFIX = INDEX_VERSION + ':'
+
+_index = None
+_index_lock = Lock()
+_checked_at = None
+
+
+def get_index():
+    """This worker's index, built once and then kept current with deltas.
+
+    The shared version is polled at most every CACHE_VERSION_CHECK_INTERVAL
+    seconds; when it moved, only the products changed since are re-read.
+    """
+    global _index, _checked_at
+    now = time.monotonic()
+    if _index is not None and _checked_at is not None \
+            and now - _checked_at < current_app.config['CACHE_VERSION_CHECK_INTERVAL']:
+        return _index
+    with _index_lock:
+        if _index is None:
+            _index = SpecificationIndex.build()
+        else:
+            version = get_version(INDEX_VERSION)
+            if version != _index.version:
+                _index.refresh(db.session.scalars(
+                    select(CacheVersion.name)
+                    .where(CacheVersion.name.startswith(PRODUCT_PREFIX, autoescape=True),
+                           CacheVersion.version > _index.version, CacheVersion.version <= version)
+                ).all())
+                _index.version = version
+        _checked_at = now
+    return _index
+
+
+def index_specifications(product_ids):
+    """Record that the specifications of `product_ids` changed; the caller commits.
+
+    Every worker, this one included, applies the change on its next index
+    check after the commit; a rollback leaves the indexes untouched.
+    """
+    if not product_ids:
+        return
+    # The version row stays locked until the commit, so versions are committed in order
+    version = bump_version(INDEX_VERSION)
+    set_versions([f'{PRODUCT_PREFIX}{product_id}' for product_id in product_ids], version)
+    db.session.info['index_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _check_index_soon(session):
+    global _checked_at
+    if session.info.pop('index_changed', False):
+        _checked_at = None
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_index_changes(session, previous_transaction):
+    session.info.pop('index_changed', None)
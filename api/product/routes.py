@@ -1,37 +1,158 @@
-from flask import jsonify
+from bisect import bisect_right
+from flask import jsonify, request
 
-from api.models import Product, ProductAvailability, Shop, ProductSpecification
+from api.models import Product, ProductAvailability, ProductSpecification, ObjectStorage, \
+    ObjectStorageDerivative, Category, Shop, RATING_STARS
 from api import db
 from api.schemas.product import ProductSchema, ProductCreateSchema, SpecificationSchema, GetSpecificationSchema
-from api.schemas.product import ModSpecificationSchema
-from api.schemas.category import SearchByCategorySchema, SearchBySubCategorySchema
+from api.schemas.product import ModSpecificationSchema, ProductPageSchema, ProductFilterSchema, ProductIdsSchema
+from api.schemas.product import ProductSearchSchema
+from api.schemas.compiled import compiled
+from api.schemas.pagination import ProductPaginationSchema
+from api.schemas.category import ProductsByCategorySchema, ProductsBySubCategorySchema
 from apifairy import response, body, arguments
-from api.utils import permission_required
+from apifairy.exceptions import ValidationError
+from api.utils import permission_required, keyset_page
+from api.cache import conditional, response_cache, ignore_changes
+from api.filers.routes import invalidate_facets
+from api.category.routes import category_tree
+from api.product.index import get_index, index_specifications
+from api.product.fts import index_products, search_product_ids
+from api.product.importer import import_catalog, READERS
 from flask_jwt_extended import jwt_required
-from sqlalchemy import desc
+from sqlalchemy import select, exists, func
+from sqlalchemy.orm import joinedload, selectinload
 
-product_schema = ProductSchema(many=True)
-single_product_schema = ProductSchema()
+product_schema = compiled(ProductSchema(many=True))
+product_page_schema = compiled(ProductPageSchema())
+product_pagination = ProductPaginationSchema()
+single_product_schema = compiled(ProductSchema())
 product_create = ProductCreateSchema()
-search_by_category = SearchByCategorySchema()
-search_by_subcategory = SearchBySubCategorySchema()
+search_by_category = ProductsByCategorySchema()
+search_by_subcategory = ProductsBySubCategorySchema()
 specifications_schema = SpecificationSchema(many=True)
 get_specification_schema = GetSpecificationSchema()
 mod_specification_schema = ModSpecificationSchema(many=True)
+product_filter_schema = ProductFilterSchema()
+product_ids_schema = ProductIdsSchema()
+product_search_schema = ProductSearchSchema()
 
+# Above this many index matches the ids are not inlined into SQL; the
+# specification filter runs in the database instead.
+MAX_INDEX_CANDIDATES = 5000
 
+# Loader options covering every relationship ProductSchema touches, so a list
+# of products is serialized with a fixed number of queries.
+product_list_options = (
+    joinedload(Product.image).selectinload(ObjectStorage.derivatives),
+    joinedload(Product.categories),
+    selectinload(Product.specifications),
+    selectinload(Product.available).joinedload(ProductAvailability.shop),
+    selectinload(Product.referenced_product).options(
+        joinedload(Product.image),
+        selectinload(Product.specifications),
+    ),
+)
+
+# Keyset orderings: (columns, descending). The trailing id makes each ordering total.
+product_orderings = {
+    'latest': ((Product.created_at, Product.id), True),
+    'price_asc': ((Product.price, Product.id), False),
+    'price_desc': ((Product.price, Product.id), True),
+}
+
+
+def product_page_tags(data):
+    """Tags of a product page: its category plus every product it shows."""
+    tags = {'shop', f'category:{request.args.get("id", type=int)}'}
+    for item in data['items']:
+        tags.add(f'product:{item["id"]}')
+        tags.update(f'product:{referenced["id"]}' for referenced in item['referenced_product'])
+    return tags
+
+
+def get_product_page(query, args):
+    columns, descending = product_orderings[args['order']]
+    return keyset_page(query.options(*product_list_options), columns, descending, args['limit'], args['next'])
+
+
+@response_cache.cached(product_page_tags)
 @arguments(search_by_category)
-@response(product_schema)
+@response(product_page_schema)
 def get_by_category(args):
-    products = db.session.scalars(Product.select().where(Product.category_fk == args['id']))
-    return products
+    return get_product_page(Product.select().where(Product.category_fk == args['id']), args)
 
 
 @arguments(search_by_subcategory)
-@response(product_schema)
+@response(product_page_schema)
 def get_by_subcategory(args):
-    products = db.session.scalars(Product.select().where(Product.subcategory_fk == args['id']))
-    return products
+    return get_product_page(Product.select().where(Product.subcategory_fk == args['id']), args)
+
+
+@body(product_filter_schema)
+@response(product_ids_schema)
+def filter_products(args):
+    """Ids of the matching products in id order, `limit` at a time."""
+    after = args['next']
+    if after is not None:
+        if len(after) != 1 or type(after[0]) is not int:
+            raise ValidationError(400, {'json': {'next': ['Invalid cursor']}})
+        after = after[0]
+    limit = args['limit']
+
+    selections = [(selection['key'], selection['values']) for selection in args['specifications']]
+    candidates = get_index().match(selections) if selections else None
+    if candidates is not None and not candidates:
+        return {'ids': [], 'total': 0, 'next': None}
+
+    has_product_filters = args.get('category_id') is not None or args.get('price_min') is not None \
+        or args.get('price_max') is not None or args['in_stock']
+    if candidates is not None and not has_product_filters:
+        ids = sorted(candidates)
+        page = ids[bisect_right(ids, after):] if after is not None else ids
+        return ids_page(page[:limit + 1], limit, len(ids))
+
+    query = select(Product.id)
+    if candidates is not None and len(candidates) <= MAX_INDEX_CANDIDATES:
+        query = query.where(Product.id.in_(candidates))
+    else:
+        for key, values in selections:
+            query = query.where(Product.id.in_(
+                select(ProductSpecification.product_id)
+                .where(ProductSpecification.key == key, ProductSpecification.value.in_(values))
+            ))
+    if args.get('category_id') is not None:
+        query = query.where(Product.category_fk == args['category_id'])
+    if args.get('price_min') is not None:
+        query = query.where(Product.price >= args['price_min'])
+    if args.get('price_max') is not None:
+        query = query.where(Product.price <= args['price_max'])
+    if args['in_stock']:
+        query = query.where(exists().where(ProductAvailability.product_id == Product.id,
+                                           ProductAvailability.amount > 0))
+
+    total = db.session.scalar(select(func.count()).select_from(query.subquery()))
+    if after is not None:
+        query = query.where(Product.id > after)
+    ids = db.session.scalars(query.order_by(Product.id).limit(limit + 1)).all()
+    return ids_page(ids, limit, total)
+
+
+def ids_page(ids, limit, total):
+    """`ids` holds up to one id more than the page, telling whether another page follows."""
+    page = ids[:limit]
+    return {'ids': page, 'total': total, 'next': [page[-1]] if len(ids) > limit else None}
+
+
+@arguments(product_search_schema)
+@response(product_schema)
+def search(args):
+    product_ids = search_product_ids(args['q'], args['limit'])
+    products = db.session.scalars(
+        Product.select().options(*product_list_options).where(Product.id.in_(product_ids))
+    ).all()
+    rank = {product_id: position for position, product_id in enumerate(product_ids)}
+    return sorted(products, key=lambda product: rank[product.id])
 
 
 @jwt_required()
@@ -41,29 +162,60 @@ def get_by_subcategory(args):
 def create(args):
     product = Product(**args)
     db.session.add(product)
-    db.session.commit()
-
-    shops = db.session.scalars(Shop.select())
-    for shop in shops:
-        db.session.add(ProductAvailability(product=product, shop=shop, amount=0))
+    db.session.flush()
+    ProductAvailability.fan_out(Product.id == product.id)
+    index_products([product.id])
+    response_cache.invalidate(f'category:{product.category_fk}')
+    category_tree.invalidate()
     db.session.commit()
 
     return product
 
 
-@response(product_schema)
-def get_last_created():
-    return db.session.scalars(
-        Product.select().order_by(
-            desc(Product.created_at)
-        )
-    )
+@jwt_required()
+@permission_required('admin.product.import')
+def import_products():
+    if 'file' not in request.files:
+        return jsonify(code=400, error='File not found in payload'), 400
+
+    file = request.files['file']
+    file_format = request.args.get('format') or file.filename.rsplit('.', 1)[-1].lower()
+    if file_format not in READERS:
+        return jsonify(code=400, error=f'Unsupported format, expected one of {", ".join(READERS)}'), 400
+
+    report = import_catalog(file.stream, file_format)
+    return jsonify(code=200, **report.to_dict())
+
+
+@arguments(product_pagination)
+@response(product_page_schema)
+def get_last_created(args):
+    return get_product_page(Product.select(), args)
+
+
+rating_columns = [Product.rating_sum, Product.rating_count,
+                  *(getattr(Product, f'rating_{stars}') for stars in RATING_STARS)]
+# every review moves these; the product page covers them with its fingerprint
+# instead of bumping the table:Product counter the whole catalog depends on
+ignore_changes(*rating_columns)
+
+
+def product_fingerprint(product_id):
+    stock = db.session.execute(
+        select(ProductAvailability.shop_id, ProductAvailability.amount)
+        .where(ProductAvailability.product_id == product_id)
+        .order_by(ProductAvailability.shop_id)
+    ).all()
+    ratings = db.session.execute(select(*rating_columns).where(Product.id == product_id)).first()
+    return [stock, ratings]
 
 
+@conditional(Product, ProductSpecification, Category, ObjectStorage, ObjectStorageDerivative, Shop,
+             max_age=10, fingerprint=product_fingerprint)
 @response(single_product_schema)
 def get_one(product_id):
     return db.session.scalar(
-        Product.select().where(Product.id == product_id)
+        Product.select().options(*product_list_options).where(Product.id == product_id)
     )
 
 # @jwt_required()
@@ -81,6 +233,11 @@ def add_specifications(args):
         commit_list.append(ProductSpecification(**arg))
 
     db.session.add_all(commit_list)
+    db.session.flush()
+    index_specifications({specification.product_id for specification in commit_list})
+    invalidate_facets({specification.product_id for specification in commit_list})
+    index_products({specification.product_id for specification in commit_list})
+    response_cache.invalidate(*{f'product:{specification.product_id}' for specification in commit_list})
     db.session.commit()
 
     return commit_list
@@ -105,6 +262,10 @@ def edit_specification(args):
             commit_list.append(specification)
 
     db.session.add_all(commit_list)
+    index_specifications({specification.product_id for specification in commit_list})
+    invalidate_facets({specification.product_id for specification in commit_list})
+    index_products({specification.product_id for specification in commit_list})
+    response_cache.invalidate(*{f'product:{specification.product_id}' for specification in commit_list})
     db.session.commit()
 
     return commit_list
@@ -0,0 +1,11 @@
+from flask import Blueprint
+from .routes import create, cancel, get
+from .commands import expire
+
+reservations = Blueprint('reservations', __name__, url_prefix='/reservations', cli_group='reservations')
+
+reservations.add_url_rule('/create', 'reservations_create', create, methods=['POST'])
+reservations.add_url_rule('/cancel', 'reservations_cancel', cancel, methods=['POST'])
+reservations.add_url_rule('/get', 'reservations_get', get, methods=['GET'])
+
+reservations.cli.command('expire')(expire)
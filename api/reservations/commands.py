@@ -0,0 +1,10 @@
+import click
+from api import db
+from .service import expire_reservations
+
+
+def expire():
+    """Return the stock of expired reservations; run it from cron."""
+    released = expire_reservations()
+    db.session.commit()
+    click.echo(f'Released {released} expired reservations')
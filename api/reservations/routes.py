@@ -0,0 +1,46 @@
+from collections import Counter
+from datetime import datetime
+from flask import jsonify
+from apifairy import response, body
+from flask_jwt_extended import jwt_required, current_user
+from api import db
+from api.models import ProductReserve
+from api.schemas.reservations import ReservationSchema, ReserveSchema, ReservationIdsSchema
+from .service import reserve, release, OutOfStock
+
+reservationschemamany = ReservationSchema(many=True)
+
+
+@jwt_required()
+@body(ReserveSchema())
+def create(args):
+    items = Counter()
+    for item in args['items']:
+        items[item['product_id']] += item['amount']
+    try:
+        reserves = reserve(current_user.id, args['shop_id'], items)
+    except OutOfStock as e:
+        db.session.rollback()
+        return jsonify(code=409, error=e.args[0], product_id=e.product_id), 409
+    db.session.commit()
+    return jsonify(reservationschemamany.dump(reserves))
+
+
+@jwt_required()
+@body(ReservationIdsSchema())
+def cancel(args):
+    released = release(args['ids'], user_id=current_user.id)
+    db.session.commit()
+    return jsonify(code=200, released=released)
+
+
+@jwt_required()
+@response(reservationschemamany)
+def get():
+    return db.session.scalars(
+        ProductReserve.select().where(
+            ProductReserve.user_fk == current_user.id,
+            ProductReserve.order_fk.is_(None),
+            ProductReserve.expires_at > datetime.utcnow(),
+        ).order_by(ProductReserve.id)
+    )
@@ -0,0 +1,136 @@
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import select, update, delete, func, and_
+from api import db
+from api.models import ProductAvailability, ProductReserve
+from api.cache import response_cache
+
+
+class ReservationError(Exception):
+    pass
+
+
+class OutOfStock(ReservationError):
+    def __init__(self, product_id, amount):
+        super().__init__(f'Not enough stock of product {product_id} for {amount} items')
+        self.product_id = product_id
+        self.amount = amount
+
+
+class ReservationExpired(ReservationError):
+    def __init__(self, reserve_ids):
+        super().__init__('Reservation has expired or was already used')
+        self.reserve_ids = reserve_ids
+
+
+def reserve(user_id, shop_id, items, ttl=None):
+    """Take `items` ({product_id: amount}) out of a shop's stock for a user.
+
+    Every decrement is a conditional UPDATE (`amount >= requested`), so stock
+    never goes negative however many checkouts race for it. Rows are updated in
+    availability id order, which keeps concurrent multi-item reservations from
+    deadlocking on each other. On OutOfStock earlier decrements are still in
+    the transaction: the caller must roll back. The products' cached pages
+    are invalidated with the commit. Returns the new reserves.
+    """
+    if any(amount <= 0 for amount in items.values()):
+        raise ValueError('Reserved amount must be positive')
+
+    availability = dict(db.session.execute(
+        select(ProductAvailability.product_id, ProductAvailability.id)
+        .where(ProductAvailability.shop_id == shop_id, ProductAvailability.product_id.in_(items))
+    ).all())
+    missing = next((product_id for product_id in items if product_id not in availability), None)
+    if missing is not None:
+        raise OutOfStock(missing, items[missing])
+
+    for product_id, pa_id in sorted(availability.items(), key=lambda pair: pair[1]):
+        amount = items[product_id]
+        result = db.session.execute(
+            update(ProductAvailability)
+            .where(ProductAvailability.id == pa_id, ProductAvailability.amount >= amount)
+            .values(amount=ProductAvailability.amount - amount)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            raise OutOfStock(product_id, amount)
+    response_cache.invalidate(*(f'product:{product_id}' for product_id in items))
+
+    expires_at = datetime.utcnow() + (ttl or current_app.config['RESERVATION_TTL'])
+    reserves = [
+        ProductReserve(user_fk=user_id, product_fk=product_id, pa_fk=availability[product_id],
+                       amount=amount, expires_at=expires_at)
+        for product_id, amount in items.items()
+    ]
+    db.session.add_all(reserves)
+    db.session.flush()
+    return reserves
+
+
+def _restore(*conditions):
+    """Put the stock of matching unordered reservations back and delete them.
+
+    Reservations are locked first, then availability rows are restored with a
+    single UPDATE summing every matching reservation per row, so a bulk expiry
+    costs three statements regardless of how many reservations it covers.
+    The UPDATE and DELETE repeat `conditions`: where the lock is not enforced
+    (SQLite), a reservation ordered since the SELECT is left alone. Returns
+    the number of reservations released.
+    """
+    conditions = (ProductReserve.order_fk.is_(None), *conditions)
+    reserves = db.session.execute(
+        select(ProductReserve.id, ProductReserve.product_fk).where(*conditions)
+        .order_by(ProductReserve.id).with_for_update()
+    ).all()
+    if not reserves:
+        return 0
+    reserve_ids = [reserve_id for reserve_id, product_id in reserves]
+
+    locked = and_(ProductReserve.id.in_(reserve_ids), *conditions)
+    reserved = select(func.sum(ProductReserve.amount)) \
+        .where(ProductReserve.pa_fk == ProductAvailability.id, locked) \
+        .scalar_subquery()
+    db.session.execute(
+        update(ProductAvailability)
+        .where(ProductAvailability.id.in_(select(ProductReserve.pa_fk).where(locked)))
+        .values(amount=ProductAvailability.amount + reserved)
+        .execution_options(synchronize_session=False)
+    )
+    result = db.session.execute(delete(ProductReserve).where(locked).execution_options(synchronize_session=False))
+    response_cache.invalidate(*{f'product:{product_id}' for reserve_id, product_id in reserves})
+    return result.rowcount
+
+
+def release(reserve_ids, user_id=None):
+    """Cancel reservations that have not been turned into an order yet."""
+    conditions = [ProductReserve.id.in_(reserve_ids)]
+    if user_id is not None:
+        conditions.append(ProductReserve.user_fk == user_id)
+    return _restore(*conditions)
+
+
+def expire_reservations(now=None):
+    """Release every reservation past its expiry in one pass."""
+    return _restore(ProductReserve.expires_at <= (now or datetime.utcnow()))
+
+
+def commit_to_order(reserve_ids, order_id, user_id=None):
+    """Attach live reservations to an order; the stock stays taken for good.
+
+    Raises ReservationExpired unless every reservation was still unordered and
+    unexpired, in which case the caller must roll back.
+    """
+    conditions = [
+        ProductReserve.id.in_(reserve_ids),
+        ProductReserve.order_fk.is_(None),
+        ProductReserve.expires_at > datetime.utcnow(),
+    ]
+    if user_id is not None:
+        conditions.append(ProductReserve.user_fk == user_id)
+    result = db.session.execute(
+        update(ProductReserve).where(*conditions).values(order_fk=order_id)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != len(set(reserve_ids)):
+        raise ReservationExpired(reserve_ids)
+    return result.rowcount
@@ -1,7 +1,10 @@
 from flask import Blueprint
 from .routes import create, get
+from .commands import recompute
 
-reviews = Blueprint('reviews', __name__, url_prefix='/reviews')
+reviews = Blueprint('reviews', __name__, url_prefix='/reviews', cli_group='reviews')
 
 reviews.add_url_rule('/create', 'review_create', create, methods=['POST'])
-reviews.add_url_rule('/<int:product_id>', 'reviews_get', get, methods=['GET'])
\ No newline at end of file
+reviews.add_url_rule('/<int:product_id>', 'reviews_get', get, methods=['GET'])
+
+reviews.cli.command('recompute')(recompute)
@@ -0,0 +1,23 @@
+import click
+from sqlalchemy import update, select, func
+from api import db
+from api.models import Product, Reviews, RATING_STARS
+
+
+def recompute():
+    """Recompute rating aggregates of every product from the Reviews table."""
+    def aggregate(column, *conditions):
+        return select(column).where(Reviews.product_id == Product.id, *conditions).scalar_subquery()
+
+    values = {
+        Product.rating_sum: aggregate(func.coalesce(func.sum(Reviews.stars), 0)),
+        Product.rating_count: aggregate(func.count(Reviews.id)),
+    }
+    for stars in RATING_STARS:
+        values[getattr(Product, f'rating_{stars}')] = aggregate(func.count(Reviews.id), Reviews.stars == stars)
+
+    result = db.session.execute(
+        update(Product).values(values).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    click.echo(f'Recomputed ratings of {result.rowcount} products')
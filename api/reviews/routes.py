@@ -2,12 +2,18 @@ from api.models import Reviews, Product, User
 from api import db
 from apifairy import response, body
 from api.utils import permission_required
+from api.cache import conditional, response_cache, ignore_changes
 from flask_jwt_extended import jwt_required, current_user
 from api.schemas.reviews import ReviewsSchema
+from sqlalchemy import update
 
 reviewschema = ReviewsSchema()
 reviewschemamany = ReviewsSchema(many=True)
 
+# reviews only show the author's name, logins and password changes must not
+# move their validators
+ignore_changes(User.password, User.token_version, User.email_confirmed)
+
 
 @jwt_required()
 @permission_required('user.review.create')
@@ -16,10 +22,22 @@ reviewschemamany = ReviewsSchema(many=True)
 def create(args):
     review = Reviews(**args, user_id=current_user.id)
     db.session.add(review)
+
+    # Aggregates are incremented in SQL so concurrent reviews don't lose updates
+    rating_column = f'rating_{review.stars}'
+    db.session.execute(
+        update(Product).where(Product.id == review.product_id).values({
+            Product.rating_sum: Product.rating_sum + review.stars,
+            Product.rating_count: Product.rating_count + 1,
+            getattr(Product, rating_column): getattr(Product, rating_column) + 1,
+        })
+    )
+    response_cache.invalidate(f'product:{review.product_id}')
     db.session.commit()
     return review
 
 
+@conditional(User, per={Reviews.product_id: 'product_id'})
 @response(reviewschemamany)
 def get(product_id):
     reviews = db.session.scalars(Reviews.select().where(Reviews.product_id == product_id))
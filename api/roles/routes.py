@@ -3,13 +3,17 @@ from flask import request, jsonify
 from flask_jwt_extended import jwt_required
 from api import db
 from api.models import User, UserRole, UserRolePermission, Permission
-from api.utils import get_first, catch_exception, permission_required
-from api.schemas.roles import UserRoleSchema
+from api.utils import get_first, catch_exception, permission_required, rights_cache, keyset_page
+from api.auth.identity import invalidate_identity
+from api.schemas.roles import UserRoleSchema, RoleUsersPageSchema
+from api.schemas.pagination import PaginationSchema
 from api.schemas.users import UserSchema
-from apifairy import response
-from sqlalchemy import and_
+from apifairy import response, arguments
+from sqlalchemy import and_, select, func
 
 roles_schema = UserRoleSchema(many=True)
+role_users_page_schema = RoleUsersPageSchema()
+pagination_schema = PaginationSchema()
 user_schema = UserSchema()
 
 
@@ -17,8 +21,35 @@ user_schema = UserSchema()
 @permission_required('admin.roles.read')
 @response(roles_schema)
 def get_all():
-    users = db.session.scalars(UserRole.select())
-    return users
+    roles = {
+        role_id: dict(id=role_id, roleName=name, roleDescription=description, is_default=is_default,
+                      user_count=user_count, permissions=[])
+        for role_id, name, description, is_default, user_count in db.session.execute(
+            select(UserRole.id, UserRole.roleName, UserRole.roleDescription, UserRole.is_default,
+                   func.count(User.id))
+            .outerjoin(User, User.role_fk == UserRole.id)
+            .group_by(UserRole.id)
+            .order_by(UserRole.id)
+        )
+    }
+    permissions = db.session.execute(
+        select(UserRolePermission.role_fk, Permission.id, Permission.key)
+        .join(Permission, Permission.id == UserRolePermission.permission_fk)
+        .where(UserRolePermission.role_fk.in_(roles))
+        .order_by(UserRolePermission.id)
+    ) if roles else ()
+    for role_id, permission_id, key in permissions:
+        roles[role_id]['permissions'].append(dict(permission_fk=permission_id, key=key))
+    return list(roles.values())
+
+
+@jwt_required()
+@permission_required('admin.roles.read')
+@arguments(pagination_schema)
+@response(role_users_page_schema)
+def get_users(args, role_id):
+    return keyset_page(User.select().where(User.role_fk == role_id), (User.id,), False,
+                       args['limit'], args['next'])
 
 
 @jwt_required()
@@ -65,6 +96,7 @@ def assign():
     user.role = role
 
     db.session.add(user)
+    invalidate_identity(user.id)
     db.session.commit()
     return jsonify(code=200)
 
@@ -88,6 +120,7 @@ def add_permission():
     role_permission = UserRolePermission(role_fk=roleId, permission=permission)
 
     db.session.add(role_permission)
+    rights_cache.invalidate()
     db.session.commit()
 
     return jsonify(id=role_permission.id)
@@ -107,6 +140,7 @@ def delete_permission():
                                                UserRolePermission.permission_fk == permissionId)))
 
     db.session.delete(role_permission)
+    rights_cache.invalidate()
     db.session.commit()
 
     return jsonify(code=200)
@@ -11,8 +11,12 @@ from .shop import shop
 from .imagecarousel import imagecarousel
 from .reviews import reviews
 from .filers import filters
+from .reservations import reservations
+from .basket import basket
+from .order import order
+from .export import export
 
-from flask_jwt_extended import get_jwt, create_access_token, get_jwt_identity, set_access_cookies
+from flask_jwt_extended import get_jwt, create_access_token, current_user, set_access_cookies
 from datetime import datetime, timedelta, timezone
 
 router = Blueprint('router', __name__)
@@ -28,6 +32,10 @@ router.register_blueprint(shop)
 router.register_blueprint(imagecarousel)
 router.register_blueprint(reviews)
 router.register_blueprint(filters)
+router.register_blueprint(reservations)
+router.register_blueprint(basket)
+router.register_blueprint(order)
+router.register_blueprint(export)
 
 
 @auth.after_request
@@ -37,7 +45,7 @@ def refresh_expiring_jwts(response):
         now = datetime.now(timezone.utc)
         target_timestamp = datetime.timestamp(now + timedelta(days=1))
         if target_timestamp > exp_timestamp:
-            access_token = create_access_token(identity=get_jwt_identity())
+            access_token = create_access_token(identity=current_user)
             set_access_cookies(response, access_token)
         return response
     except (RuntimeError, KeyError):
@@ -0,0 +1,32 @@
+from api.app import ma
+from marshmallow import validate
+
+
+class BasketItemSchema(ma.Schema):
+    class Meta:
+        ordered = True
+
+    product_id = ma.Integer(required=True)
+    amount = ma.Integer(required=True, validate=validate.Range(min=1, max=999))
+    title = ma.String(dump_only=True)
+    price = ma.Float(dump_only=True)
+    image_link = ma.String(dump_only=True)
+    in_stock = ma.Integer(dump_only=True)
+
+
+class BasketSchema(ma.Schema):
+    class Meta:
+        ordered = True
+
+    items = ma.List(ma.Nested(BasketItemSchema))
+    total = ma.Float()
+
+
+class BasketEditSchema(ma.Schema):
+    product_id = ma.Integer(required=True)
+    amount = ma.Integer(load_default=1, validate=validate.Range(min=0, max=999))
+
+
+class BasketMergeSchema(ma.Schema):
+    items = ma.List(ma.Nested(BasketItemSchema(only=('product_id', 'amount'))), required=True,
+                    validate=validate.Length(max=100))
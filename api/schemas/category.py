@@ -1,5 +1,6 @@
 from api.app import ma
 from api.models import Category, SubCategory
+from .pagination import ProductPaginationSchema
 
 
 class SubCategorySchema(ma.SQLAlchemySchema):
@@ -9,6 +10,7 @@ class SubCategorySchema(ma.SQLAlchemySchema):
 
     id = ma.auto_field(dump_only=True)
     title = ma.auto_field(dump_only=True)
+    product_count = ma.Integer(dump_only=True)
 
 
 class CategorySchema(ma.SQLAlchemySchema):
@@ -18,6 +20,8 @@ class CategorySchema(ma.SQLAlchemySchema):
 
     id = ma.auto_field()
     title = ma.auto_field()
+    not_for_children = ma.auto_field(dump_only=True)
+    product_count = ma.Integer(dump_only=True)
 
     subcategories = ma.Nested(SubCategorySchema, dump_only=True, many=True)
 
@@ -45,4 +49,12 @@ class SearchBySubCategorySchema(ma.SQLAlchemySchema):
     id = ma.auto_field(required=True)
 
 
+class ProductsByCategorySchema(SearchByCategorySchema, ProductPaginationSchema):
+    pass
+
+
+class ProductsBySubCategorySchema(SearchBySubCategorySchema, ProductPaginationSchema):
+    pass
+
+
 
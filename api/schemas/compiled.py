@@ -0,0 +1,142 @@
+"""Compiled dumpers for hot read schemas.
+
+compiled(schema) generates one plain Python function per (nested) schema from
+its declared dump fields, so dumping skips marshmallow's per-field dispatch
+while producing the same output. Field types without a fast path fall back to
+the field's own serialize(). Responses are encoded with orjson when it is
+installed.
+"""
+from flask import current_app, jsonify
+from marshmallow import fields, missing
+from marshmallow.utils import ensure_text_type
+from marshmallow_sqlalchemy.fields import Related
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def _get_value(obj, key):
+    if type(obj) is dict:
+        return obj.get(key, missing)
+    return getattr(obj, key, missing)
+
+
+def _has_dump_hooks(schema):
+    return any(schema._hooks[(tag, many)] for tag in ('pre_dump', 'post_dump') for many in (False, True))
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+def _boolean(field):
+    return lambda value: field._serialize(value, None, None)
+
+
+def _converter(field):
+    """A callable turning a non-None value into its dumped form, or None if there is no fast path."""
+    field_type = type(field)
+    if field_type is fields.Integer and not field.as_string:
+        return int
+    if field_type is fields.Float and not field.as_string:
+        return float
+    if field_type is fields.String:
+        return ensure_text_type
+    if field_type is fields.Boolean:
+        return _boolean(field)
+    if field_type is fields.DateTime and field.format in (None, 'iso'):
+        return _isoformat
+    if field_type is fields.Raw:
+        return lambda value: value
+    if isinstance(field, Related) and len(field.related_keys) == 1:
+        key = field.related_keys[0].key
+        return lambda value: getattr(value, key, None)
+    if isinstance(field, fields.Nested):
+        schema = field.schema
+        if _has_dump_hooks(schema):
+            return None
+        dump_one = _compile(schema)
+        if schema.many or field.many:
+            return lambda value: [dump_one(item) for item in value]
+        return dump_one
+    if isinstance(field, fields.List):
+        inner = _converter(field.inner)
+        if inner is None:
+            return None
+        return lambda value: [None if item is None else inner(item) for item in value]
+    if field_type in (fields.Dict, fields.Mapping):
+        keys = _converter(field.key_field) if field.key_field else (lambda key: key)
+        values = _converter(field.value_field) if field.value_field else (lambda value: value)
+        if keys is None or values is None:
+            return None
+        return lambda value: {keys(key): None if item is None else values(item) for key, item in value.items()}
+    return None
+
+
+def _compile(schema):
+    dump_one = getattr(schema, '_compiled_dump', None)
+    if dump_one is not None:
+        return dump_one
+
+    namespace = {'missing': missing, 'get_value': _get_value, 'accessor': schema.get_attribute}
+    lines = ['def dump(obj):', '    data = {}']
+    for index, (attr_name, field) in enumerate(schema.dump_fields.items()):
+        key = field.data_key if field.data_key is not None else attr_name
+        attribute = field.attribute or attr_name
+        converter = _converter(field) if field.dump_default is missing and field._CHECK_ATTRIBUTE \
+            and '.' not in attribute else None
+        if converter is None:
+            namespace[f'field_{index}'] = field
+            lines += [
+                f'    value = field_{index}.serialize({attr_name!r}, obj, accessor=accessor)',
+                '    if value is not missing:',
+                f'        data[{key!r}] = value',
+            ]
+        else:
+            namespace[f'convert_{index}'] = converter
+            lines += [
+                f'    value = get_value(obj, {attribute!r})',
+                '    if value is not missing:',
+                f'        data[{key!r}] = None if value is None else convert_{index}(value)',
+            ]
+    lines.append('    return data')
+    exec(compile('\n'.join(lines), f'<compiled {type(schema).__name__}>', 'exec'), namespace)
+    schema._compiled_dump = namespace['dump']
+    return schema._compiled_dump
+
+
+def json_response(data):
+    if orjson is None:  # pragma: no cover
+        return jsonify(data)
+    option = orjson.OPT_NON_STR_KEYS
+    if current_app.config['JSON_SORT_KEYS']:
+        option |= orjson.OPT_SORT_KEYS
+    return current_app.response_class(
+        orjson.dumps(data, option=option, default=current_app.json_encoder().default),
+        mimetype=current_app.config['JSONIFY_MIMETYPE'],
+    )
+
+
+def compiled(schema):
+    """Replace dump() and jsonify() of a schema instance with compiled equivalents.
+
+    The schema itself is kept, so apifairy still documents it and loading is
+    unaffected. Schemas with pre/post dump hooks are returned untouched.
+    """
+    if _has_dump_hooks(schema):
+        return schema
+
+    def dump(obj, *, many=None):
+        dump_one = _compile(schema)
+        if schema.many if many is None else many:
+            return [dump_one(item) for item in obj]
+        return dump_one(obj)
+
+    def jsonify(obj, many=None, *args, **kwargs):
+        return json_response(dump(obj, many=many))
+
+    schema.dump = dump
+    schema.jsonify = jsonify
+    return schema
@@ -0,0 +1,9 @@
+from api.app import ma
+from marshmallow import validate
+
+
+class ExportSchema(ma.Schema):
+    format = ma.String(load_default='ndjson', validate=validate.OneOf(['ndjson', 'csv']))
+    gzip = ma.Boolean(load_default=False)
+    since = ma.DateTime()
+    until = ma.DateTime()
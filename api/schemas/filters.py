@@ -5,6 +5,7 @@ from marshmallow.base import FieldABC
 
 class FilterValueSchema(ma.Schema):
     value = ma.String()
+    count = ma.Integer()
 
 
 class FiltersSchema(ma.Schema):
@@ -11,6 +11,7 @@ class ImageCarouselSchema(ma.SQLAlchemySchema):
     image_id = ma.auto_field(required=True)
     active = ma.auto_field(required=True)
     image_link = ma.String(dump_only=True)
+    image_srcset = ma.Dict(dump_only=True)
 
 
 class ImageCarouseUpdateSchema(ma.SQLAlchemySchema):
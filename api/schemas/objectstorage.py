@@ -7,4 +7,8 @@ class ObjectStorageSchema(ma.SQLAlchemySchema):
         model = ObjectStorage
 
     id = ma.auto_field(dump_only=True)
-    link = ma.auto_field()
\ No newline at end of file
+    link = ma.auto_field()
+
+
+class ObjectStorageListSchema(ma.Schema):
+    reconcile = ma.Boolean(load_default=False)
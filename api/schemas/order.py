@@ -0,0 +1,37 @@
+from api.app import ma
+from api.models import Order, OrderItem, DeliveryType, PaymentType
+from marshmallow import validate
+
+
+class OrderItemSchema(ma.SQLAlchemySchema):
+    class Meta:
+        model = OrderItem
+        include_fk = True
+        ordered = True
+
+    product_fk = ma.auto_field()
+    price = ma.auto_field()
+    amount = ma.auto_field()
+
+
+class OrderSchema(ma.SQLAlchemySchema):
+    class Meta:
+        model = Order
+        include_fk = True
+        ordered = True
+
+    id = ma.auto_field()
+    status = ma.Function(lambda order: order.status.name)
+    delivery_type = ma.Function(lambda order: order.delivery_type.name)
+    payment_type = ma.Function(lambda order: order.payment_type.name)
+    sum = ma.auto_field()
+    shop_fk = ma.auto_field()
+    created_at = ma.auto_field()
+    items = ma.Nested(OrderItemSchema, many=True)
+
+
+class CheckoutSchema(ma.Schema):
+    idempotency_key = ma.String(required=True, validate=validate.Length(min=8, max=64))
+    shop_id = ma.Integer(required=True)
+    delivery_type = ma.String(required=True, validate=validate.OneOf([item.name for item in DeliveryType]))
+    payment_type = ma.String(required=True, validate=validate.OneOf([item.name for item in PaymentType]))
@@ -0,0 +1,33 @@
+import base64
+import json
+from api.app import ma
+from marshmallow import validate, ValidationError
+
+
+class Cursor(ma.Field):
+    """Opaque pagination cursor: urlsafe base64 of a JSON list of key values."""
+
+    def _serialize(self, value, attr, obj, **kwargs):
+        if value is None:
+            return None
+        raw = json.dumps(value, separators=(',', ':'), default=str).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        try:
+            raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+            decoded = json.loads(raw)
+        except (ValueError, TypeError):
+            raise ValidationError('Invalid cursor')
+        if not isinstance(decoded, list):
+            raise ValidationError('Invalid cursor')
+        return decoded
+
+
+class PaginationSchema(ma.Schema):
+    limit = ma.Integer(load_default=20, validate=validate.Range(min=1, max=100))
+    next = Cursor(load_default=None)
+
+
+class ProductPaginationSchema(PaginationSchema):
+    order = ma.String(load_default='latest', validate=validate.OneOf(['latest', 'price_asc', 'price_desc']))
@@ -2,6 +2,7 @@ from api.app import ma
 from api.models import Product, ProductAvailability, ProductSpecification
 from .category import CategoryInfoSchema
 from .shop import ShortShopSchema
+from .pagination import Cursor
 from marshmallow import validate, validates, validates_schema, \
     ValidationError, post_dump
 
@@ -47,11 +48,18 @@ class ProductSchema(ma.SQLAlchemySchema):
     referenced_product = ma.Nested(ReferencedProductSchema, dump_only=True, many=True)
     specifications = ma.auto_field(dump_only=True)
     image_link = ma.String(dump_only=True)
+    image_srcset = ma.Dict(dump_only=True)
     avg_stars = ma.Integer(dump_only=True)
+    star_distribution = ma.Dict(keys=ma.Integer(), values=ma.Integer(), dump_only=True)
 
     available = ma.Nested(ProductAvailabilitySchema, dump_only=True, many=True)
 
 
+class ProductPageSchema(ma.Schema):
+    items = ma.Nested(ProductSchema, dump_only=True, many=True)
+    next = Cursor(dump_only=True)
+
+
 class ProductCreateSchema(ma.SQLAlchemySchema):
     class Meta:
         model = Product
@@ -59,7 +67,7 @@ class ProductCreateSchema(ma.SQLAlchemySchema):
     title = ma.auto_field(required=True, validate=validate.Length(
         min=1, max=64
     ))
-    description = ma.String()
+    description = ma.String(validate=validate.Length(max=1024))
     price = ma.auto_field(required=True)
     parent_fk = ma.auto_field()
     category_fk = ma.auto_field(required=True)
@@ -94,4 +102,29 @@ class ModSpecificationSchema(ma.SQLAlchemySchema):
 
     id = ma.auto_field(required=True)
     key = ma.auto_field(required=True)
-    value = ma.auto_field(required=True)
\ No newline at end of file
+    value = ma.auto_field(required=True)
+
+class SpecificationSelectionSchema(ma.Schema):
+    key = ma.String(required=True)
+    values = ma.List(ma.String(), required=True, validate=validate.Length(min=1))
+
+
+class ProductFilterSchema(ma.Schema):
+    specifications = ma.List(ma.Nested(SpecificationSelectionSchema), load_default=[])
+    category_id = ma.Integer()
+    price_min = ma.Float()
+    price_max = ma.Float()
+    in_stock = ma.Boolean(load_default=False)
+    limit = ma.Integer(load_default=100, validate=validate.Range(min=1, max=1000))
+    next = Cursor(load_default=None)
+
+
+class ProductIdsSchema(ma.Schema):
+    ids = ma.List(ma.Integer(), dump_only=True)
+    total = ma.Integer(dump_only=True)
+    next = Cursor(dump_only=True)
+
+
+class ProductSearchSchema(ma.Schema):
+    q = ma.String(required=True, validate=validate.Length(min=1, max=256))
+    limit = ma.Integer(load_default=20, validate=validate.Range(min=1, max=100))
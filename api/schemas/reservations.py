@@ -0,0 +1,31 @@
+from api.app import ma
+from api.models import ProductReserve
+from marshmallow import validate
+
+
+class ReservationSchema(ma.SQLAlchemySchema):
+    class Meta:
+        model = ProductReserve
+        include_fk = True
+        ordered = True
+
+    id = ma.auto_field(dump_only=True)
+    product_fk = ma.auto_field(dump_only=True)
+    pa_fk = ma.auto_field(dump_only=True)
+    order_fk = ma.auto_field(dump_only=True)
+    amount = ma.auto_field(dump_only=True)
+    expires_at = ma.auto_field(dump_only=True)
+
+
+class ReserveItemSchema(ma.Schema):
+    product_id = ma.Integer(required=True)
+    amount = ma.Integer(required=True, validate=validate.Range(min=1))
+
+
+class ReserveSchema(ma.Schema):
+    shop_id = ma.Integer(required=True)
+    items = ma.List(ma.Nested(ReserveItemSchema), required=True, validate=validate.Length(min=1, max=100))
+
+
+class ReservationIdsSchema(ma.Schema):
+    ids = ma.List(ma.Integer(), required=True, validate=validate.Length(min=1, max=100))
@@ -1,15 +1,15 @@
 from api.app import ma
 from api.models import UserRole, UserRolePermission
 from .users import UserSchema
-
-user_schema = UserSchema()
+from .pagination import Cursor
 
 
 class UserRolePermissionSchema(ma.SQLAlchemySchema):
     class Meta:
         model = UserRolePermission
 
-    permission = ma.auto_field()
+    permission = ma.Integer(attribute='permission_fk', dump_only=True)
+    key = ma.String(dump_only=True)
 
 
 class UserRoleSchema(ma.SQLAlchemySchema):
@@ -23,7 +23,12 @@ class UserRoleSchema(ma.SQLAlchemySchema):
     roleDescription = ma.auto_field(dump_only=True)
     is_default = ma.auto_field(dump_only=True)
 
-    users = ma.Nested(UserSchema, dump_only=True, many=True)
+    user_count = ma.Integer(dump_only=True)
     permissions = ma.Nested(UserRolePermissionSchema, dump_only=True, many=True)
 
 
+
+
+class RoleUsersPageSchema(ma.Schema):
+    items = ma.Nested(UserSchema, dump_only=True, many=True)
+    next = Cursor(dump_only=True)
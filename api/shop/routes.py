@@ -1,8 +1,9 @@
 from flask import request
 from flask_jwt_extended import jwt_required
 from api.utils import permission_required
+from api.cache import conditional, response_cache
 from api.schemas.shop import ShopSchema
-from api.models import Shop, ProductAvailability, Product
+from api.models import Shop, ProductAvailability
 from api.app import db
 from apifairy import body, response
 
@@ -17,19 +18,17 @@ shops_schema = ShopSchema(many=True)
 def create(args):
     shop = Shop(**args)
     db.session.add(shop)
-    db.session.commit()
-
-    product_availabilities = []
-    all_products = db.session.scalars(Product.select())
-    for product in all_products:
-        product_availabilities.append(ProductAvailability(product=product, shop=shop))
-
-    db.session.add_all(product_availabilities)
+    db.session.flush()
+    ProductAvailability.fan_out(Shop.id == shop.id)
+    # every product listing gains the new shop's availability
+    response_cache.invalidate('shop')
     db.session.commit()
 
     return shop
 
 
+@conditional(Shop, max_age=300)
+@response_cache.cached(lambda data: ['shop'])
 @response(shops_schema)
 def get_all():
     shops = db.session.scalars(Shop.select())
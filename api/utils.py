@@ -1,8 +1,13 @@
+from datetime import datetime
 from functools import wraps
 
 from .app import db
+from .cache import LocalCache
+from .models import UserRole, UserRolePermission, Permission
 from flask import request, jsonify, logging, current_app
 from flask_jwt_extended import current_user
+from sqlalchemy import tuple_, select, insert, update, bindparam
+from apifairy.exceptions import ValidationError
 # from flask_jwt_extended import
 
 
@@ -19,19 +24,154 @@ def get_first_or_false(query):
 def get_all(query): return db.session.scalars(query)
 
 
+def _cursor_value(column, value):
+    """Check a decoded cursor value against the Python type of its column."""
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is float and type(value) in (int, float):
+        return float(value)
+    if type(value) is not python_type:
+        raise TypeError(f'Expected {python_type.__name__} for {column.key}')
+    return value
+
+
+def keyset_page(query, columns, descending, limit, cursor=None):
+    """Fetch one page of `query` ordered by `columns`, continuing after `cursor`.
+
+    `columns` must end with a unique column so the ordering is total. Returns a
+    dict with the page `items` and the `next` cursor (None on the last page).
+    A cursor that does not fit `columns` is rejected like any other invalid
+    `next` argument.
+    """
+    if cursor is not None:
+        try:
+            if len(cursor) != len(columns):
+                raise ValueError('Cursor length does not match the ordering')
+            values = [_cursor_value(column, value) for column, value in zip(columns, cursor)]
+        except (TypeError, ValueError):
+            raise ValidationError(400, {'query': {'next': ['Invalid cursor']}})
+        bound = tuple_(*columns)
+        query = query.where(bound < tuple_(*values) if descending else bound > tuple_(*values))
+
+    query = query.order_by(*[column.desc() if descending else column.asc() for column in columns])
+    items = db.session.scalars(query.limit(limit + 1)).all()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = [getattr(items[-1], column.key) for column in columns]
+        next_cursor = [value.isoformat() if isinstance(value, datetime) else value for value in next_cursor]
+
+    return {'items': items, 'next': next_cursor}
+
+
+def _upsert_generic(model, rows, index_elements, update_columns):
+    """Portable upsert: select the keys that exist, then UPDATE those rows and INSERT the rest.
+
+    Unlike ON CONFLICT this is not atomic; a row inserted concurrently between
+    the two steps makes the INSERT fail with an IntegrityError.
+    """
+    table = model.__table__
+    keys = [table.c[name] for name in index_elements]
+    values = [tuple(row[name] for name in index_elements) for row in rows]
+    if len(keys) == 1:
+        condition = keys[0].in_([value[0] for value in values])
+    else:
+        condition = tuple_(*keys).in_(values)
+    existing = set(db.session.execute(select(*keys).where(condition)).all())
+
+    updates = [row for row, value in zip(rows, values) if value in existing]
+    inserts = [row for row, value in zip(rows, values) if value not in existing]
+    if updates and update_columns:
+        db.session.execute(
+            update(table)
+            .where(*[key == bindparam(f'key_{key.name}') for key in keys])
+            .values({column: bindparam(column) for column in update_columns}),
+            [dict({f'key_{name}': row[name] for name in index_elements},
+                  **{column: row[column] for column in update_columns}) for row in updates]
+        )
+    if inserts:
+        db.session.execute(insert(table), inserts)
+
+
+def upsert(model, rows, index_elements, update_columns):
+    """Bulk INSERT ... ON CONFLICT DO UPDATE of `rows` (a list of dicts).
+
+    `index_elements` must match a unique constraint of `model`; on conflict
+    only `update_columns` are overwritten with the incoming values. Dialects
+    without ON CONFLICT get a select-then-write fallback.
+    """
+    if not rows:
+        return
+    dialect = db.session.get_bind(model).dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return _upsert_generic(model, rows, index_elements, update_columns)
+    statement = dialect_insert(model)
+    statement = statement.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={column: statement.excluded[column] for column in update_columns},
+    )
+    db.session.execute(statement, rows)
+
+
+class RoleRights:
+    """Compiled rights of a role.
+
+    `admin.all` grants everything and keys ending in `.*` grant every
+    permission below that prefix, e.g. `admin.product.*`.
+    """
+
+    def __init__(self, role_name, keys):
+        self.role_name = role_name
+        self.keys = frozenset(keys)
+        self.allow_all = 'admin.all' in self.keys
+        self.prefixes = frozenset(key[:-1] for key in self.keys if key.endswith('.*'))
+        self._decisions = {}
+
+    def allows(self, permission):
+        if (allowed := self._decisions.get(permission)) is None:
+            parts = permission.split('.')
+            allowed = self.allow_all or permission in self.keys or \
+                any('.'.join(parts[:i]) + '.' in self.prefixes for i in range(1, len(parts)))
+            self._decisions[permission] = allowed
+        return allowed
+
+
+# role id -> RoleRights
+rights_cache = LocalCache('permissions')
+
+
+def get_role_rights(role_id):
+    if (rights := rights_cache.get(role_id)) is None:
+        rows = db.session.execute(
+            select(UserRole.roleName, Permission.key)
+            .outerjoin(UserRolePermission, UserRolePermission.role_fk == UserRole.id)
+            .outerjoin(Permission, Permission.id == UserRolePermission.permission_fk)
+            .where(UserRole.id == role_id)
+        ).all()
+        rights = RoleRights(rows[0].roleName if rows else None, [row.key for row in rows if row.key])
+        rights_cache.set(role_id, rights)
+    return rights
+
+
 def permission_required(permission):
     def wrapper(fn):
         @wraps(fn)
         def decorator(*args, **kwargs):
-            permissions = current_user.role.get_rights()
-            if 'admin.all' in permissions or permission in permissions:
-                current_app.logger.info(f'{current_user.role.roleName}->{current_user.email} requested access to '
+            rights = current_user.rights
+            if rights.allows(permission):
+                current_app.logger.info(f'{rights.role_name}->{current_user.email} requested access to '
                                         f'{request.path} -> ACCESS GRANTED')
                 return fn(*args, **kwargs)
             else:
-                current_app.logger.info(f'{current_user.role.roleName}->{current_user.email} requested access to '
+                current_app.logger.info(f'{rights.role_name}->{current_user.email} requested access to '
                                         f'{request.path} -> ACCESS DENIED')
-                return jsonify(msg=f'Role <{permission}> not found in role <{current_user.role.roleName}>'), 403
+                return jsonify(msg=f'Role <{permission}> not found in role <{rights.role_name}>'), 403
 
         return decorator
 
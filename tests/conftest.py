@@ -0,0 +1,241 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from itertools import count
+from types import SimpleNamespace
+
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event, insert, select, delete, text
+
+from api import create_app, db
+from api.config import Config
+from api.models import Category, SubCategory, ObjectStorage, Shop, Product, ProductAvailability, \
+    ProductSpecification, User, UserRole, Permission, UserRolePermission
+
+def pytest_addoption(parser):
+    parser.addoption('--benchmark', action='store_true', help='Also run the benchmarks, which seed large data sets.')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'benchmark: seeds a large data set and reports timings; needs --benchmark')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--benchmark'):
+        return
+    skip = pytest.mark.skip(reason='benchmark, run with --benchmark')
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
+
+
+_database = tempfile.NamedTemporaryFile(suffix='.sqlite', delete=False)
+_sequence = count(1)
+
+
+class TestConfig(Config):
+    TESTING = True
+    # e.g. a disposable Postgres database, to run the suite and its load tests there
+    ALCHEMICAL_DATABASE_URL = os.environ.get('TEST_DATABASE_URL') or 'sqlite:///' + _database.name
+    ALCHEMICAL_ENGINE_OPTIONS = {}
+    # cheap hashes; the pool itself is still exercised
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+    PASSWORD_HASH_PROCESSES = 1
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+    yield app
+    os.unlink(_database.name)
+
+
+@pytest.fixture(autouse=True)
+def app_context(app):
+    """Every test runs in its own app context, hence with its own session.
+
+    The database is shared by the whole run, so tests create the rows they
+    use (see `catalog` and `admin`) instead of relying on fixed ids.
+    """
+    with app.app_context():
+        yield
+        db.session.rollback()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def queries(app):
+    """Statements sent to the database while the test runs."""
+    statements = []
+
+    def collect(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = db.get_engine()
+    event.listen(engine, 'before_cursor_execute', collect)
+    yield statements
+    event.remove(engine, 'before_cursor_execute', collect)
+
+
+def unique(prefix):
+    return f'{prefix}-{next(_sequence)}'
+
+
+@pytest.fixture
+def catalog():
+    """Factory of a category with `products` products stocked in `shops` new shops.
+
+    With `children`, every other product gets a referenced child product.
+    """
+
+    def make(products=10, shops=2, stock=5, children=False):
+        category = Category(title=unique('category'))
+        db.session.add(category)
+        db.session.flush()
+        subcategory = SubCategory(title=unique('subcategory'), category_fk=category.id)
+        image = ObjectStorage(link=unique('image') + '.png')
+        shop_rows = [Shop(title=unique('shop')) for _ in range(shops)]
+        db.session.add_all([subcategory, image, *shop_rows])
+        db.session.flush()
+
+        product_rows = []
+        for i in range(products):
+            product = Product(title=unique('product'), description='description', price=i + 1, is_child=False,
+                              category_fk=category.id, subcategory_fk=subcategory.id, image_fk=image.id)
+            db.session.add(product)
+            db.session.flush()
+            db.session.add_all([ProductAvailability(product_id=product.id, shop_id=shop.id, amount=stock)
+                                for shop in shop_rows])
+            db.session.add(ProductSpecification(product_id=product.id, key='color',
+                                                value=['red', 'blue'][i % 2], type='str'))
+            if children and i % 2 == 0:
+                db.session.add(Product(title=unique('child'), price=i + 1, is_child=True, parent_fk=product.id,
+                                       category_fk=category.id, image_fk=image.id))
+            product_rows.append(product)
+        db.session.commit()
+        return SimpleNamespace(category=category, subcategory=subcategory, image=image,
+                               shops=shop_rows, products=product_rows)
+
+    return make
+
+
+@pytest.fixture
+def report(request):
+    """Write a benchmark result line to the terminal, e.g. report('search', fts_ms=1.2)."""
+    plugins = request.config.pluginmanager
+    reporter, capture = plugins.get_plugin('terminalreporter'), plugins.get_plugin('capturemanager')
+
+    def write(name, **figures):
+        line = f'{name}: ' + ', '.join(f'{key}={value:.6g}' if isinstance(value, float) else f'{key}={value}'
+                                       for key, value in figures.items())
+        with capture.global_and_fixture_disabled():
+            reporter.write_line(line)
+    return write
+
+
+@pytest.fixture
+def bulk_catalog():
+    """Factory of a category holding `products` products inserted in bulk, for benchmarks.
+
+    `row(i)` may return extra Product columns, e.g. titles. Every row made
+    through the factory is deleted after the test.
+    """
+    categories = []
+
+    def make(products, row=lambda i: {}, batch_size=10000):
+        category = Category(title=unique('category'))
+        db.session.add(category)
+        db.session.commit()
+        categories.append(category.id)
+        for start in range(0, products, batch_size):
+            db.session.execute(insert(Product), [
+                dict({'title': f'product {i}', 'price': i % 100 + 1, 'is_child': False, 'category_fk': category.id},
+                     **row(i)) for i in range(start, min(start + batch_size, products))
+            ])
+        db.session.commit()
+        return category
+
+    yield make
+    db.session.rollback()
+    for category_id in categories:
+        product_ids = select(Product.id).where(Product.category_fk == category_id)
+        db.session.execute(text('DELETE FROM "ProductSearch" WHERE rowid IN (SELECT id FROM "Product" '
+                                'WHERE category_fk = :category)'), {'category': category_id})
+        for statement in (delete(ProductAvailability).where(ProductAvailability.product_id.in_(product_ids)),
+                          delete(ProductSpecification).where(ProductSpecification.product_id.in_(product_ids)),
+                          delete(Product).where(Product.category_fk == category_id)):
+            db.session.execute(statement.execution_options(synchronize_session=False))
+    db.session.commit()
+
+
+class FakeS3:
+    """File-backed stand-in for the S3 client calls the app makes; one file per key."""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root)
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, Config=None):
+        shutil.copyfile(Filename, os.path.join(self.root, Key))
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        with open(os.path.join(self.root, Key), 'wb') as blob:
+            blob.write(Body)
+
+    def get_object(self, Bucket, Key):
+        return {'Body': open(os.path.join(self.root, Key), 'rb')}
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, Bucket):
+        contents = []
+        for key in self.keys():
+            path = os.path.join(self.root, key)
+            with open(path, 'rb') as blob:
+                etag = hashlib.md5(blob.read()).hexdigest()
+            contents.append({'Key': key, 'Size': os.path.getsize(path), 'ETag': f'"{etag}"',
+                             'LastModified': datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)})
+        yield {'Contents': contents}
+
+    def keys(self):
+        return sorted(os.listdir(self.root))
+
+
+@pytest.fixture
+def store(app, tmp_path, monkeypatch):
+    """A FakeS3 bucket in place of the real one, with its own manifest file."""
+    fake = FakeS3(str(tmp_path / 'bucket'))
+    monkeypatch.setattr('api.objectstorage.storage._client', fake)
+    monkeypatch.setitem(app.config, 'S3_MANIFEST_PATH', str(tmp_path / 'manifest.ndjson'))
+    return fake
+
+
+@pytest.fixture
+def admin():
+    """A confirmed user whose role grants every permission."""
+    role = UserRole(roleName=unique('admin'))
+    permission = db.session.scalar(Permission.select().where(Permission.key == 'admin.all'))
+    if permission is None:
+        permission = Permission(key='admin.all')
+    db.session.add_all([role, permission])
+    db.session.flush()
+    db.session.add(UserRolePermission(role_fk=role.id, permission_fk=permission.id))
+    user = User(email=unique('admin') + '@example.com', password='!', role=role, email_confirmed=True)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def auth(admin):
+    return {'Authorization': 'Bearer ' + create_access_token(identity=admin)}
@@ -0,0 +1,97 @@
+import time
+
+import pytest
+from sqlalchemy import select, func
+from sqlalchemy.exc import IntegrityError
+
+from api import db
+from api.models import Product, Shop, ProductAvailability
+from tests.conftest import unique
+
+
+def availability_count(*conditions):
+    return db.session.scalar(select(func.count()).select_from(ProductAvailability).where(*conditions))
+
+
+def test_shop_creation_adds_every_product_in_constant_queries(client, auth, catalog, queries):
+    catalog(products=30, shops=1)
+    product_count = db.session.scalar(select(func.count()).select_from(Product))
+
+    queries.clear()
+    response = client.post('/shop/create', headers=auth, json={
+        'title': 'New shop', 'city': 'City', 'street': 'Street', 'building': '1', 'description': 'Shop'})
+    inserts = [statement for statement in queries if statement.startswith('INSERT INTO "ProductAvailability"')]
+
+    assert response.status_code == 200, response.json
+    assert len(inserts) == 1
+    assert availability_count(ProductAvailability.shop_id == response.json['id']) == product_count
+
+
+def test_product_creation_adds_every_shop(client, auth, catalog):
+    created = catalog(products=0, shops=3)
+    shop_count = db.session.scalar(select(func.count()).select_from(Shop))
+
+    response = client.post('/product', headers=auth, json={
+        'title': 'Fanned out', 'price': 1, 'is_child': False,
+        'category_fk': created.category.id, 'image_fk': created.image.id,
+    })
+
+    assert response.status_code == 200, response.json
+    assert availability_count(ProductAvailability.product_id == response.json['id']) == shop_count
+    assert len(response.json['available']) == shop_count
+
+
+def test_fan_out_is_idempotent_and_keeps_stock(catalog):
+    created = catalog(products=3, shops=2, stock=7)
+    shop = created.shops[0]
+    # other tests' rows are out of scope
+    in_catalog = ProductAvailability.product_id.in_([product.id for product in created.products])
+    before = availability_count(in_catalog)
+
+    in_shops = Shop.id.in_([shop.id for shop in created.shops])
+
+    ProductAvailability.fan_out(Product.category_fk == created.category.id, Shop.id == shop.id)
+    ProductAvailability.fan_out(Product.category_fk == created.category.id, in_shops)
+    db.session.commit()
+
+    assert availability_count(in_catalog) == before
+    assert db.session.scalars(
+        select(ProductAvailability.amount).where(in_catalog, ProductAvailability.shop_id == shop.id)
+    ).all() == [7, 7, 7]
+
+
+def test_duplicate_pairs_are_rejected(catalog):
+    created = catalog(products=1, shops=1)
+
+    db.session.add(ProductAvailability(product_id=created.products[0].id, shop_id=created.shops[0].id))
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+
+
+@pytest.mark.benchmark
+def test_set_based_fan_out_against_per_object_inserts_on_50k_products(bulk_catalog, report):
+    category = bulk_catalog(50_000)
+    in_category = Product.category_fk == category.id
+    orm_shop, set_shop = Shop(title=unique('shop')), Shop(title=unique('shop'))
+    db.session.add_all([orm_shop, set_shop])
+    db.session.commit()
+    orm_shop_id, set_shop_id = orm_shop.id, set_shop.id
+
+    # what shop creation did before: load the products, add one object per pair
+    started = time.perf_counter()
+    for product in db.session.scalars(select(Product).where(in_category)):
+        db.session.add(ProductAvailability(product=product, shop=orm_shop, amount=0))
+    db.session.commit()
+    orm_seconds = time.perf_counter() - started
+    db.session.expunge_all()
+
+    started = time.perf_counter()
+    ProductAvailability.fan_out(in_category, Shop.id == set_shop_id)
+    db.session.commit()
+    set_seconds = time.perf_counter() - started
+
+    report('fan out 50k products', orm_seconds=orm_seconds, set_seconds=set_seconds,
+           speedup=orm_seconds / set_seconds)
+    for shop_id in (orm_shop_id, set_shop_id):
+        assert availability_count(ProductAvailability.shop_id == shop_id) == 50_000
+    assert set_seconds < orm_seconds
@@ -0,0 +1,50 @@
+import pytest
+from sqlalchemy import select
+
+from api import db
+from api.basket import cache
+from api.models import Basket
+
+
+@pytest.fixture
+def basket_cache(app, monkeypatch):
+    """A fresh basket cache, configured per test through BASKET_CACHE_URL."""
+    fresh = cache.BasketCache()
+    monkeypatch.setattr('api.basket.routes.basket_cache', fresh)
+    monkeypatch.setattr('api.order.routes.basket_cache', fresh)
+    yield fresh
+    app.config['BASKET_CACHE_URL'] = None
+
+
+def stored(user):
+    return dict(db.session.execute(
+        select(Basket.product_fk, Basket.amount).where(Basket.user_fk == user.id)
+    ).all())
+
+
+def test_edits_are_written_through_without_a_cache_url(app, client, auth, admin, catalog, basket_cache):
+    first, second = catalog(products=2, shops=1).products
+
+    client.post('/basket/add', headers=auth, json={'product_id': first.id, 'amount': 2})
+    client.post('/basket/add', headers=auth, json={'product_id': first.id, 'amount': 1})
+    response = client.post('/basket/add', headers=auth, json={'product_id': second.id, 'amount': 1})
+
+    assert response.json['items'] == [{'product_id': first.id, 'amount': 3}, {'product_id': second.id, 'amount': 1}]
+    assert basket_cache.backend is None
+    assert stored(admin) == {first.id: 3, second.id: 1}
+
+    client.post('/basket/remove', headers=auth, json={'product_id': first.id})
+    assert stored(admin) == {second.id: 1}
+
+
+def test_memory_backend_writes_behind_until_read(app, client, auth, admin, catalog, basket_cache):
+    app.config['BASKET_CACHE_URL'] = 'memory://'
+    first, second = catalog(products=2, shops=1).products
+
+    client.post('/basket/add', headers=auth, json={'product_id': first.id, 'amount': 2})
+    client.post('/basket/set', headers=auth, json={'product_id': second.id, 'amount': 4})
+    assert stored(admin) == {}
+
+    response = client.get('/basket/get', headers=auth)
+    assert [(item['product_id'], item['amount']) for item in response.json['items']] == [(first.id, 2), (second.id, 4)]
+    assert stored(admin) == {first.id: 2, second.id: 4}
@@ -0,0 +1,159 @@
+import threading
+
+import flask
+
+from api import cache, db
+from api.cache import bump_version, get_version, get_versions, response_cache, LRUBackend, LocalCache, \
+    CHANGE_PREFIX
+from api.models import Shop
+from api.reservations.service import reserve, release
+from tests.conftest import unique
+
+
+def test_concurrent_first_bumps_of_a_new_name_all_count(app):
+    name = unique('cache')
+    errors = []
+
+    def bump():
+        with app.app_context():
+            try:
+                bump_version(name)
+                db.session.commit()
+            except Exception as e:  # pragma: no cover
+                errors.append(e)
+
+    threads = [threading.Thread(target=bump) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert get_version(name) == 8
+
+
+def test_a_review_only_moves_its_products_counter(client, auth, catalog):
+    first, second = catalog(products=2, shops=1).products
+    counters = [CHANGE_PREFIX + 'Product', CHANGE_PREFIX + 'Reviews',
+                f'{CHANGE_PREFIX}Reviews:{first.id}', f'{CHANGE_PREFIX}Reviews:{second.id}']
+    before = get_versions(counters)
+    page = client.get(f'/product/{first.id}')
+    reviews = client.get(f'/reviews/{first.id}')
+    other_reviews = client.get(f'/reviews/{second.id}')
+
+    response = client.post('/reviews/create', headers=auth, json={'product_id': first.id, 'stars': 4, 'text': 'ok'})
+    assert response.status_code == 200, response.json
+
+    after = get_versions(counters)
+    assert [after[name] - before[name] for name in counters] == [0, 0, 1, 0]
+
+    def revalidate(url, response):
+        return client.get(url, headers={'If-None-Match': response.headers['ETag']}).status_code
+
+    assert revalidate(f'/reviews/{second.id}', other_reviews) == 304
+    assert revalidate(f'/reviews/{first.id}', reviews) == 200
+    # the rating aggregates reach the product page through its fingerprint
+    assert revalidate(f'/product/{first.id}', page) == 200
+
+
+def test_category_pages_are_tagged_with_the_parsed_category_id(app, client, catalog):
+    created = catalog(products=1, shops=1)
+    url = f'/product/get_by_category?id=0{created.category.id}'
+    assert client.get(url).json['items'][0]['title'] == created.products[0].title
+
+    created.products[0].title = unique('renamed')
+    response_cache.invalidate(f'category:{created.category.id}')
+    db.session.commit()
+
+    assert client.get(url).json['items'][0]['title'] == created.products[0].title
+
+
+def test_lru_backend_evicts_the_least_recently_used_and_expired_entries():
+    lru = LRUBackend(maxsize=2)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    lru.get('a')
+    lru.set('c', 3)
+    lru.set('d', 4, ttl=-1)
+
+    assert (lru.get('a'), lru.get('b'), lru.get('c'), lru.get('d', 'missing')) == (None, None, 3, 'missing')
+
+
+def test_local_cache_never_serves_values_built_before_an_invalidation(app):
+    cache = LocalCache(unique('local'))
+    assert cache.get('key') is None
+    cache.set('key', 'fresh')
+    assert cache.get('key') == 'fresh'
+
+    # a request that read the old data before another one's invalidation committed
+    assert cache.get('other') is None
+    cache.invalidate()
+    db.session.commit()
+    cache.set('other', 'stale')
+
+    assert cache.get('other') is None and cache.get('key') is None
+
+
+def test_local_cache_invalidation_waits_for_the_commit(app):
+    cache = LocalCache(unique('local'))
+    cache.get('key')
+    cache.set('key', 'value')
+
+    cache.invalidate()
+    assert cache.get('key') == 'value'
+    db.session.rollback()
+    assert cache.get('key') == 'value'
+
+
+def test_a_write_committed_during_a_render_is_not_served_stale(app, client, catalog, monkeypatch):
+    shop = catalog(products=0, shops=1).shops[0]
+    client.get('/shop/get')
+    client.get('/shop/get')
+    # the cached listing is out of date, the next request renders it again
+    response_cache.invalidate('shop')
+    db.session.commit()
+    renamed = unique('renamed')
+    writers = []
+
+    def rename():
+        with app.app_context():
+            db.session.get(Shop, shop.id).title = renamed
+            response_cache.invalidate('shop')
+            db.session.commit()
+
+    def make_response(*args):
+        # another request renames the shop once the listing has been rendered
+        response = flask.make_response(*args)
+        if not writers:
+            writers.append(threading.Thread(target=rename))
+            writers[0].start()
+            writers[0].join()
+        return response
+
+    monkeypatch.setattr(cache, 'make_response', make_response)
+    during = client.get('/shop/get')
+    monkeypatch.undo()
+
+    assert writers and renamed not in during.get_data(as_text=True)
+    db.session.expire_all()
+    assert db.session.get(Shop, shop.id).title == renamed
+    assert renamed in client.get('/shop/get').get_data(as_text=True)
+
+
+def test_reservations_expire_the_pages_showing_their_stock(client, admin, catalog):
+    created = catalog(products=1, shops=1, stock=5)
+    product_id, shop_id = created.products[0].id, created.shops[0].id
+    url = f'/product/get_by_category?id={created.category.id}'
+
+    def amount():
+        available = client.get(url).json['items'][0]['available']
+        return next(item['amount'] for item in available if item['shop']['id'] == shop_id)
+
+    assert amount() == amount() == 5
+    reservations = reserve(admin.id, shop_id, {product_id: 2})
+    db.session.commit()
+    assert amount() == 3
+
+    release([reservation.id for reservation in reservations])
+    db.session.commit()
+    assert amount() == 5
@@ -0,0 +1,130 @@
+import queue
+import threading
+import time
+
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import select, func
+
+from api import db
+from api.models import Order, OrderItem, ProductAvailability, Basket, User
+from tests.conftest import unique
+
+
+def checkout_body(shop_id, key):
+    return {'idempotency_key': key, 'shop_id': shop_id, 'delivery_type': 'pickup', 'payment_type': 'prepay'}
+
+
+def fill_basket(client, auth, items):
+    for product_id, amount in items.items():
+        response = client.post('/basket/add', headers=auth, json={'product_id': product_id, 'amount': amount})
+        assert response.status_code == 200, response.json
+
+
+def available(shop_id, product_ids):
+    db.session.expire_all()
+    return dict(db.session.execute(
+        select(ProductAvailability.product_id, ProductAvailability.amount)
+        .where(ProductAvailability.shop_id == shop_id, ProductAvailability.product_id.in_(product_ids))
+    ).all())
+
+
+def orders_of(user, key):
+    return db.session.scalar(
+        select(func.count()).select_from(Order).where(Order.user_fk == user.id, Order.idempotency_key == key))
+
+
+def test_replayed_checkout_returns_the_first_order(client, auth, admin, catalog):
+    created = catalog(products=2, shops=1, stock=5)
+    shop_id, (first, second) = created.shops[0].id, [product.id for product in created.products]
+    fill_basket(client, auth, {first: 2, second: 1})
+
+    response = client.post('/order/checkout', headers=auth, json=checkout_body(shop_id, 'replay-0001'))
+    replay = client.post('/order/checkout', headers=auth, json=checkout_body(shop_id, 'replay-0001'))
+
+    assert response.status_code == 201, response.json
+    assert replay.status_code == 200
+    assert replay.json['id'] == response.json['id']
+    assert orders_of(admin, 'replay-0001') == 1
+    assert db.session.scalar(
+        select(func.count()).select_from(OrderItem).where(OrderItem.order_fk == response.json['id'])) == 2
+    assert available(shop_id, [first, second]) == {first: 3, second: 4}
+
+
+def test_concurrent_retries_create_a_single_order(app, client, auth, admin, catalog):
+    created = catalog(products=1, shops=1, stock=5)
+    shop_id, product_id = created.shops[0].id, created.products[0].id
+    fill_basket(client, auth, {product_id: 2})
+    responses = []
+
+    def retry():
+        with app.test_client() as retry_client:
+            response = retry_client.post('/order/checkout', headers=auth,
+                                         json=checkout_body(shop_id, 'concurrent-0001'))
+            responses.append((response.status_code, response.json))
+
+    threads = [threading.Thread(target=retry) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    statuses = sorted(status for status, body in responses)
+    assert statuses.count(201) == 1
+    assert set(statuses) <= {200, 201}, responses
+    assert len({body['id'] for status, body in responses}) == 1
+    assert orders_of(admin, 'concurrent-0001') == 1
+    assert available(shop_id, [product_id]) == {product_id: 3}
+
+
+@pytest.mark.benchmark
+def test_checkout_load(app, admin, catalog, report):
+    """Load test: concurrent customers checking out 3-item baskets; reports orders per second and p99 latency.
+
+    Runs on the test database, SQLite by default; set TEST_DATABASE_URL to
+    run it against Postgres.
+    """
+    customers, threads_count = 200, 8
+    created = catalog(products=10, shops=1, stock=customers * 3)
+    shop_id, product_ids = created.shops[0].id, [product.id for product in created.products]
+    users = [User(email=unique('customer') + '@example.com', password='!', role=admin.role, email_confirmed=True)
+             for _ in range(customers)]
+    db.session.add_all(users)
+    db.session.flush()
+    db.session.add_all(Basket(user_fk=user.id, product_fk=product_ids[(i + offset) % len(product_ids)], amount=1)
+                       for i, user in enumerate(users) for offset in range(3))
+    db.session.commit()
+
+    pending = queue.Queue()
+    for user in users:
+        pending.put(('Bearer ' + create_access_token(identity=user), unique('load')))
+    latencies, statuses = [], []
+
+    def customer():
+        with app.test_client() as load_client:
+            while True:
+                try:
+                    token, key = pending.get_nowait()
+                except queue.Empty:
+                    return
+                started = time.perf_counter()
+                response = load_client.post('/order/checkout', headers={'Authorization': token},
+                                            json=checkout_body(shop_id, key))
+                latencies.append(time.perf_counter() - started)
+                statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=customer) for _ in range(threads_count)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p99 = latencies[max(0, round(len(latencies) * 0.99) - 1)]
+    report(f'checkout on {db.get_engine().dialect.name}', orders=statuses.count(201), threads=threads_count,
+           orders_per_second=statuses.count(201) / elapsed, p50_ms=latencies[len(latencies) // 2] * 1000,
+           p99_ms=p99 * 1000)
+    assert statuses == [201] * customers
+    assert sum(available(shop_id, product_ids).values()) == customers * 3 * len(product_ids) - customers * 3
@@ -0,0 +1,23 @@
+import json
+from datetime import datetime
+
+from api import db
+from api.models import User
+from tests.conftest import unique
+
+
+def test_users_export_is_bounded_by_registration_date(app, client, auth):
+    users = [User(email=unique('user') + '@example.com', registrationDate=datetime(2001, 1, day))
+             for day in (1, 2, 3)]
+    db.session.add_all(users)
+    db.session.commit()
+    since, until = '2001-01-02 00:00:00', '2001-01-03 00:00:00'
+
+    result = app.test_cli_runner().invoke(args=['export', 'users', '--since', since, '--until', until])
+    response = client.get('/export/users', headers=auth,
+                          query_string={'since': since.replace(' ', 'T'), 'until': until.replace(' ', 'T')})
+
+    assert result.exit_code == 0, result.output
+    assert [json.loads(line)['email'] for line in result.output.splitlines()] == [users[1].email]
+    assert response.status_code == 200
+    assert [json.loads(line)['email'] for line in response.get_data(as_text=True).splitlines()] == [users[1].email]
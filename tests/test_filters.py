@@ -0,0 +1,60 @@
+from api import db
+from api.models import ProductSpecification
+from api.product.index import get_index, index_specifications
+from tests.conftest import unique
+
+
+def filtered(client, **body):
+    response = client.post('/product/filter', json=body)
+    assert response.status_code == 200, response.json
+    return response.json
+
+
+def test_committed_specifications_reach_the_index_as_a_delta(client, auth, catalog):
+    product = catalog(products=1, shops=1).products[0]
+    index = get_index()
+    key, value = unique('key'), unique('value')
+
+    response = client.post('/product/specification', headers=auth,
+                           json=[{'product_id': product.id, 'key': key, 'value': value, 'type': 'str'}])
+    assert response.status_code == 200, response.json
+
+    assert get_index() is index
+    assert filtered(client, specifications=[{'key': key, 'values': [value]}])['ids'] == [product.id]
+
+
+def test_rolled_back_specifications_never_reach_the_index(client, catalog):
+    product = catalog(products=1, shops=1).products[0]
+    get_index()
+    key, value = unique('key'), unique('value')
+
+    db.session.add(ProductSpecification(product_id=product.id, key=key, value=value, type='str'))
+    db.session.flush()
+    index_specifications([product.id])
+    db.session.rollback()
+
+    assert filtered(client, specifications=[{'key': key, 'values': [value]}])['ids'] == []
+
+
+def test_filter_results_are_paged(client, catalog):
+    created = catalog(products=5, shops=1)
+    expected = sorted(product.id for product in created.products)
+    key = unique('key')
+    db.session.add_all(ProductSpecification(product_id=product_id, key=key, value='yes', type='str')
+                       for product_id in expected)
+    index_specifications(expected)
+    db.session.commit()
+
+    for body in ({'category_id': created.category.id}, {'specifications': [{'key': key, 'values': ['yes']}]}):
+        ids, cursor, total = [], None, None
+        while True:
+            page = filtered(client, **body, limit=2, next=cursor)
+            assert len(page['ids']) <= 2
+            ids += page['ids']
+            total, cursor = page['total'], page['next']
+            if cursor is None:
+                break
+        assert ids == expected and total == 5
+
+    response = client.post('/product/filter', json={'category_id': created.category.id, 'next': 'bm90IGEgbGlzdA'})
+    assert response.status_code == 400
@@ -0,0 +1,110 @@
+import io
+import json
+
+from sqlalchemy import select
+
+from api import db
+from api.cache import get_versions
+from api.models import Product, ProductAvailability
+from api.product.importer import import_catalog
+from api.product.index import INDEX_VERSION, get_index
+from tests.conftest import unique
+
+
+def run_import(rows, batch_size=1000):
+    data = ''.join(json.dumps(row) + '\n' for row in rows).encode()
+    return import_catalog(io.BytesIO(data), 'jsonl', batch_size).to_dict()
+
+
+def product(sku):
+    db.session.expire_all()
+    return db.session.scalar(Product.select().where(Product.sku == sku))
+
+
+def test_invalid_rows_are_reported_per_line_and_do_not_fail_the_batch(catalog):
+    created = catalog(products=0, shops=1)
+    category = created.category.title
+    good, long_title, bad_price = unique('sku'), unique('sku'), unique('sku')
+
+    report = run_import([
+        {'sku': good, 'title': 'Fine', 'price': 5, 'category': category},
+        {'sku': long_title, 'title': 'x' * 200, 'price': 5, 'category': category},
+        {'sku': bad_price, 'title': 'Fine', 'price': 'cheap', 'category': category},
+        {'sku': 'x' * 100, 'title': 'Fine', 'price': 5, 'category': category},
+        {'sku': unique('sku'), 'title': 'Fine', 'price': 5, 'category': category, 'description': 'd' * 2000},
+        {'sku': unique('sku'), 'title': 'Fine', 'price': 5, 'category': category,
+         'specifications': [{'key': 'k' * 200, 'value': 'v'}]},
+    ])
+
+    assert report['imported'] == 1
+    assert [error['line'] for error in report['errors']] == [2, 3, 4, 5, 6]
+    assert report['errors'][0]['error'].startswith('title:')
+    assert report['errors'][1]['error'].startswith('price:')
+    assert product(good).title == 'Fine'
+    assert product(long_title) is None and product(bad_price) is None
+
+
+def test_duplicate_skus_in_a_batch_are_reported(catalog):
+    created = catalog(products=0, shops=1)
+    sku = unique('sku')
+
+    report = run_import([
+        {'sku': sku, 'title': 'First', 'price': 1, 'category': created.category.title},
+        {'sku': sku, 'title': 'Second', 'price': 2, 'category': created.category.title},
+    ])
+
+    assert report['imported'] == 1
+    assert report['errors'] == [{'line': 2, 'error': f"Duplicate sku '{sku}', first seen on line 1"}]
+    assert product(sku).title == 'First'
+
+
+def test_reimport_keeps_columns_the_row_does_not_have(catalog):
+    created = catalog(products=0, shops=1)
+    sku = unique('sku')
+    run_import([{'sku': sku, 'title': 'Full', 'price': 1, 'category': created.category.title,
+                 'subcategory': created.subcategory.title, 'image': created.image.link,
+                 'description': 'kept', 'is_child': True}])
+
+    report = run_import([{'sku': sku, 'title': 'Renamed', 'price': 2, 'category': created.category.title}])
+
+    imported = product(sku)
+    assert report['imported'] == 1
+    assert (imported.title, imported.price) == ('Renamed', 2)
+    assert (imported.description, imported.image_fk, imported.subcategory_fk, imported.is_child) == \
+        ('kept', created.image.id, created.subcategory.id, True)
+
+    run_import([{'sku': sku, 'title': 'Renamed', 'price': 2, 'category': created.category.title,
+                 'description': ''}])
+    assert product(sku).description is None
+
+
+def test_unknown_shops_are_row_errors(catalog):
+    created = catalog(products=0, shops=1)
+    shop_id = created.shops[0].id
+    good, unknown = unique('sku'), unique('sku')
+
+    report = run_import([
+        {'sku': good, 'title': 'Stocked', 'price': 1, 'category': created.category.title, 'stock': {shop_id: 4}},
+        {'sku': unknown, 'title': 'Lost', 'price': 1, 'category': created.category.title, 'stock': {'999999': 4}},
+    ])
+
+    assert report['imported'] == 1
+    assert report['errors'] == [{'line': 2, 'error': 'Unknown shop 999999'}]
+    assert db.session.scalar(select(ProductAvailability.amount).where(
+        ProductAvailability.product_id == product(good).id, ProductAvailability.shop_id == shop_id)) == 4
+
+
+def test_caches_and_the_index_are_invalidated_once_per_import(client, catalog):
+    created = catalog(products=0, shops=1)
+    key = unique('key')
+    names = [INDEX_VERSION, 'filters', 'category_tree']
+    before = get_versions(names)
+
+    report = run_import([{'sku': unique('sku'), 'title': 'Batched', 'price': 1, 'category': created.category.title,
+                          'specifications': [{'key': key, 'value': str(i)}]} for i in range(3)], batch_size=1)
+
+    assert report['imported'] == 3
+    after = get_versions(names)
+    assert [after[name] - before[name] for name in names] == [1, 1, 1]
+    # the single delta still carries every batch into the index
+    assert len(get_index().match([(key, ['0', '1', '2'])])) == 3
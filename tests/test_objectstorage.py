@@ -0,0 +1,185 @@
+import io
+import json
+import os
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from api import db
+from api.models import ObjectStorage
+from api.objectstorage import routes, storage
+from tests.conftest import unique
+
+
+def png(width=64, height=32):
+    """A PNG no other test uploads, so dedupe never kicks in by accident."""
+    image = Image.frombytes('RGB', (width, height), os.urandom(width * height * 3))
+    output = io.BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
+
+
+def upload(client, auth, payload, filename='image.png'):
+    return client.put('/s3/upload', headers=auth, content_type='multipart/form-data',
+                      data={'image': (io.BytesIO(payload), filename, 'image/png')})
+
+
+def eventually(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def spooled(monkeypatch):
+    """Paths of every file the uploads are spooled to."""
+    paths = []
+
+    def spool_upload(*args, **kwargs):
+        spooled = storage.spool_upload(*args, **kwargs)
+        paths.append(spooled.path)
+        return spooled
+
+    monkeypatch.setattr(routes, 'spool_upload', spool_upload)
+    return paths
+
+
+@pytest.fixture
+def no_derivatives(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'IMAGE_DERIVATIVE_WIDTHS', [])
+
+
+def test_upload_answers_before_the_store_does(app, client, auth, store, spooled, no_derivatives, monkeypatch):
+    released = threading.Event()
+    upload_file = store.upload_file
+
+    def slow_upload_file(*args, **kwargs):
+        assert released.wait(10)
+        upload_file(*args, **kwargs)
+
+    monkeypatch.setattr(store, 'upload_file', slow_upload_file)
+    payload = png()
+
+    response = upload(client, auth, payload)
+    assert response.status_code == 202, response.json
+    obj = db.session.get(ObjectStorage, response.json['id'])
+    assert store.keys() == []
+
+    released.set()
+    eventually(lambda: store.keys() == [obj.link])
+    with open(os.path.join(store.root, obj.link), 'rb') as blob:
+        assert blob.read() == payload
+    assert obj.size == len(payload)
+    eventually(lambda: not any(os.path.exists(path) for path in spooled))
+
+
+def test_a_failed_upload_forgets_the_object(app, client, auth, store, spooled, no_derivatives, monkeypatch):
+    def failing_upload_file(*args, **kwargs):
+        raise OSError('store unavailable')
+
+    monkeypatch.setattr(store, 'upload_file', failing_upload_file)
+
+    response = upload(client, auth, png())
+    assert response.status_code == 202, response.json
+    object_id = response.json['id']
+
+    def forgotten():
+        db.session.expire_all()
+        return db.session.get(ObjectStorage, object_id) is None
+
+    eventually(forgotten)
+    eventually(lambda: not any(os.path.exists(path) for path in spooled))
+
+
+def test_a_full_upload_queue_answers_503(app, client, auth, store, spooled):
+    storage._get_executor()
+    size = app.config['S3_UPLOAD_QUEUE_SIZE']
+    for _ in range(size):
+        storage._slots.acquire()
+    try:
+        response = upload(client, auth, png())
+    finally:
+        for _ in range(size):
+            storage._slots.release()
+
+    assert response.status_code == 503
+    assert db.session.scalar(ObjectStorage.select().where(ObjectStorage.id == response.json.get('id'))) is None
+    assert store.keys() == []
+    assert not any(os.path.exists(path) for path in spooled)
+
+
+def test_rejected_uploads_leave_no_spooled_files(client, auth, store, spooled):
+    response = upload(client, auth, png(), filename='image.gif')
+    assert response.json['code'] == 400
+    assert spooled and not any(os.path.exists(path) for path in spooled)
+
+
+def test_the_same_content_is_stored_once(client, auth, store, spooled, no_derivatives):
+    payload = png()
+
+    first = upload(client, auth, payload)
+    second = upload(client, auth, payload, filename='copy.png')
+
+    assert (first.status_code, second.status_code) == (202, 200)
+    assert first.json['id'] == second.json['id']
+    obj = db.session.get(ObjectStorage, first.json['id'])
+    assert db.session.scalars(ObjectStorage.select().where(ObjectStorage.digest == obj.digest)).all() == [obj]
+    eventually(lambda: store.keys() == [obj.link])
+    eventually(lambda: not any(os.path.exists(path) for path in spooled))
+
+
+def test_derivatives_are_rendered_from_the_spooled_upload(app, client, auth, store, spooled, monkeypatch):
+    monkeypatch.setitem(app.config, 'IMAGE_DERIVATIVE_WIDTHS', [16, 32])
+
+    response = upload(client, auth, png(64, 32))
+    assert response.status_code == 202, response.json
+    obj = db.session.get(ObjectStorage, response.json['id'])
+
+    def derivatives():
+        db.session.expire_all()
+        return sorted((derivative.width, derivative.format, derivative.link) for derivative in obj.derivatives)
+
+    stem = obj.link.rsplit('.', 1)[0]
+    expected = [(16, 'jpeg', f'{stem}_16w.jpg'), (16, 'webp', f'{stem}_16w.webp'),
+                (32, 'jpeg', f'{stem}_32w.jpg'), (32, 'webp', f'{stem}_32w.webp')]
+    eventually(lambda: derivatives() == expected, timeout=60)
+    assert store.keys() == sorted([obj.link] + [link for _, _, link in expected])
+    with Image.open(os.path.join(store.root, f'{stem}_16w.webp')) as image:
+        assert image.size == (16, 8)
+    # the spooled upload was the only copy of the original on disk, and it is gone
+    assert len(spooled) == 1
+    eventually(lambda: not os.path.exists(spooled[0]))
+
+
+def listed(client, auth, **query):
+    response = client.get('/s3/get_all', headers=auth, query_string=query)
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_the_bucket_listing_is_served_from_the_manifest(client, auth, store):
+    store.put_object(Bucket='bucket', Key='a.png', Body=b'a')
+
+    assert [item['Key'] for item in listed(client, auth)] == ['a.png']
+    assert listed(client, auth)[0]['Size'] == 1
+
+    # a fresh manifest is served as it is until it expires
+    store.put_object(Bucket='bucket', Key='b.png', Body=b'b')
+    assert [item['Key'] for item in listed(client, auth)] == ['a.png']
+
+
+def test_reconcile_reports_orphaned_and_missing_objects(client, auth, store):
+    stored, missing, orphan = (unique('reconcile') + '.png' for _ in range(3))
+    db.session.add_all([ObjectStorage(link=stored, digest=unique('digest')),
+                        ObjectStorage(link=missing, digest=unique('digest'))])
+    db.session.commit()
+    for key in (stored, orphan):
+        store.put_object(Bucket='bucket', Key=key, Body=b'blob')
+
+    report = {item['key']: item['status'] for item in listed(client, auth, reconcile='true')}
+
+    assert report[orphan] == 'orphan' and report[missing] == 'missing'
+    assert stored not in report
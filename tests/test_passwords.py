@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from api import db
+from api.auth import passwords
+from api.auth.passwords import hash_password, verify_password, needs_rehash, hash_method, HashingBusy
+from api.models import User
+from tests.conftest import unique
+
+
+def die_once(marker):
+    """Kill the worker the first time it runs, succeed afterwards."""
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
+        os._exit(1)
+    return 'ok'
+
+
+def make_user(password, method='pbkdf2:sha256:1000'):
+    user = User(email=unique('user') + '@example.com', email_confirmed=True,
+                password=generate_password_hash(password, method))
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def login(client, user, password):
+    return client.post('/auth/login', json={'email': user.email, 'password': password, 'remember': False})
+
+
+def test_needs_rehash_compares_method_and_salt_length(app):
+    assert not needs_rehash(hash_password('secret'))
+    assert needs_rehash(generate_password_hash('secret', 'pbkdf2:sha256:500'))
+    assert needs_rehash(generate_password_hash('secret', hash_method(), salt_length=8))
+    assert needs_rehash('plain-text')
+
+
+def test_login_rehashes_outdated_hashes(client):
+    user = make_user('secret', method='pbkdf2:sha256:500')
+
+    assert login(client, user, 'secret').status_code == 200
+    db.session.refresh(user)
+    assert user.password.startswith(hash_method() + '$')
+    assert login(client, user, 'secret').status_code == 200
+
+
+def test_a_full_queue_answers_503(app, client):
+    user = make_user('secret')
+    passwords._get_pool()
+    size = app.config['PASSWORD_HASH_QUEUE_SIZE']
+    for _ in range(size):
+        passwords._slots.acquire()
+    try:
+        response = login(client, user, 'secret')
+        with pytest.raises(HashingBusy):
+            hash_password('secret')
+    finally:
+        for _ in range(size):
+            passwords._slots.release()
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert login(client, user, 'secret').status_code == 200
+
+
+def test_a_dead_worker_is_replaced(app, tmp_path):
+    assert passwords._run(die_once, str(tmp_path / 'died')) == 'ok'
+
+    with pytest.raises(HashingBusy):
+        passwords._run(os._exit, 1)
+    assert verify_password(hash_password('secret'), 'secret')
+
+
+def test_update_password_uses_the_configured_hash(app):
+    user = make_user('old', method='pbkdf2:sha256:500')
+
+    assert not user.update_password('new', 'wrong')
+    assert user.update_password('new', 'old')
+    assert not needs_rehash(user.password) and user.check_password('new')
+
+
+def test_hashing_throughput_and_admission(app):
+    """Load check: a queue's worth of concurrent hashes all finish, the overflow is turned away at once."""
+    size = app.config['PASSWORD_HASH_QUEUE_SIZE']
+    results, rejected = [], []
+
+    def worker():
+        with app.app_context():
+            started = time.monotonic()
+            try:
+                results.append(hash_password('secret'))
+            except HashingBusy:
+                rejected.append(time.monotonic() - started)
+
+    threads = [threading.Thread(target=worker) for _ in range(size * 2)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    assert len(results) + len(rejected) == size * 2
+    assert len(results) >= size
+    assert all(waited < 1 for waited in rejected)
+    assert all(not needs_rehash(pwhash) for pwhash in results)
+    assert elapsed < app.config['PASSWORD_HASH_TIMEOUT']
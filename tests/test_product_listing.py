@@ -0,0 +1,87 @@
+import base64
+import json
+
+import pytest
+
+# One query per loader option at most, plus the cache checks in front of the views
+MAX_LISTING_QUERIES = 12
+
+
+def listing_queries(client, queries, url):
+    queries.clear()
+    response = client.get(url)
+    assert response.status_code == 200, response.json
+    return len(queries), response.json
+
+
+@pytest.mark.parametrize('endpoint', ['product/get_by_category', 'product/get_by_subcategory'])
+def test_listing_query_count_does_not_grow_with_page_size(client, queries, catalog, endpoint):
+    created = catalog(products=30, shops=3, children=True)
+    key = created.category.id if endpoint.endswith('category') else created.subcategory.id
+
+    small, small_page = listing_queries(client, queries, f'/{endpoint}?id={key}&limit=2')
+    large, large_page = listing_queries(client, queries, f'/{endpoint}?id={key}&limit=25')
+
+    assert len(small_page['items']) == 2
+    assert len(large_page['items']) == 25
+    assert small == large
+    assert large <= MAX_LISTING_QUERIES
+
+
+def test_listing_serializes_every_relationship(client, catalog):
+    created = catalog(products=4, shops=2, children=True)
+
+    items = client.get(f'/product/get_by_subcategory?id={created.subcategory.id}&limit=10').json['items']
+
+    assert len(items) == 4
+    for item in items:
+        assert item['image_link'].endswith(created.image.link)
+        assert len(item['available']) == 2
+        assert len(item['specifications']) == 1
+    assert sum(len(item['referenced_product']) for item in items) == 2
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def test_keyset_pages_cover_the_listing_once(client, catalog):
+    created = catalog(products=7, shops=1)
+    expected = sorted(product.id for product in created.products)
+
+    for order in ['latest', 'price_asc', 'price_desc']:
+        seen, cursor = [], None
+        while True:
+            url = f'/product/get_by_subcategory?id={created.subcategory.id}&limit=3&order={order}'
+            page = client.get(url + (f'&next={cursor}' if cursor else '')).json
+            seen += [item['id'] for item in page['items']]
+            if not (cursor := page['next']):
+                break
+        assert sorted(seen) == expected
+        assert len(seen) == len(expected)
+
+
+@pytest.mark.parametrize('order, cursor', [
+    ('price_asc', ['x', 1]),
+    ('price_asc', [1.5, '1']),
+    ('price_asc', [True, 1]),
+    ('latest', [1, 1]),
+    ('latest', ['not a date', 1]),
+    ('latest', [1]),
+])
+def test_tampered_cursor_is_a_json_400(client, catalog, order, cursor):
+    created = catalog(products=1, shops=1)
+
+    response = client.get(f'/product/get_by_subcategory?id={created.subcategory.id}'
+                          f'&order={order}&next={encode_cursor(cursor)}')
+
+    assert response.status_code == 400
+    assert response.json == {'messages': {'query': {'next': ['Invalid cursor']}}}
+
+
+def test_filters_ignore_pagination_arguments(client, catalog):
+    created = catalog(products=2, shops=1)
+
+    response = client.get(f'/filters/get_by_category?id={created.category.id}&order=unknown')
+
+    assert response.status_code == 200
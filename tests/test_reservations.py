@@ -0,0 +1,180 @@
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, func, event
+from sqlalchemy.exc import OperationalError
+
+from api import db
+from api.models import Order, OrderStatus, DeliveryType, PaymentType, ProductAvailability, ProductReserve
+from api.reservations.service import reserve, release, expire_reservations, commit_to_order, OutOfStock, \
+    ReservationError
+
+
+def make_order(user):
+    order = Order(user_fk=user.id, status=OrderStatus.forming, delivery_type=DeliveryType.pickup,
+                  payment_type=PaymentType.prepay, sum=0)
+    db.session.add(order)
+    db.session.commit()
+    return order.id
+
+
+def stock(shop_id, product_ids):
+    """{product id: (available, reserved or ordered)} of one shop."""
+    db.session.expire_all()
+    rows = db.session.execute(
+        select(ProductAvailability.product_id, ProductAvailability.amount,
+               select(func.coalesce(func.sum(ProductReserve.amount), 0))
+               .where(ProductReserve.pa_fk == ProductAvailability.id).scalar_subquery())
+        .where(ProductAvailability.shop_id == shop_id, ProductAvailability.product_id.in_(product_ids))
+    ).all()
+    return {product_id: (amount, taken) for product_id, amount, taken in rows}
+
+
+def test_reserve_release_and_expire_restore_stock(admin, catalog):
+    created = catalog(products=2, shops=1, stock=5)
+    shop_id, product_ids = created.shops[0].id, [product.id for product in created.products]
+
+    reserves = reserve(admin.id, shop_id, {product_ids[0]: 2, product_ids[1]: 5})
+    db.session.commit()
+    assert stock(shop_id, product_ids) == {product_ids[0]: (3, 2), product_ids[1]: (0, 5)}
+
+    with pytest.raises(OutOfStock):
+        reserve(admin.id, shop_id, {product_ids[1]: 1})
+    db.session.rollback()
+
+    assert release([reserves[0].id], user_id=admin.id) == 1
+    assert expire_reservations(datetime.utcnow() + timedelta(days=1)) >= 1
+    db.session.commit()
+    assert stock(shop_id, product_ids) == {product_ids[0]: (5, 0), product_ids[1]: (5, 0)}
+
+
+def test_release_skips_reservations_ordered_after_they_were_selected(app, admin, catalog):
+    created = catalog(products=1, shops=1, stock=5)
+    shop_id, product_id = created.shops[0].id, created.products[0].id
+    order_id = make_order(admin)
+    reserve_id = reserve(admin.id, shop_id, {product_id: 3})[0].id
+    db.session.commit()
+
+    def order_concurrently():
+        with app.app_context():
+            commit_to_order([reserve_id], order_id)
+            db.session.commit()
+
+    interleaved = []
+
+    def before_update(conn, cursor, statement, *args):
+        # Runs between _restore's SELECT and its UPDATE
+        if statement.startswith('UPDATE "ProductAvailability"') and not interleaved:
+            interleaved.append(statement)
+            thread = threading.Thread(target=order_concurrently)
+            thread.start()
+            thread.join()
+
+    engine = db.get_engine()
+    event.listen(engine, 'before_cursor_execute', before_update)
+    try:
+        released = release([reserve_id])
+        db.session.commit()
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_update)
+
+    assert interleaved
+    assert released == 0
+    assert stock(shop_id, [product_id]) == {product_id: (2, 3)}
+    assert db.session.get(ProductReserve, reserve_id).order_fk == order_id
+
+
+def test_concurrent_reservations_never_oversell(app, admin, catalog):
+    """Stress reserve, release, commit_to_order and expiry from several threads.
+
+    Stock must never go negative, and what is available plus what is reserved
+    or ordered must always add up to the initial stock.
+    """
+    initial = 20
+    created = catalog(products=4, shops=1, stock=initial)
+    shop_id, product_ids = created.shops[0].id, [product.id for product in created.products]
+    order_id, user_id = make_order(admin), admin.id
+    errors = []
+
+    def worker(seed):
+        rng = random.Random(seed)
+        mine = []
+        with app.app_context():
+            for _ in range(60):
+                operation = rng.choice(['reserve', 'reserve', 'release', 'order', 'expire'])
+                try:
+                    if operation == 'reserve':
+                        items = {product_id: rng.randint(1, 6) for product_id in rng.sample(product_ids, 2)}
+                        mine += [reservation.id for reservation in reserve(user_id, shop_id, items)]
+                    elif operation == 'release' and mine:
+                        release(rng.sample(mine, min(2, len(mine))))
+                    elif operation == 'order' and mine:
+                        commit_to_order([mine.pop()], order_id)
+                    elif operation == 'expire':
+                        expire_reservations(datetime.utcnow() + timedelta(days=1))
+                    db.session.commit()
+                except (ReservationError, OperationalError):
+                    # out of stock, already released or ordered, or a busy database
+                    db.session.rollback()
+                except Exception as e:  # pragma: no cover
+                    db.session.rollback()
+                    errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    for available, taken in stock(shop_id, product_ids).values():
+        assert available >= 0
+        assert available + taken == initial
+
+
+@pytest.mark.benchmark
+def test_reservation_throughput_on_contended_skus(app, admin, catalog, report):
+    """Many threads reserving the same few SKUs until they sell out; reports reservations per second."""
+    threads_count, initial = 8, 1000
+    created = catalog(products=3, shops=1, stock=initial)
+    shop_id, product_ids = created.shops[0].id, [product.id for product in created.products]
+    user_id = admin.id
+    reserved, rejected, errors = [], [], []
+
+    def worker(seed):
+        rng = random.Random(seed)
+        with app.app_context():
+            while True:
+                items = {product_id: 1 for product_id in rng.sample(product_ids, 2)}
+                try:
+                    reserve(user_id, shop_id, items)
+                    db.session.commit()
+                    reserved.append(len(items))
+                except OutOfStock:
+                    db.session.rollback()
+                    return
+                except OperationalError:
+                    db.session.rollback()
+                    rejected.append(1)
+                except Exception as e:  # pragma: no cover
+                    db.session.rollback()
+                    errors.append(e)
+                    return
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads_count)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    report('reservations', threads=threads_count, reservations=len(reserved), busy=len(rejected),
+           seconds=elapsed, per_second=len(reserved) / elapsed)
+    assert errors == []
+    levels = stock(shop_id, product_ids).values()
+    assert all(available >= 0 and available + taken == initial for available, taken in levels)
+    assert sum(taken for _, taken in levels) == sum(reserved)
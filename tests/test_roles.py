@@ -0,0 +1,53 @@
+import threading
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+
+from api import db
+from api.models import User, UserRole, Permission, UserRolePermission
+from api.utils import get_role_rights
+from tests.conftest import unique
+
+
+def exporter():
+    """A user whose role only grants admin.export.users."""
+    role = UserRole(roleName=unique('exporter'))
+    permission = db.session.scalar(Permission.select().where(Permission.key == 'admin.export.users')) \
+        or Permission(key='admin.export.users')
+    user = User(email=unique('exporter') + '@example.com', password='!', role=role, email_confirmed=True)
+    db.session.add_all([role, permission, user])
+    db.session.flush()
+    db.session.add(UserRolePermission(role_fk=role.id, permission_fk=permission.id))
+    db.session.commit()
+    return user, role.id, permission.id
+
+
+def test_a_revoked_permission_is_denied_even_if_reloaded_before_the_commit(app, client, auth):
+    user, role_id, permission_id = exporter()
+    headers = {'Authorization': 'Bearer ' + create_access_token(identity=user)}
+    assert client.get('/export/users', headers=headers).status_code == 200
+
+    reloaded = []
+
+    def reload_rights():
+        with app.app_context():
+            reloaded.append(get_role_rights(role_id).allows('admin.export.users'))
+
+    def after_invalidation(conn, cursor, statement, *args):
+        # another request of this worker reads the role between the invalidation and the commit
+        if statement.startswith('INSERT INTO "CacheVersion"') and not reloaded:
+            thread = threading.Thread(target=reload_rights)
+            thread.start()
+            thread.join()
+
+    engine = db.get_engine()
+    event.listen(engine, 'after_cursor_execute', after_invalidation)
+    try:
+        response = client.delete('/roles/delete_permission', headers=auth,
+                                 json={'roleId': role_id, 'permissionId': permission_id})
+    finally:
+        event.remove(engine, 'after_cursor_execute', after_invalidation)
+
+    assert response.status_code == 200, response.json
+    assert reloaded == [True]
+    assert client.get('/export/users', headers=headers).status_code == 403
@@ -0,0 +1,113 @@
+import random
+import time
+
+import pytest
+from sqlalchemy import text, select, or_
+
+from api import db
+from api.models import Product
+from api.product import fts
+from api.product.fts import reindex_all, search_product_ids
+
+
+def create_product(client, auth, created, title, description='plain'):
+    response = client.post('/product', headers=auth, json={
+        'title': title, 'description': description, 'price': 10, 'is_child': False,
+        'category_fk': created.category.id, 'image_fk': created.image.id,
+    })
+    assert response.status_code == 200, response.json
+    return response.json['id']
+
+
+def search(client, query):
+    response = client.get('/product/search', query_string={'q': query})
+    assert response.status_code == 200, response.json
+    return [item['id'] for item in response.json]
+
+
+def test_created_products_are_searchable_by_prefix(client, auth, catalog):
+    created = catalog(products=0, shops=1)
+    product_id = create_product(client, auth, created, 'Zanzibar glass hookah')
+
+    assert search(client, 'zanzibar') == [product_id]
+    assert search(client, 'zanz') == [product_id]
+    assert search(client, 'zanzibar glass') == [product_id]
+    assert search(client, 'zanzibar copper') == []
+
+
+def test_title_matches_rank_above_description_matches(client, auth, catalog):
+    created = catalog(products=0, shops=1)
+    in_description = create_product(client, auth, created, 'Bowl', description='fits the quokkaline stem')
+    in_title = create_product(client, auth, created, 'Quokkaline stem')
+
+    assert search(client, 'quokkaline') == [in_title, in_description]
+
+
+def test_specifications_are_indexed_on_add_and_edit(client, auth, catalog):
+    created = catalog(products=0, shops=1)
+    product_id = create_product(client, auth, created, 'Mouthpiece')
+
+    response = client.post('/product/specification', headers=auth, json=[
+        {'product_id': product_id, 'key': 'material', 'value': 'wombatite', 'type': 'str'}])
+    assert search(client, 'wombatite') == [product_id]
+
+    specification_id = response.json[0]['id']
+    response = client.patch('/product/specification', headers=auth, json=[
+        {'id': specification_id, 'key': 'material', 'value': 'platypite'}])
+    assert response.status_code == 200, response.json
+    assert search(client, 'wombatite') == []
+    assert search(client, 'platypite') == [product_id]
+
+
+def test_query_syntax_is_not_interpreted(client):
+    assert search(client, '"') == []
+    assert search(client, 'NEAR( OR *') == []
+
+
+def test_description_has_no_btree_index():
+    assert not Product.__table__.c.description.index
+
+
+def test_reindex_creates_the_search_table_on_existing_databases(app, client, auth, catalog, monkeypatch):
+    created = catalog(products=0, shops=1)
+    product_id = create_product(client, auth, created, 'Echidnite base')
+    db.session.execute(text('DROP TABLE "ProductSearch"'))
+    db.session.commit()
+    monkeypatch.setattr(fts, '_search_table_ready', False)
+
+    result = app.test_cli_runner().invoke(args=['catalog', 'reindex'])
+
+    assert result.exit_code == 0, result.output
+    assert search(client, 'echidnite') == [product_id]
+
+
+WORDS = ['glass', 'steel', 'clay', 'bowl', 'hose', 'mint', 'grape', 'lemon', 'black', 'silver', 'mini', 'pro']
+
+
+@pytest.mark.benchmark
+def test_full_text_search_against_like_on_100k_products(bulk_catalog, report):
+    rng = random.Random(0)
+    category = bulk_catalog(100_000, lambda i: {
+        'title': ' '.join(rng.choice(WORDS) for _ in range(3)) + (' kangarooite' if i % 10_000 == 0 else ''),
+        'description': ' '.join(rng.choice(WORDS) for _ in range(12)),
+    })
+    started = time.perf_counter()
+    indexed = reindex_all()
+    report('reindex', products=indexed, seconds=time.perf_counter() - started)
+
+    def timed(run, repeat=20):
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = run()
+            best = min(best, time.perf_counter() - started)
+        return result, best * 1000
+
+    like = select(Product.id).where(Product.category_fk == category.id, or_(
+        Product.title.ilike('%kangarooite%'), Product.description.ilike('%kangarooite%'))).limit(20)
+    fts_ids, fts_ms = timed(lambda: search_product_ids('kangarooite', 20))
+    like_ids, like_ms = timed(lambda: db.session.scalars(like).all())
+    report('search 100k products', fts_ms=fts_ms, like_ms=like_ms, speedup=like_ms / fts_ms)
+
+    assert sorted(fts_ids) == sorted(like_ids) and len(fts_ids) == 10
+    assert fts_ms < like_ms
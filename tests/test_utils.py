@@ -0,0 +1,25 @@
+from sqlalchemy import select
+
+from api import db
+from api.models import Basket
+from api.utils import upsert, _upsert_generic
+
+
+def test_generic_upsert_matches_on_conflict(admin, catalog):
+    created = catalog(products=3, shops=1)
+    first, second, third = (product.id for product in created.products)
+
+    def basket():
+        return db.session.execute(
+            select(Basket.product_fk, Basket.amount).where(Basket.user_fk == admin.id).order_by(Basket.product_fk)
+        ).all()
+
+    for write in (upsert, _upsert_generic):
+        db.session.execute(Basket.__table__.delete().where(Basket.user_fk == admin.id))
+        write(Basket, [dict(user_fk=admin.id, product_fk=first, amount=1),
+                       dict(user_fk=admin.id, product_fk=second, amount=2)], ['user_fk', 'product_fk'], ['amount'])
+        write(Basket, [dict(user_fk=admin.id, product_fk=first, amount=5),
+                       dict(user_fk=admin.id, product_fk=third, amount=3)], ['user_fk', 'product_fk'], ['amount'])
+        db.session.commit()
+
+        assert basket() == [(first, 5), (second, 2), (third, 3)]